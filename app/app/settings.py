@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.DuplicateQueryLoggingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -158,6 +159,49 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Per-process cache of collar api keys used by device authentication.
+# Changes are evicted only in the process that made them, so other
+# workers accept a replaced key or an inactive owner for up to the TTL.
+DEVICE_KEY_CACHE_SIZE = int(os.environ.get('DEVICE_KEY_CACHE_SIZE', 1024))
+DEVICE_KEY_CACHE_TTL = int(os.environ.get('DEVICE_KEY_CACHE_TTL', 30))
+
+# 'direct' writes readings on request, 'spool' queues them for flush_spool
+DATAPOINT_INGEST_MODE = os.environ.get('DATAPOINT_INGEST_MODE', 'direct')
+# Not under /vol/web, which the proxy serves as static files
+DATAPOINT_SPOOL_DIR = os.environ.get('DATAPOINT_SPOOL_DIR', '/vol/spool')
+
+# Fleet status of a horse's latest reading
+HORSE_NORMAL_RANGES = {
+    'temp': (37.5, 38.5),
+    'hr': (28, 44),
+}
+HORSE_LOW_BATTERY = 20
+
+# Alert rules every new user starts with
+HORSE_DEFAULT_ALERT_RULES = [
+    {'field': 'temp', 'low': '36.5', 'high': '39.5', 'hysteresis': '0.2', 'min_duration': 300},
+    {'field': 'hr', 'low': '20', 'high': '40', 'hysteresis': '2', 'min_duration': 300},
+]
+HORSE_OFFLINE_AFTER = int(os.environ.get('HORSE_OFFLINE_AFTER', 3600))
+
+# Horses whose compiled geofences each process keeps
+GEOFENCE_CACHE_SIZE = int(os.environ.get('GEOFENCE_CACHE_SIZE', 1024))
+
+# Live data point streams: broker class, per stream queue length and
+# seconds between keepalive comments. Use horse.broker.PostgresBroker when
+# readings are written by other processes than the ones serving streams.
+HORSE_STREAM_BROKER = os.environ.get('HORSE_STREAM_BROKER', 'horse.broker.InProcessBroker')
+HORSE_STREAM_QUEUE_SIZE = int(os.environ.get('HORSE_STREAM_QUEUE_SIZE', 1000))
+HORSE_STREAM_KEEPALIVE = int(os.environ.get('HORSE_STREAM_KEEPALIVE', 15))
+
+# Per action query budgets of API views, turned on by the test runner
+QUERY_BUDGETS_ENFORCED = bool(int(os.environ.get('QUERY_BUDGETS_ENFORCED', 0)))
+TEST_RUNNER = 'app.test_runner.QueryBudgetTestRunner'
+
+# Log queries a request repeats at least DUPLICATE_QUERY_THRESHOLD times
+LOG_DUPLICATE_QUERIES = bool(int(os.environ.get('LOG_DUPLICATE_QUERIES', 0)))
+DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('DUPLICATE_QUERY_THRESHOLD', 2))
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
\ No newline at end of file
@@ -44,6 +44,47 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class HorseAdmin(admin.ModelAdmin):
+    """Define the admin pages for horses."""
+    list_display = ['name', 'api_key', 'user']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+
+class DataPointAdmin(admin.ModelAdmin):
+    """Define the admin pages for data points."""
+    ordering = ['-id']
+    list_display = ['__str__', 'user']
+    # __str__ reads the horse, so join it instead of a query per row
+    list_select_related = ['horse', 'user']
+    raw_id_fields = ['horse', 'user']
+
+
+class GeofenceAdmin(admin.ModelAdmin):
+    """Define the admin pages for geofences."""
+    list_display = ['name', 'horse', 'inside', 'state_at']
+    list_select_related = ['horse']
+    raw_id_fields = ['horse']
+
+
+class AlertRuleAdmin(admin.ModelAdmin):
+    """Define the admin pages for alert rules."""
+    list_display = ['__str__', 'horse', 'low', 'high', 'enabled']
+    list_select_related = ['horse']
+    raw_id_fields = ['user', 'horse']
+
+
+class AlertAdmin(admin.ModelAdmin):
+    """Define the admin pages for alerts."""
+    ordering = ['-date_created']
+    list_display = ['__str__', 'rule', 'date_closed', 'peak']
+    list_select_related = ['rule']
+    raw_id_fields = ['rule', 'horse']
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Horse)
-admin.site.register(models.DataPoint)
\ No newline at end of file
+admin.site.register(models.Horse, HorseAdmin)
+admin.site.register(models.DataPoint, DataPointAdmin)
+admin.site.register(models.Geofence, GeofenceAdmin)
+admin.site.register(models.AlertRule, AlertRuleAdmin)
+admin.site.register(models.Alert, AlertAdmin)
@@ -0,0 +1,68 @@
+"""
+Seeding and cleanup shared by the benchmark commands.
+
+Benchmark rows belong to a user of their own, so they can be reused by
+later runs and deleted without touching real data.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from core.models import Horse, DataPoint
+
+
+SEED_START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def seed(email, rows, horse_count, step=timedelta(minutes=5), stdout=None):
+    """
+    Return the benchmark user of email and its horses, with rows readings.
+
+    Readings are spread over the horses in turn, step apart per horse, and
+    inserted in time order as live ingest does. Rows seeded by an earlier
+    run are kept and only the missing ones added.
+    """
+    user = get_user_model().objects.filter(email=email).first()
+    if user is None:
+        user = get_user_model().objects.create_user(email=email)
+    horses = list(user.horse_set.order_by('id')) or [
+        Horse.objects.create(user=user, name=f'Benchmark Horse {i}')
+        for i in range(horse_count)
+    ]
+    existing = DataPoint.objects.filter(user=user).count()
+    if existing >= rows:
+        if stdout is not None:
+            stdout.write('Reusing seeded benchmark data.')
+        return user, horses
+
+    if stdout is not None:
+        stdout.write(f'Seeding {rows - existing} data points...')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {DataPoint._meta.db_table} '
+            '(horse_id, user_id, date_created, gps_lat, gps_long, '
+            'temp, hr, hr_interval, batt) '
+            'SELECT (%s::bigint[])[1 + g %% %s], %s, %s + g / %s * %s, '
+            '51 + random() / 100, -114 + random() / 100, '
+            '36 + random() * 4, 20 + random() * 25, '
+            '1300 + random() * 1700, random() * 100 '
+            'FROM generate_series(%s, %s - 1) g ORDER BY g',
+            [
+                [h.id for h in horses], len(horses), user.id,
+                SEED_START, len(horses), step, existing, rows,
+            ],
+        )
+        cursor.execute(f'ANALYZE {DataPoint._meta.db_table}')
+
+    return user, horses
+
+
+def clean_up(user):
+    """Delete a benchmark user with its seeded rows."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {DataPoint._meta.db_table} WHERE user_id = %s',
+            [user.id],
+        )
+    user.delete()
@@ -0,0 +1,134 @@
+"""
+Django command to benchmark data point queries with and without indexes.
+
+Do not run against production: it seeds millions of rows and drops
+indexes inside a rolled back transaction, which holds an ACCESS
+EXCLUSIVE lock on the data point table until the "before" timings are
+done. It refuses to run without --i-know-this-locks.
+"""
+import re
+import itertools
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.management import benchmarks
+from core.models import DataPoint
+from horse.filters import DataPointFilter
+
+
+BENCHMARK_EMAIL = 'index-benchmark@example.com'
+BENCHMARKED_INDEXES = [
+    'datapoint_user_date_idx',
+    'datapoint_user_id_idx',
+    'datapoint_date_brin',
+]
+
+
+def format_ms(elapsed):
+    """Right align a timing, which is None when EXPLAIN gave none."""
+    return f'{"n/a":>12}' if elapsed is None else f'{elapsed:>12.2f}'
+
+
+class Rollback(Exception):
+    """Raised to roll back the transaction the indexes were dropped in."""
+
+
+class Command(BaseCommand):
+    """Django command to EXPLAIN ANALYZE DataPointFilter queries."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=2000000,
+            help='Number of data points to seed.',
+        )
+        parser.add_argument(
+            '--horses',
+            type=int,
+            default=20,
+            help='Number of horses the rows are spread over.',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the seeded rows for another run.',
+        )
+        parser.add_argument(
+            '--i-know-this-locks',
+            action='store_true',
+            dest='locks',
+            help='Confirm the data point table may be locked against all '
+                 'reads and writes while the benchmark runs.',
+        )
+
+    def cases(self, user, horse):
+        """Yield (name, queryset) for every DataPointFilter combination."""
+        end = DataPoint.objects.filter(horse=horse).latest(
+            'date_created',
+        ).date_created
+        filters = {
+            'horse': {'horse__api_key': horse.api_key},
+            'week': {
+                'date_created__gte': (end - timedelta(days=7)).isoformat(),
+                'date_created__lt': end.isoformat(),
+            },
+            'after': {
+                'date_created__gt': (end - timedelta(days=1)).isoformat(),
+            },
+        }
+        base = DataPoint.objects.filter(user=user).order_by('-id')
+        for size in range(len(filters) + 1):
+            for names in itertools.combinations(filters, size):
+                data = {}
+                for name in names:
+                    data.update(filters[name])
+                queryset = DataPointFilter(data, queryset=base).qs
+                label = '+'.join(names) or 'all'
+                yield f'{label} list', queryset
+                page = queryset.order_by('-date_created', '-id')[:100]
+                yield f'{label} page', page
+
+    def timings(self, user, horse):
+        results = {}
+        for name, queryset in self.cases(user, horse):
+            plan = queryset.explain(analyze=True)
+            match = re.search(r'Execution Time: ([\d.]+) ms', plan)
+            results[name] = float(match.group(1)) if match else None
+        return results
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if not options['locks']:
+            raise CommandError(
+                'Dropping the indexes locks the data point table against all '
+                'reads and writes. Pass --i-know-this-locks to run anyway.'
+            )
+        user, horses = benchmarks.seed(
+            BENCHMARK_EMAIL, options['rows'], options['horses'],
+            stdout=self.stdout,
+        )
+        horse = horses[0]
+
+        before = {}
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in BENCHMARKED_INDEXES:
+                        cursor.execute(f'DROP INDEX IF EXISTS {index}')
+                before = self.timings(user, horse)
+                raise Rollback
+        except Rollback:
+            pass
+        after = self.timings(user, horse)
+
+        self.stdout.write(f'{"query":<24}{"before ms":>12}{"after ms":>12}')
+        for name, elapsed in after.items():
+            self.stdout.write(
+                f'{name:<24}{format_ms(before.get(name))}{format_ms(elapsed)}'
+            )
+
+        if not options['keep']:
+            benchmarks.clean_up(user)
@@ -0,0 +1,83 @@
+"""
+Django command to benchmark data point list serialization.
+
+Do not run against production: it seeds up to a million rows.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.management import benchmarks
+from core.models import DataPoint
+from horse.exports import EXPORT_FIELDS
+from horse.serializers import DataPointSerializer, DataPointValuesSerializer
+
+
+BENCHMARK_EMAIL = 'serializer-benchmark@example.com'
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+class Command(BaseCommand):
+    """Django command to compare model and values() list serialization."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            action='append',
+            dest='sizes',
+            help='Number of rows to serialize; may be repeated. '
+                 'Defaults to 10k, 100k and 1M.',
+        )
+        parser.add_argument(
+            '--horses',
+            type=int,
+            default=10,
+            help='Number of horses the rows are spread over.',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the seeded rows for another run.',
+        )
+
+    def time_model(self, queryset, size):
+        start = time.perf_counter()
+        rows = queryset.select_related('horse')[:size]
+        data = DataPointSerializer(rows, many=True).data
+        content = JSONRenderer().render(data)
+        return time.perf_counter() - start, content
+
+    def time_values(self, queryset, size):
+        start = time.perf_counter()
+        rows = queryset.values(*[lookup for _, lookup in EXPORT_FIELDS])[:size]
+        data = DataPointValuesSerializer(rows, many=True).data
+        content = JSONRenderer().render(data)
+        return time.perf_counter() - start, content
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        sizes = sorted(options['sizes'] or DEFAULT_SIZES)
+        user, _ = benchmarks.seed(
+            BENCHMARK_EMAIL, sizes[-1], options['horses'], stdout=self.stdout,
+        )
+        queryset = DataPoint.objects.filter(user=user).order_by('-id')
+
+        self.stdout.write(
+            f'{"rows":>10}{"model rows/s":>16}'
+            f'{"values rows/s":>16}{"speedup":>10}'
+        )
+        for size in sizes:
+            model_elapsed, model_content = self.time_model(queryset, size)
+            values_elapsed, values_content = self.time_values(queryset, size)
+            if model_content != values_content:
+                self.stderr.write(f'Output differs at {size} rows.')
+            self.stdout.write(
+                f'{size:>10}{size / model_elapsed:>16.0f}'
+                f'{size / values_elapsed:>16.0f}'
+                f'{model_elapsed / values_elapsed:>9.1f}x'
+            )
+
+        if not options['keep']:
+            benchmarks.clean_up(user)
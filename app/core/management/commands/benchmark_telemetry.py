@@ -0,0 +1,94 @@
+"""
+Django command to compare JSON and binary telemetry ingest decoding.
+"""
+import io
+import json
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rest_framework.parsers import JSONParser
+
+from horse import telemetry
+from horse.serializers import DataPointSerializer
+
+
+class Command(BaseCommand):
+    """Django command to benchmark telemetry payload formats."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--records',
+            type=int,
+            default=5000,
+            help='Number of readings per payload.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of timed runs per format.',
+        )
+
+    def sample_readings(self, count):
+        start = timezone.now() - timedelta(minutes=5 * count)
+        return [
+            {
+                'date_created': start + timedelta(minutes=5 * i),
+                'gps_lat': round(random.uniform(49, 54), 6),
+                'gps_long': round(random.uniform(-120, -110), 6),
+                'temp': round(random.uniform(36, 40), 2),
+                'hr': round(random.uniform(20, 45), 2),
+                'hr_interval': round(random.uniform(1300, 3000), 2),
+                'batt': round(random.uniform(10, 100), 2),
+            }
+            for i in range(count)
+        ]
+
+    def time_runs(self, func):
+        best = None
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        count = options['records']
+        self.repeat = options['repeat']
+        api_key = 'benchmark000'
+        readings = self.sample_readings(count)
+
+        json_payload = json.dumps([
+            {
+                'api_key': api_key,
+                **reading,
+                'date_created': reading['date_created'].isoformat(),
+            }
+            for reading in readings
+        ]).encode()
+        binary_payload = telemetry.encode(api_key, readings)
+
+        def decode_json():
+            items = JSONParser().parse(io.BytesIO(json_payload))
+            child = DataPointSerializer()
+            for item in items:
+                child.run_validation(item)
+
+        def decode_binary():
+            telemetry.validate(telemetry.decode(binary_payload))
+
+        for name, payload, func in (
+            ('json', json_payload, decode_json),
+            ('binary', binary_payload, decode_binary),
+        ):
+            elapsed = self.time_runs(func)
+            self.stdout.write(
+                f'{name:>6}: {len(payload) / count:8.1f} bytes/reading '
+                f'{count / elapsed:12.0f} readings/s'
+            )
@@ -0,0 +1,54 @@
+"""
+Django command to remove duplicate data points before adding the unique
+(horse, date_created) constraint.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.models import DataPoint
+
+
+HELPER_INDEX = 'datapoint_dedupe_tmp'
+
+
+class Command(BaseCommand):
+    """Django command to delete duplicate data points in chunks."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50000,
+            help='Number of ids scanned per delete statement.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        table = DataPoint._meta.db_table
+        chunk_size = options['chunk_size']
+        deleted = 0
+        with connection.cursor() as cursor:
+            # Each statement commits on its own, so the table stays writable
+            self.stdout.write('Building helper index...')
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {HELPER_INDEX} '
+                f'ON {table} (horse_id, date_created, id)'
+            )
+            cursor.execute(f'SELECT min(id), max(id) FROM {table}')
+            start, last = cursor.fetchone()
+            while start is not None and start <= last:
+                end = start + chunk_size - 1
+                # Keep the first reading received for each horse and time
+                cursor.execute(
+                    f'DELETE FROM {table} d WHERE d.id BETWEEN %s AND %s '
+                    f'AND EXISTS (SELECT 1 FROM {table} k '
+                    f'WHERE k.horse_id = d.horse_id '
+                    f'AND k.date_created = d.date_created AND k.id < d.id)',
+                    [start, end],
+                )
+                deleted += cursor.rowcount
+                start = end + 1
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {HELPER_INDEX}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} duplicate data points.'
+        ))
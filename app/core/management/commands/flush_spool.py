@@ -0,0 +1,49 @@
+"""
+Django command to flush the data point ingest spool into the database.
+"""
+import time
+
+from psycopg2 import OperationalError as Psycopg2OpError
+
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand
+
+from horse import spool
+
+
+class Command(BaseCommand):
+    """Django command to flush spooled data points."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of spooled readings written per transaction.',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep flushing until interrupted.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between flushes with --loop.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        while True:
+            try:
+                flushed = spool.flush(batch_size=options['batch_size'])
+                if flushed or not options['loop']:
+                    self.stdout.write(f'Flushed {flushed} data points.')
+            except (Psycopg2OpError, OperationalError):
+                if not options['loop']:
+                    raise
+                self.stdout.write('Database unavailable, retrying...')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
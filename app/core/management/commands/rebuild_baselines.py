@@ -0,0 +1,44 @@
+"""
+Django command to recompute horse baselines and anomaly flags from data points.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import Horse
+from horse import baselines, ingest
+
+
+class Command(BaseCommand):
+    """Django command to rebuild baselines, one horse per transaction."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horse',
+            action='append',
+            dest='api_keys',
+            help=(
+                'API key of a horse to rebuild; may be repeated. '
+                'Defaults to all horses.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        horses = Horse.objects.order_by('id')
+        if options['api_keys']:
+            horses = horses.filter(api_key__in=options['api_keys'])
+            if len(horses) != len(set(options['api_keys'])):
+                raise CommandError('Unknown horse API key.')
+
+        for horse in horses:
+            try:
+                with transaction.atomic():
+                    # Ingest for the horse waits until its history is rescored
+                    with connection.cursor() as cursor:
+                        ingest.lock_horses(cursor, [horse.id])
+                    baselines.rebuild(horse)
+            except ingest.UnknownHorses:
+                self.stdout.write(f'Skipped {horse.api_key}, deleted.')
+                continue
+            self.stdout.write(f'Rebuilt {horse.api_key}.')
+        self.stdout.write(self.style.SUCCESS('Baselines rebuilt.'))
@@ -0,0 +1,105 @@
+"""
+Django command to recompute hourly and daily rollups from data points.
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from core.models import Horse, DataPoint, RollupRebuild
+from horse import rollups
+
+
+class Command(BaseCommand):
+    """Django command to rebuild rollups over a range of days in chunks."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=date.fromisoformat,
+            help=(
+                'First local day to rebuild (YYYY-MM-DD). '
+                'Defaults to the first reading.'
+            ),
+        )
+        parser.add_argument(
+            '--end',
+            type=date.fromisoformat,
+            help=(
+                'Last local day to rebuild (YYYY-MM-DD). '
+                'Defaults to the latest reading.'
+            ),
+        )
+        parser.add_argument(
+            '--horse',
+            action='append',
+            dest='api_keys',
+            help=(
+                'API key of a horse to rebuild; may be repeated. '
+                'Defaults to all horses.'
+            ),
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=7,
+            help='Number of days rebuilt per transaction.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help=(
+                'Only rebuild until a rebuild of all horses and days has '
+                'completed, as on the first deploy with rollups.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['once'] and RollupRebuild.objects.exists():
+            self.stdout.write('Rollups already rebuilt.')
+            return
+        # Only a rebuild of everything is recorded for --once
+        complete = not (
+            options['api_keys'] or options['start'] or options['end']
+        )
+        horse_ids = None
+        datapoints = DataPoint.objects.all()
+        if options['api_keys']:
+            horse_ids = list(
+                Horse.objects.filter(
+                    api_key__in=options['api_keys'],
+                ).values_list('id', flat=True)
+            )
+            if len(horse_ids) != len(set(options['api_keys'])):
+                raise CommandError('Unknown horse API key.')
+            datapoints = datapoints.filter(horse_id__in=horse_ids)
+
+        start, end = options['start'], options['end']
+        if start is None or end is None:
+            bounds = datapoints.aggregate(
+                first=Min('date_created'), last=Max('date_created'),
+            )
+            if bounds['first'] is None:
+                if complete:
+                    RollupRebuild.objects.create()
+                self.stdout.write('No data points to roll up.')
+                return
+            start = start or timezone.localtime(bounds['first']).date()
+            end = end or timezone.localtime(bounds['last']).date()
+
+        day = start
+        while day <= end:
+            chunk_end = min(
+                day + timedelta(days=options['chunk_days'] - 1), end,
+            )
+            with transaction.atomic():
+                rollups.rebuild(day, chunk_end, horse_ids)
+                if complete and chunk_end == end:
+                    # A run that stops before its last chunk stays unrecorded
+                    RollupRebuild.objects.create()
+            self.stdout.write(f'Rebuilt {day} to {chunk_end}.')
+            day = chunk_end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS('Rollups rebuilt.'))
@@ -0,0 +1,41 @@
+"""
+Middleware for the project.
+"""
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from core.query_budget import QueryRecorder
+
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateQueryLoggingMiddleware:
+    """
+    Log queries a request runs repeatedly with the same SQL shape.
+
+    Repeated fingerprints are the signature of N+1 queries. Enabled with
+    LOG_DUPLICATE_QUERIES; statements are recorded with an execute wrapper,
+    so it works with DEBUG off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.LOG_DUPLICATE_QUERIES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        duplicates = recorder.duplicates(settings.DUPLICATE_QUERY_THRESHOLD)
+        for sql, count in duplicates:
+            logger.warning(
+                '%s %s ran a query %d times: %s',
+                request.method, request.path, count, sql,
+            )
+
+        return response
@@ -0,0 +1,74 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:52
+
+from django.db import IntegrityError, migrations, models
+
+
+INDEX = 'unique_datapoint_horse_date'
+DUPLICATES = (
+    'Duplicate (horse, date_created) data points remain. Run '
+    '"manage.py dedupe_datapoints" and migrate again.'
+)
+
+
+def drop_invalid_index(cursor):
+    """Drop the index left INVALID by a build that failed."""
+    cursor.execute(
+        'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE c.relname = %s AND NOT i.indisvalid',
+        [INDEX],
+    )
+    if cursor.fetchone():
+        cursor.execute(f'DROP INDEX CONCURRENTLY {INDEX}')
+
+
+def add_unique_index(apps, schema_editor):
+    """
+    Build the unique index without locking writes on a live table.
+
+    Each statement commits on its own. Duplicates are never deleted here:
+    the migration stops with DUPLICATES while any remain, including ones
+    written while the index builds.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM core_datapoint GROUP BY horse_id, date_created '
+            'HAVING count(*) > 1 LIMIT 1'
+        )
+        if cursor.fetchone():
+            raise IntegrityError(DUPLICATES)
+        drop_invalid_index(cursor)
+        try:
+            cursor.execute(
+                f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {INDEX} '
+                f'ON core_datapoint (horse_id, date_created)'
+            )
+        except IntegrityError:
+            drop_invalid_index(cursor)
+            raise IntegrityError(DUPLICATES)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0007_spoolcheckpoint'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_unique_index, migrations.RunPython.noop),
+                migrations.RunSQL(
+                    sql=f'ALTER TABLE core_datapoint ADD CONSTRAINT {INDEX} '
+                        f'UNIQUE USING INDEX {INDEX}',
+                    reverse_sql=f'ALTER TABLE core_datapoint DROP CONSTRAINT {INDEX}',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='datapoint',
+                    constraint=models.UniqueConstraint(fields=('horse', 'date_created'), name='unique_datapoint_horse_date'),
+                ),
+            ],
+        ),
+    ]
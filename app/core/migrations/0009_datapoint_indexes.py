@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:26
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0008_datapoint_unique_horse_date'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='datapoint',
+            index=models.Index(fields=['user', 'date_created', 'id'], name='datapoint_user_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='datapoint',
+            index=models.Index(fields=['user', 'id'], name='datapoint_user_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='datapoint',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['date_created'], name='datapoint_date_brin'),
+        ),
+    ]
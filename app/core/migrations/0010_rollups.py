@@ -0,0 +1,70 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_datapoint_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('temp_count', models.IntegerField(default=0)),
+                ('temp_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('temp_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('temp_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('hr_count', models.IntegerField(default=0)),
+                ('hr_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('hr_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('hr_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('hr_interval_count', models.IntegerField(default=0)),
+                ('hr_interval_sum', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('hr_interval_min', models.DecimalField(decimal_places=2, max_digits=7, null=True)),
+                ('hr_interval_max', models.DecimalField(decimal_places=2, max_digits=7, null=True)),
+                ('batt_count', models.IntegerField(default=0)),
+                ('batt_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('batt_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('batt_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('hour', models.DateTimeField()),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('temp_count', models.IntegerField(default=0)),
+                ('temp_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('temp_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('temp_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('hr_count', models.IntegerField(default=0)),
+                ('hr_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('hr_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('hr_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('hr_interval_count', models.IntegerField(default=0)),
+                ('hr_interval_sum', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('hr_interval_min', models.DecimalField(decimal_places=2, max_digits=7, null=True)),
+                ('hr_interval_max', models.DecimalField(decimal_places=2, max_digits=7, null=True)),
+                ('batt_count', models.IntegerField(default=0)),
+                ('batt_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('batt_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('batt_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('day', models.DateField()),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='hourlyrollup',
+            constraint=models.UniqueConstraint(fields=('horse', 'hour'), name='unique_hourlyrollup_horse_hour'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrollup',
+            constraint=models.UniqueConstraint(fields=('horse', 'day'), name='unique_dailyrollup_horse_day'),
+        ),
+    ]
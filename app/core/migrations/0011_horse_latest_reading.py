@@ -0,0 +1,58 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='horse',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='horse',
+            name='latest_batt',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='horse',
+            name='latest_gps_lat',
+            field=models.DecimalField(decimal_places=6, editable=False, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='horse',
+            name='latest_gps_long',
+            field=models.DecimalField(decimal_places=6, editable=False, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='horse',
+            name='latest_hr',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='horse',
+            name='latest_hr_interval',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=7, null=True),
+        ),
+        migrations.AddField(
+            model_name='horse',
+            name='latest_temp',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=5, null=True),
+        ),
+        migrations.RunSQL(
+            'UPDATE core_horse h SET last_seen = dp.date_created, '
+            'latest_gps_lat = dp.gps_lat, latest_gps_long = dp.gps_long, '
+            'latest_temp = dp.temp, latest_hr = dp.hr, '
+            'latest_hr_interval = dp.hr_interval, latest_batt = dp.batt '
+            'FROM (SELECT DISTINCT ON (horse_id) * FROM core_datapoint '
+            'ORDER BY horse_id, date_created DESC) dp '
+            'WHERE h.id = dp.horse_id',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_horse_latest_reading'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='horse',
+            name='data_modified',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='horse',
+            name='data_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='horse_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='horses_modified',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_conditional_get_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='datapoint',
+            name='horse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse'),
+        ),
+        migrations.AlterField(
+            model_name='datapoint',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
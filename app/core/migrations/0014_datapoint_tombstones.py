@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_datapoint_no_default_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataPointTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datapoint_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='datapointtombstone',
+            name='horse',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse'),
+        ),
+        migrations.AddIndex(
+            model_name='datapointtombstone',
+            index=models.Index(fields=['horse', 'id'], name='tombstone_horse_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_datapoint_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datapoint',
+            name='geocell',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+    ]
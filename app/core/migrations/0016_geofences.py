@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_datapoint_geocell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Geofence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('vertices', models.JSONField()),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('inside', models.BooleanField(editable=False, null=True)),
+                ('state_at', models.DateTimeField(editable=False, null=True)),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GeofenceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datapoint_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('enter', 'Enter'), ('exit', 'Exit')], max_length=5)),
+                ('date_created', models.DateTimeField()),
+                ('fence', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.geofence')),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='geofenceevent',
+            index=models.Index(fields=['horse', 'date_created'], name='fenceevent_horse_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='geofenceevent',
+            index=models.Index(fields=['fence', 'date_created'], name='fenceevent_fence_date_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_geofences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('fixes', models.IntegerField(default=0)),
+                ('distance', models.FloatField(default=0)),
+                ('moving_seconds', models.FloatField(default=0)),
+                ('resting_seconds', models.FloatField(default=0)),
+                ('rest_periods', models.IntegerField(default=0)),
+                ('longest_rest', models.FloatField(default=0)),
+                ('max_speed', models.FloatField(default=0)),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailymovement',
+            constraint=models.UniqueConstraint(fields=('horse', 'day'), name='unique_dailymovement_horse_day'),
+        ),
+    ]
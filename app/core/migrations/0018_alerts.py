@@ -0,0 +1,90 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The ranges the dashboard has always called good, at the time of writing
+DEFAULT_RULES = [
+    {'field': 'temp', 'low': '36.5', 'high': '39.5', 'hysteresis': '0.2', 'min_duration': 300},
+    {'field': 'hr', 'low': '20', 'high': '40', 'hysteresis': '2', 'min_duration': 300},
+]
+
+
+def add_default_rules(apps, schema_editor):
+    """Give every existing user the default alert rules."""
+    User = apps.get_model('core', 'User')
+    AlertRule = apps.get_model('core', 'AlertRule')
+    AlertRule.objects.bulk_create([
+        AlertRule(user_id=user_id, **rule)
+        for user_id in User.objects.values_list('id', flat=True)
+        for rule in DEFAULT_RULES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_daily_movement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('low', 'Low'), ('high', 'High')], max_length=4)),
+                ('date_created', models.DateTimeField()),
+                ('date_closed', models.DateTimeField(blank=True, null=True)),
+                ('peak', models.DecimalField(decimal_places=2, max_digits=7)),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('field', models.CharField(choices=[('temp', 'Temperature'), ('hr', 'Heart rate'), ('hr_interval', 'Heart rate interval'), ('batt', 'Battery')], max_length=16)),
+                ('low', models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True)),
+                ('high', models.DecimalField(blank=True, decimal_places=2, max_digits=7, null=True)),
+                ('hysteresis', models.DecimalField(decimal_places=2, default=0, max_digits=7)),
+                ('min_duration', models.IntegerField(default=0)),
+                ('enabled', models.BooleanField(default=True)),
+                ('horse', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.horse')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AlertState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('low', 'Low'), ('high', 'High')], max_length=4, null=True)),
+                ('since', models.DateTimeField(null=True)),
+                ('peak', models.DecimalField(decimal_places=2, max_digits=7, null=True)),
+                ('state_at', models.DateTimeField()),
+                ('alert', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.alert')),
+                ('horse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.horse')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.alertrule')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='rule',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.alertrule'),
+        ),
+        migrations.AddConstraint(
+            model_name='alertstate',
+            constraint=models.UniqueConstraint(fields=('rule', 'horse'), name='unique_alertstate_rule_horse'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['horse', 'date_created'], name='alert_horse_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(condition=models.Q(('date_closed__isnull', True)), fields=['horse', 'date_created'], name='alert_open_idx'),
+        ),
+        migrations.RunPython(add_default_rules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Baseline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('temp_mean', models.FloatField(null=True)),
+                ('temp_var', models.FloatField(null=True)),
+                ('temp_count', models.IntegerField(default=0)),
+                ('hr_mean', models.FloatField(null=True)),
+                ('hr_var', models.FloatField(null=True)),
+                ('hr_count', models.IntegerField(default=0)),
+                ('hr_interval_mean', models.FloatField(null=True)),
+                ('hr_interval_var', models.FloatField(null=True)),
+                ('hr_interval_count', models.IntegerField(default=0)),
+                ('state_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='datapoint',
+            name='anomalies',
+            field=models.SmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='baseline',
+            name='horse',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='core.horse'),
+        ),
+    ]
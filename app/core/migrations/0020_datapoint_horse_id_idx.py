@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 12:52
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0019_baselines'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='datapoint',
+            index=models.Index(fields=['horse', 'id'], name='datapoint_horse_id_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:04
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+BATCH_SIZE = 50000
+GEOCELL_SCALE = 1 << 26
+SPREAD = [
+    (16, 0x0000FFFF0000FFFF),
+    (8, 0x00FF00FF00FF00FF),
+    (4, 0x0F0F0F0F0F0F0F0F),
+    (2, 0x3333333333333333),
+    (1, 0x5555555555555555),
+]
+
+
+def spread_sql(value):
+    """Return SQL moving the bits of a bigint expression to even positions."""
+    for shift, mask in SPREAD:
+        value = f'(({value}) | (({value}) << {shift})) & {mask}'
+    return value
+
+
+def grid_sql(column, offset, span):
+    return f'LEAST(floor(({column}::float8 + {offset}) / {span} * {GEOCELL_SCALE})::bigint, {GEOCELL_SCALE - 1})'
+
+
+BACKFILL_GEOCELLS = (
+    f'UPDATE core_datapoint SET geocell = '
+    f'(({spread_sql(grid_sql("gps_lat", 90, 180))}) << 1) '
+    f'| ({spread_sql(grid_sql("gps_long", 180, 360))}) '
+    f'WHERE id BETWEEN %s AND %s AND geocell IS NULL '
+    f'AND gps_lat BETWEEN -90 AND 90 AND gps_long BETWEEN -180 AND 180'
+)
+
+
+def backfill_geocells(apps, schema_editor):
+    """
+    Set the geocells of readings stored before geocells existed.
+
+    Runs outside a transaction, so each batch of ids commits on its own and
+    locks only its rows; a rerun skips readings that already have one.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT min(id), max(id) FROM core_datapoint')
+        start, last = cursor.fetchone()
+        while start is not None and start <= last:
+            cursor.execute(BACKFILL_GEOCELLS, [start, start + BATCH_SIZE - 1])
+            start += BATCH_SIZE
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0020_datapoint_horse_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_geocells, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='datapoint',
+            index=models.Index(condition=models.Q(('geocell__isnull', False)), fields=['horse', 'geocell', 'date_created'], name='datapoint_horse_cell_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:12
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('core', '0021_datapoint_geocell_backfill'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='datapoint',
+            index=models.Index(condition=models.Q(('anomalies__isnull', False)), fields=['user', 'date_created'], name='datapoint_anomaly_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_datapoint_anomaly_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupRebuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_rolluprebuild'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='horse',
+            name='data_modified',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='horses_modified',
+        ),
+    ]
@@ -9,6 +9,7 @@ from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 from django.db import models
+from django.contrib.postgres.indexes import BrinIndex
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -51,11 +52,14 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped whenever one of the user's horses changes, for conditional GETs
+    horse_version = models.BigIntegerField(default=0, editable=False)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
+# No longer field defaults; kept for the migrations that reference them
 def get_default_horse():
     return Horse.objects.first()
 
@@ -71,15 +75,45 @@ class Horse(models.Model):
     name = models.CharField(max_length=255)
     api_key = models.CharField(max_length=12, unique=True, default=partial(get_random_string, length=12))
     image = models.ImageField(null=True, upload_to=horse_image_file_path, blank=True, default=None)
+    # Snapshot of the latest reading, kept current by ingest
+    last_seen = models.DateTimeField(null=True, blank=True, editable=False)
+    latest_gps_lat = models.DecimalField(
+        max_digits=9, decimal_places=6, null=True, editable=False,
+    )
+    latest_gps_long = models.DecimalField(
+        max_digits=9, decimal_places=6, null=True, editable=False,
+    )
+    latest_temp = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True, editable=False,
+    )
+    latest_hr = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True, editable=False,
+    )
+    latest_hr_interval = models.DecimalField(
+        max_digits=7, decimal_places=2, null=True, editable=False,
+    )
+    latest_batt = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True, editable=False,
+    )
+    # Bumped whenever one of the horse's data points changes
+    data_version = models.BigIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        # Fields maintained by ingest are only ever written with UPDATE
+        # statements, so saving a loaded horse must not overwrite them
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if field.editable and not field.primary_key
+            ]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name+" "+self.api_key
     
 class DataPoint(models.Model):
     """Data point for horse data."""
-    horse = models.ForeignKey(Horse, 
-                                on_delete=models.CASCADE, 
-                                default=get_default_horse)
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE)
     @property
     def name(self):
         return self.horse.name
@@ -95,7 +129,7 @@ class DataPoint(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        default=get_default_user)
+    )
     date_created = models.DateTimeField(default=timezone.now)
     gps_lat = models.DecimalField(max_digits=9, decimal_places=6, null=True)
     gps_long = models.DecimalField(max_digits=9, decimal_places=6, null=True)
@@ -103,8 +137,319 @@ class DataPoint(models.Model):
     hr = models.DecimalField(max_digits=5, decimal_places=2, null=True)
     hr_interval = models.DecimalField(max_digits=7, decimal_places=2, null=True)
     batt = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    # Integer geohash of the position, kept by ingest; see horse.geo
+    geocell = models.BigIntegerField(null=True, editable=False)
+    # Bit per field whose z-score against the horse's baseline was too
+    # high, null when none was; see horse.baselines
+    anomalies = models.SmallIntegerField(null=True, editable=False)
+
+    class Meta:
+        # The unique (horse, date_created) index also serves per-horse
+        # time range scans.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['horse', 'date_created'],
+                name='unique_datapoint_horse_date',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'date_created', 'id'],
+                name='datapoint_user_date_idx',
+            ),
+            models.Index(fields=['user', 'id'], name='datapoint_user_id_idx'),
+            # Per horse id ranges, for delta sync
+            models.Index(
+                fields=['horse', 'id'], name='datapoint_horse_id_idx',
+            ),
+            models.Index(
+                fields=['horse', 'geocell', 'date_created'],
+                name='datapoint_horse_cell_idx',
+                condition=models.Q(geocell__isnull=False),
+            ),
+            # Anomalies are rare, so listing them scans this small index
+            models.Index(
+                fields=['user', 'date_created'],
+                name='datapoint_anomaly_idx',
+                condition=models.Q(anomalies__isnull=False),
+            ),
+            BrinIndex(fields=['date_created'], name='datapoint_date_brin'),
+        ]
 
     def __str__(self):
         return self.api_key+" "+self.name+" "+str(self.date_created)
 
 
+class DataPointTombstone(models.Model):
+    """Record of a data point deleted through the API, for delta sync."""
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE)
+    datapoint_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['horse', 'id'], name='tombstone_horse_id_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.horse_id)+" "+str(self.datapoint_id)
+
+
+class Geofence(models.Model):
+    """Polygon, such as a paddock, a horse's readings are checked against."""
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    # [[lat, long], ...] corners of the polygon, in order
+    vertices = models.JSONField()
+    modified = models.DateTimeField(auto_now=True)
+    # Whether the horse's latest evaluated reading was inside, and its time
+    inside = models.BooleanField(null=True, editable=False)
+    state_at = models.DateTimeField(null=True, editable=False)
+
+    def __str__(self):
+        return str(self.horse_id)+" "+self.name
+
+
+class GeofenceEvent(models.Model):
+    """A horse entering or leaving one of its geofences."""
+    ENTER = 'enter'
+    EXIT = 'exit'
+    KIND_CHOICES = [(ENTER, 'Enter'), (EXIT, 'Exit')]
+
+    fence = models.ForeignKey(Geofence, on_delete=models.CASCADE)
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE)
+    # The first reading on the new side; kept if the reading is deleted
+    datapoint_id = models.BigIntegerField()
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    date_created = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['horse', 'date_created'],
+                name='fenceevent_horse_date_idx',
+            ),
+            models.Index(
+                fields=['fence', 'date_created'],
+                name='fenceevent_fence_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.fence_id)+" "+self.kind+" "+str(self.date_created)
+
+
+class SpoolCheckpoint(models.Model):
+    """Progress of the ingest spool flusher through a spool segment."""
+    segment = models.CharField(max_length=255, unique=True)
+    offset = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return self.segment+" "+str(self.offset)
+
+
+class Rollup(models.Model):
+    """Count, sum, min and max of a horse's readings over a time bucket."""
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE)
+    temp_count = models.IntegerField(default=0)
+    temp_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    temp_min = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    temp_max = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    hr_count = models.IntegerField(default=0)
+    hr_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    hr_min = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    hr_max = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    hr_interval_count = models.IntegerField(default=0)
+    hr_interval_sum = models.DecimalField(
+        max_digits=17, decimal_places=2, default=0,
+    )
+    hr_interval_min = models.DecimalField(
+        max_digits=7, decimal_places=2, null=True,
+    )
+    hr_interval_max = models.DecimalField(
+        max_digits=7, decimal_places=2, null=True,
+    )
+    batt_count = models.IntegerField(default=0)
+    batt_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    batt_min = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    batt_max = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+
+    class Meta:
+        abstract = True
+
+
+class HourlyRollup(Rollup):
+    """Readings of a horse over one UTC hour."""
+    hour = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['horse', 'hour'],
+                name='unique_hourlyrollup_horse_hour',
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.horse_id)+" "+str(self.hour)
+
+
+class DailyRollup(Rollup):
+    """Readings of a horse over one day in TIME_ZONE."""
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['horse', 'day'],
+                name='unique_dailyrollup_horse_day',
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.horse_id)+" "+str(self.day)
+
+
+class RollupRebuild(models.Model):
+    """A rebuild_rollups run that recomputed all rollups from every reading."""
+    completed = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return str(self.completed)
+
+
+class DailyMovement(models.Model):
+    """Distance, movement and rest of a horse over a closed TIME_ZONE day."""
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE)
+    day = models.DateField()
+    fixes = models.IntegerField(default=0)
+    distance = models.FloatField(default=0)
+    moving_seconds = models.FloatField(default=0)
+    resting_seconds = models.FloatField(default=0)
+    rest_periods = models.IntegerField(default=0)
+    longest_rest = models.FloatField(default=0)
+    max_speed = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['horse', 'day'],
+                name='unique_dailymovement_horse_day',
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.horse_id)+" "+str(self.day)
+
+
+class AlertRule(models.Model):
+    """Threshold rule raising alerts on one field of a user's readings."""
+    FIELD_CHOICES = [
+        ('temp', 'Temperature'),
+        ('hr', 'Heart rate'),
+        ('hr_interval', 'Heart rate interval'),
+        ('batt', 'Battery'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    # Every horse of the user when not set
+    horse = models.ForeignKey(
+        Horse, on_delete=models.CASCADE, null=True, blank=True,
+    )
+    name = models.CharField(max_length=255, blank=True)
+    field = models.CharField(max_length=16, choices=FIELD_CHOICES)
+    low = models.DecimalField(
+        max_digits=7, decimal_places=2, null=True, blank=True,
+    )
+    high = models.DecimalField(
+        max_digits=7, decimal_places=2, null=True, blank=True,
+    )
+    # How far back inside the range a value must come to close an alert
+    hysteresis = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    # Seconds a value must stay out of range before an alert opens
+    min_duration = models.IntegerField(default=0)
+    enabled = models.BooleanField(default=True)
+
+    def __str__(self):
+        return str(self.user_id)+" "+self.field
+
+
+class Alert(models.Model):
+    """A horse's readings of a rule's field staying out of its range."""
+    LOW = 'low'
+    HIGH = 'high'
+    KIND_CHOICES = [(LOW, 'Low'), (HIGH, 'High')]
+
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE)
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=4, choices=KIND_CHOICES)
+    # Time of the first reading out of range and of the one that cleared it
+    date_created = models.DateTimeField()
+    date_closed = models.DateTimeField(null=True, blank=True)
+    # The value furthest out of range
+    peak = models.DecimalField(max_digits=7, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['horse', 'date_created'], name='alert_horse_date_idx',
+            ),
+            models.Index(
+                fields=['horse', 'date_created'],
+                name='alert_open_idx',
+                condition=models.Q(date_closed__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.horse_id)+" "+self.kind+" "+str(self.date_created)
+
+
+class AlertState(models.Model):
+    """Where a rule's evaluation of a horse's readings has got to."""
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE)
+    horse = models.ForeignKey(Horse, on_delete=models.CASCADE)
+    # The side values are out of range on, since when and the extreme so far
+    kind = models.CharField(
+        max_length=4, choices=Alert.KIND_CHOICES, null=True,
+    )
+    since = models.DateTimeField(null=True)
+    peak = models.DecimalField(max_digits=7, decimal_places=2, null=True)
+    alert = models.ForeignKey(Alert, on_delete=models.SET_NULL, null=True)
+    # Time of the latest evaluated reading
+    state_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['rule', 'horse'],
+                name='unique_alertstate_rule_horse',
+            ),
+        ]
+
+    def __str__(self):
+        return str(self.rule_id)+" "+str(self.horse_id)
+
+
+class Baseline(models.Model):
+    """EWMA mean and variance of a horse's readings, kept by ingest."""
+    horse = models.OneToOneField(Horse, on_delete=models.CASCADE)
+    temp_mean = models.FloatField(null=True)
+    temp_var = models.FloatField(null=True)
+    temp_count = models.IntegerField(default=0)
+    hr_mean = models.FloatField(null=True)
+    hr_var = models.FloatField(null=True)
+    hr_count = models.IntegerField(default=0)
+    hr_interval_mean = models.FloatField(null=True)
+    hr_interval_var = models.FloatField(null=True)
+    hr_interval_count = models.IntegerField(default=0)
+    # Time of the latest reading in the baseline
+    state_at = models.DateTimeField()
+
+    def __str__(self):
+        return str(self.horse_id)+" "+str(self.state_at)
@@ -0,0 +1,97 @@
+"""
+Query budgets for API views.
+
+Views declare the most queries each action may run in query_budgets.
+Budgets are enforced when settings.QUERY_BUDGETS_ENFORCED is true, which
+the test runner turns on, so a change that makes an action's query count
+grow with the size of its result fails the test suite.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+
+TRANSACTION_STATEMENT = re.compile(
+    r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.I,
+)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUE_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a view runs more queries than its budget allows."""
+
+
+def fingerprint(sql):
+    """Return sql with literals and value lists collapsed, for grouping."""
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = VALUE_LIST.sub('(...)', sql)
+
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """
+    Execute wrapper recording the statements run on a connection.
+
+    Savepoint statements are skipped: they only appear when a request runs
+    inside an outer transaction, as it does in tests.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not TRANSACTION_STATEMENT.match(sql):
+            self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def duplicates(self, threshold=2):
+        """Return (fingerprint, count) of statements run threshold times."""
+        counts = Counter(fingerprint(sql) for sql in self.statements)
+
+        return [
+            (sql, count) for sql, count in counts.most_common()
+            if count >= threshold
+        ]
+
+
+class QueryBudgetMixin:
+    """
+    Enforce per action query budgets on a view.
+
+    query_budgets maps a viewset action, or a lowercase HTTP method on
+    plain views, to the most queries one request may run. Actions without
+    a budget are not checked.
+    """
+    query_budgets = {}
+
+    def get_query_budget(self, request):
+        action = getattr(self, 'action', None) or request.method.lower()
+
+        return action, self.query_budgets.get(action)
+
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.QUERY_BUDGETS_ENFORCED:
+            return super().dispatch(request, *args, **kwargs)
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = super().dispatch(request, *args, **kwargs)
+        action, budget = self.get_query_budget(request)
+        if budget is not None and len(recorder) > budget:
+            raise QueryBudgetExceeded(
+                f'{type(self).__name__}.{action} ran {len(recorder)} queries, '
+                f'over its budget of {budget}:\n'
+                + '\n'.join(recorder.statements)
+            )
+
+        return response
@@ -5,6 +5,12 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.utils import timezone
+from datetime import timedelta
+
+from core.models import Horse, DataPoint
 
 
 class AdminSiteTests(TestCase):
@@ -44,4 +50,23 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:core_user_add')
         res = self.client.get(url)
 
-        self.assertEqual(res.status_code, 200)
\ No newline at end of file
+        self.assertEqual(res.status_code, 200)
+
+    def test_datapoints_list(self):
+        """Test the data point list reads horses with a join."""
+        horse = Horse.objects.create(user=self.user, name='Admin Horse')
+        for minute in range(5):
+            DataPoint.objects.create(
+                user=self.user,
+                horse=horse,
+                date_created=timezone.now() - timedelta(minutes=minute),
+            )
+        url = reverse('admin:core_datapoint_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url)
+
+        self.assertContains(res, horse.api_key, count=5)
+        horse_queries = [
+            q for q in queries if q['sql'].startswith('SELECT "core_horse"')
+        ]
+        self.assertEqual(horse_queries, [])
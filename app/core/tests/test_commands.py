@@ -1,13 +1,19 @@
 """
 Test custom DJango management commands.
 """
+from datetime import datetime, timezone
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from core.models import Horse, DataPoint
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -32,3 +38,62 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class DedupeDataPointsTests(TransactionTestCase):
+    """Test removing duplicate data points."""
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'ALTER TABLE core_datapoint '
+                'DROP CONSTRAINT unique_datapoint_horse_date'
+            )
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'ALTER TABLE core_datapoint ADD CONSTRAINT '
+                'unique_datapoint_horse_date UNIQUE (horse_id, date_created)'
+            )
+
+    def test_dedupe_keeps_first_reading(self):
+        """Test duplicates are deleted keeping the earliest row."""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'pass123',
+        )
+        horse = Horse.objects.create(user=user, name='Sample Horse')
+        times = [
+            datetime(2023, 3, 17, 12, 0, tzinfo=timezone.utc),
+            datetime(2023, 3, 17, 12, 5, tzinfo=timezone.utc),
+        ]
+        kept = [
+            DataPoint.objects.create(user=user, horse=horse, date_created=time)
+            for time in times
+        ]
+        for _ in range(2):
+            DataPoint.objects.create(
+                user=user, horse=horse, date_created=times[0],
+            )
+
+        call_command('dedupe_datapoints', chunk_size=2, stdout=StringIO())
+
+        self.assertEqual(
+            list(
+                DataPoint.objects.order_by('id').values_list('id', flat=True)
+            ),
+            [dp.id for dp in kept],
+        )
+
+
+class BenchmarkIndexesTests(TestCase):
+    """Test the index benchmark command."""
+
+    def test_refuses_without_lock_flag(self):
+        """Test the benchmark seeds nothing unless locking is confirmed."""
+        with self.assertRaises(CommandError):
+            call_command(
+                'benchmark_datapoint_indexes', rows=10, stdout=StringIO(),
+            )
+
+        self.assertFalse(get_user_model().objects.exists())
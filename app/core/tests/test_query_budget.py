@@ -0,0 +1,117 @@
+"""
+Tests for query budgets and duplicate query logging.
+"""
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from core.middleware import DuplicateQueryLoggingMiddleware
+from core.models import Horse
+from core.query_budget import (
+    QueryBudgetExceeded,
+    QueryBudgetMixin,
+    QueryRecorder,
+    fingerprint,
+)
+
+
+class CountHorsesView(QueryBudgetMixin, APIView):
+    """View counting horses once per requested repeat."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    query_budgets = {'get': 2}
+
+    def get(self, request):
+        with transaction.atomic():
+            repeat = int(request.GET['repeat'])
+            counts = [Horse.objects.count() for _ in range(repeat)]
+        return Response({'counts': counts})
+
+
+class QueryBudgetTests(TestCase):
+    """Test query budget enforcement."""
+
+    def get(self, repeat):
+        request = APIRequestFactory().get('/', {'repeat': repeat})
+        return CountHorsesView.as_view()(request)
+
+    def test_fingerprint_collapses_literals(self):
+        """Test queries differing only in literals share a fingerprint."""
+        self.assertEqual(
+            fingerprint(
+                "SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'a'"
+            ),
+            fingerprint(
+                "SELECT  * FROM t WHERE id IN (%s)  AND name = 'b''c'"
+            ),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM core_horse WHERE id = 12 LIMIT 21'),
+            'SELECT * FROM core_horse WHERE id = ? LIMIT ?',
+        )
+
+    @override_settings(QUERY_BUDGETS_ENFORCED=True)
+    def test_within_budget(self):
+        """Test requests within budget respond, ignoring savepoints."""
+        res = self.get(2)
+
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(QUERY_BUDGETS_ENFORCED=True)
+    def test_over_budget_raises(self):
+        """Test requests over budget raise with the statements run."""
+        message = 'ran 3 queries, over its budget of 2'
+        with self.assertRaisesRegex(QueryBudgetExceeded, message):
+            self.get(3)
+
+    @override_settings(QUERY_BUDGETS_ENFORCED=False)
+    def test_not_enforced(self):
+        """Test budgets are ignored unless enforced."""
+        self.assertEqual(self.get(3).status_code, 200)
+
+    def test_recorder_duplicates(self):
+        """Test the recorder groups repeated statements by fingerprint."""
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            Horse.objects.filter(id=1).exists()
+            Horse.objects.filter(id=2).exists()
+            Horse.objects.count()
+
+        self.assertEqual(len(recorder), 3)
+        duplicates = recorder.duplicates()
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0][1], 2)
+
+
+class DuplicateQueryLoggingMiddlewareTests(TestCase):
+    """Test the duplicate query logging middleware."""
+
+    def get_response(self, request):
+        for _ in range(3):
+            Horse.objects.count()
+        Horse.objects.exists()
+        return HttpResponse()
+
+    @override_settings(LOG_DUPLICATE_QUERIES=False)
+    def test_disabled(self):
+        """Test the middleware removes itself unless enabled."""
+        with self.assertRaises(MiddlewareNotUsed):
+            DuplicateQueryLoggingMiddleware(self.get_response)
+
+    @override_settings(LOG_DUPLICATE_QUERIES=True, DUPLICATE_QUERY_THRESHOLD=2)
+    def test_logs_duplicates(self):
+        """Test repeated queries are logged once with their count."""
+        middleware = DuplicateQueryLoggingMiddleware(self.get_response)
+        request = APIRequestFactory().get('/api/horse/horses/')
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            middleware(request)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(
+            'GET /api/horse/horses/ ran a query 3 times', logs.output[0],
+        )
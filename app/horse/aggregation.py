@@ -0,0 +1,270 @@
+"""
+Time bucketed aggregation of data points.
+
+Readings are grouped per horse into buckets of local time in TIME_ZONE,
+truncated with date_trunc in the database, and summarized there with
+min, max, avg and count for each requested field. Hourly and daily
+buckets covered entirely by the requested range are read from rollups.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+import pytz
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.utils import timezone
+
+from core.models import HourlyRollup, DailyRollup
+from horse.rollups import local_midnight
+
+
+AGGREGATE_FIELDS = ['temp', 'hr', 'hr_interval', 'batt']
+STATS = {
+    'min': Min,
+    'max': Max,
+    'avg': Avg,
+    'count': Count,
+}
+MAX_FILLED_BUCKETS = 10000
+
+
+class TruncFiveMinutes(TruncMinute):
+    """Truncate a datetime to the start of its five minute interval."""
+
+    def as_sql(self, compiler, connection):
+        sql, params = super().as_sql(compiler, connection)
+        return (
+            f'({sql} - make_interval('
+            f'mins => EXTRACT(minute FROM {sql})::integer %% 5))',
+            params * 2,
+        )
+
+
+BUCKETS = {
+    '5min': (TruncFiveMinutes, timedelta(minutes=5)),
+    'hour': (TruncHour, timedelta(hours=1)),
+    'day': (TruncDay, timedelta(days=1)),
+}
+
+
+def _floor_local(value, width):
+    """Return the naive local start of the bucket holding an aware datetime."""
+    local = timezone.localtime(value).replace(tzinfo=None)
+    if width == 'day':
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    local = local.replace(second=0, microsecond=0)
+    if width == 'hour':
+        return local.replace(minute=0)
+
+    return local.replace(minute=local.minute - local.minute % 5)
+
+
+def _local_key(value):
+    return timezone.localtime(value).replace(tzinfo=None)
+
+
+def aggregate(queryset, width, fields):
+    """Return per horse bucket rows of min, max, avg and count for fields."""
+    trunc, _ = BUCKETS[width]
+    aggregates = {
+        f'{field}__{stat}': function(field)
+        for field in fields
+        for stat, function in STATS.items()
+    }
+    rows = (
+        queryset
+        .annotate(bucket=trunc('date_created'))
+        .values('horse__api_key', 'bucket')
+        .annotate(**aggregates)
+        .order_by('horse__api_key', 'bucket')
+    )
+
+    return [
+        {
+            'api_key': row['horse__api_key'],
+            'bucket': row['bucket'],
+            **{
+                field: {stat: row[f'{field}__{stat}'] for stat in STATS}
+                for field in fields
+            },
+        }
+        for row in rows
+    ]
+
+
+def _full_buckets(width, start, end):
+    """Return the first and end bucket starts inside inclusive bounds."""
+    first = last = None
+    if width == 'hour':
+        if start is not None:
+            first = start.astimezone(dt_timezone.utc).replace(
+                minute=0, second=0, microsecond=0,
+            )
+            if first < start:
+                first += timedelta(hours=1)
+        if end is not None:
+            last = end + timedelta(microseconds=1)
+            last = last.astimezone(dt_timezone.utc)
+            last = last.replace(minute=0, second=0, microsecond=0)
+    else:
+        if start is not None:
+            day = timezone.localtime(start).date()
+            first = local_midnight(day)
+            if first < start:
+                first = local_midnight(day + timedelta(days=1))
+        if end is not None:
+            day = timezone.localtime(end + timedelta(microseconds=1)).date()
+            last = local_midnight(day)
+
+    return first, last
+
+
+def _rollup_rows(horses, width, fields, first, last):
+    """Return aggregate rows of buckets from first to last, from rollups."""
+    aggregates = {}
+    for field in fields:
+        aggregates[f'{field}__count'] = Sum(f'{field}_count')
+        aggregates[f'{field}__sum'] = Sum(f'{field}_sum')
+        aggregates[f'{field}__min'] = Min(f'{field}_min')
+        aggregates[f'{field}__max'] = Max(f'{field}_max')
+
+    if width == 'hour':
+        queryset = HourlyRollup.objects.filter(horse__in=horses)
+        if first is not None:
+            queryset = queryset.filter(hour__gte=first)
+        if last is not None:
+            queryset = queryset.filter(hour__lt=last)
+        # Local hours, which merge the UTC hours repeated when clocks go back
+        queryset = queryset.annotate(bucket=TruncHour('hour')).values(
+            'horse__api_key', 'bucket',
+        )
+    else:
+        queryset = DailyRollup.objects.filter(horse__in=horses)
+        if first is not None:
+            queryset = queryset.filter(
+                day__gte=timezone.localtime(first).date(),
+            )
+        if last is not None:
+            queryset = queryset.filter(day__lt=timezone.localtime(last).date())
+        queryset = queryset.values('horse__api_key', 'day')
+
+    rows = []
+    for row in queryset.annotate(**aggregates):
+        result = {
+            'api_key': row['horse__api_key'],
+            'bucket': (
+                row['bucket'] if width == 'hour'
+                else local_midnight(row['day'])
+            ),
+        }
+        for field in fields:
+            count = row[f'{field}__count']
+            result[field] = {
+                'min': row[f'{field}__min'],
+                'max': row[f'{field}__max'],
+                'avg': row[f'{field}__sum'] / count if count else None,
+                'count': count,
+            }
+        rows.append(result)
+
+    return rows
+
+
+def _merge(rows, fields):
+    """Combine rows of the same horse and bucket, in horse and bucket order."""
+    merged = {}
+    for row in rows:
+        key = (row['api_key'], row['bucket'])
+        if key not in merged:
+            merged[key] = row
+            continue
+        for field in fields:
+            a, b = merged[key][field], row[field]
+            count = a['count'] + b['count']
+            total = (a['avg'] or 0) * a['count'] + (b['avg'] or 0) * b['count']
+            merged[key][field] = {
+                'min': min(
+                    (v for v in (a['min'], b['min']) if v is not None),
+                    default=None,
+                ),
+                'max': max(
+                    (v for v in (a['max'], b['max']) if v is not None),
+                    default=None,
+                ),
+                'avg': total / count if count else None,
+                'count': count,
+            }
+
+    return [merged[key] for key in sorted(merged)]
+
+
+def aggregate_rollups(queryset, horses, width, fields, start=None, end=None):
+    """
+    Return the rows of aggregate, reading whole buckets from rollups.
+
+    queryset holds the filtered data points of horses between the
+    inclusive bounds start and end. Only the partial buckets at either end
+    of the range are aggregated from its raw rows.
+    """
+    if width not in ('hour', 'day'):
+        return aggregate(queryset, width, fields)
+    first, last = _full_buckets(width, start, end)
+    if first is not None and last is not None and first >= last:
+        return aggregate(queryset, width, fields)
+
+    rows = _rollup_rows(horses, width, fields, first, last)
+    if first is not None:
+        before = queryset.filter(date_created__lt=first)
+        rows += aggregate(before, width, fields)
+    if last is not None:
+        after = queryset.filter(date_created__gte=last)
+        rows += aggregate(after, width, fields)
+
+    return _merge(rows, fields)
+
+
+def fill_gaps(rows, width, fields, start=None, end=None):
+    """
+    Add empty buckets so every horse has one row per bucket.
+
+    Buckets run from start (or a horse's first bucket) to end (or its
+    last bucket) in local time, so days stay aligned across daylight
+    saving changes. Local times skipped by a change are left out.
+    """
+    _, step = BUCKETS[width]
+    tz = timezone.get_current_timezone()
+    empty = {stat: None for stat in STATS}
+    empty['count'] = 0
+
+    horses = {}
+    for row in rows:
+        horses.setdefault(row['api_key'], {})[_local_key(row['bucket'])] = row
+
+    filled = []
+    for api_key, buckets in horses.items():
+        first = _floor_local(start, width) if start else min(buckets)
+        last = _floor_local(end, width) if end else max(buckets)
+        if (last - first) / step >= MAX_FILLED_BUCKETS:
+            raise ValueError(
+                f'Gap filling is limited to {MAX_FILLED_BUCKETS} buckets '
+                f'per horse.'
+            )
+        local = first
+        while local <= last:
+            if local in buckets:
+                filled.append(buckets[local])
+            else:
+                try:
+                    bucket = timezone.make_aware(local, tz)
+                except pytz.NonExistentTimeError:
+                    local += step
+                    continue
+                except pytz.AmbiguousTimeError:
+                    bucket = timezone.make_aware(local, tz, is_dst=True)
+                filled.append({
+                    'api_key': api_key,
+                    'bucket': bucket,
+                    **{field: dict(empty) for field in fields},
+                })
+            local += step
+
+    return filled
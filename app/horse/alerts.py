@@ -0,0 +1,265 @@
+"""
+Threshold alerts evaluated on ingest.
+
+Every statement that writes data points has its readings, read together
+with the alert states of their horses, passed to evaluate() in the
+ingest transaction, where the horse rows are already locked (see
+effects). Each alert rule keeps an AlertState per horse: which side of
+its range values are on, since when, the extreme value so far and the
+open alert. A batch is fed through those states in time order, so no
+earlier readings are ever read back.
+
+A value out of range starts a breach, and the breach opens an Alert once
+it has lasted the rule's min_duration. An open alert closes at the first
+value back inside the range by at least the rule's hysteresis, so values
+hovering at a limit do not open and close alerts over and over. Readings
+no newer than a state's latest one are not evaluated.
+
+Changing or disabling a rule closes its open alerts and drops its states,
+so evaluation starts over from the next readings.
+"""
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import AlertRule, Alert, AlertState
+
+
+ALERT_FIELDS = [field for field, _ in AlertRule.FIELD_CHOICES]
+
+
+class Breach:
+    """The AlertState of a rule and horse while its readings are evaluated."""
+
+    def __init__(self, rule, horse_id, kind, since, peak, alert_id):
+        self.rule = rule
+        self.horse_id = horse_id
+        self.kind = kind
+        self.since = since
+        self.peak = peak
+        self.alert = None if alert_id is None else Alert(id=alert_id)
+        self.state_at = None
+
+    def side(self, value):
+        """Return which side of the rule's range value is on, if outside it."""
+        if self.rule['high'] is not None and value > self.rule['high']:
+            return Alert.HIGH
+        if self.rule['low'] is not None and value < self.rule['low']:
+            return Alert.LOW
+        return None
+
+    def cleared(self, value):
+        """Return whether value ends the open alert."""
+        if self.kind == Alert.HIGH:
+            high = self.rule['high']
+            return high is None or value <= high - self.rule['hysteresis']
+        low = self.rule['low']
+        return low is None or value >= low + self.rule['hysteresis']
+
+    def extreme(self, value):
+        if self.kind == Alert.HIGH:
+            return max(self.peak, value)
+
+        return min(self.peak, value)
+
+    def add(self, date_created, value, opened, closed):
+        """Move on by one reading, listing alerts it opens or closes."""
+        self.state_at = date_created
+        if self.alert is not None:
+            if not self.cleared(value):
+                self.peak = self.extreme(value)
+                return
+            self.alert.peak = self.peak
+            self.alert.date_closed = date_created
+            if self.alert.pk is not None:
+                closed.append(self.alert)
+            self.alert = None
+            self.kind = None
+
+        side = self.side(value)
+        if side is None:
+            self.kind = self.since = self.peak = None
+            return
+        if side == self.kind:
+            self.peak = self.extreme(value)
+        else:
+            self.kind, self.since, self.peak = side, date_created, value
+        lasted = (date_created - self.since).total_seconds()
+        if lasted >= self.rule['min_duration']:
+            self.alert = Alert(
+                rule_id=self.rule['id'],
+                horse_id=self.horse_id,
+                kind=self.kind,
+                date_created=self.since,
+            )
+            opened.append(self.alert)
+
+
+# (column, name) of the rules and states of a horse's readings
+STATE_COLUMNS = [
+    ('ar.id', 'rule_ids'),
+    ('ar.field', 'rule_fields'),
+    ('ar.low', 'rule_lows'),
+    ('ar.high', 'rule_highs'),
+    ('ar.hysteresis', 'rule_hystereses'),
+    ('ar.min_duration', 'rule_min_durations'),
+    ('st.kind', 'rule_kinds'),
+    ('st.since', 'rule_sinces'),
+    ('st.peak', 'rule_peaks'),
+    ('st.alert_id', 'rule_alert_ids'),
+    ('st.state_at', 'rule_states_at'),
+]
+# Enabled rules and their states of a horse with written readings (see
+# effects)
+STATE_SQL = (
+    'SELECT '
+    + ', '.join(
+        f'array_agg({column} ORDER BY ar.id) AS {name}'
+        for column, name in STATE_COLUMNS
+    )
+    + f' FROM {AlertRule._meta.db_table} ar '
+    f'LEFT JOIN {AlertState._meta.db_table} st '
+    f'ON st.rule_id = ar.id AND st.horse_id = written.horse_id '
+    f'WHERE ar.enabled AND ar.user_id = written.user_id '
+    f'AND (ar.horse_id = written.horse_id OR ar.horse_id IS NULL)'
+)
+
+
+def _states_statement(breaches, opened):
+    """
+    Return a statement inserting or updating the AlertState of breaches.
+
+    When opened, alerts opened by the same statement get their ids from
+    opened_alerts.
+    """
+    columns = [
+        'rule_id', 'horse_id', 'kind', 'since', 'peak', 'alert_id',
+        'state_at',
+    ]
+    arrays = [
+        [breach.rule['id'] for breach in breaches],
+        [breach.horse_id for breach in breaches],
+        [breach.kind for breach in breaches],
+        [breach.since for breach in breaches],
+        [breach.peak for breach in breaches],
+        [breach.alert and breach.alert.id for breach in breaches],
+        [breach.state_at for breach in breaches],
+    ]
+    types = [
+        'bigint', 'bigint', 'varchar', 'timestamptz', 'numeric', 'bigint',
+        'timestamptz',
+    ]
+    selects = [f'u.{column}' for column in columns]
+    source = (
+        f'unnest({", ".join(f"%s::{t}[]" for t in types)}) '
+        f'AS u({", ".join(columns)})'
+    )
+    if opened:
+        selects[5] = 'coalesce(u.alert_id, o.id)'
+        source += (
+            ' LEFT JOIN opened_alerts o ON o.rule_id = u.rule_id '
+            'AND o.horse_id = u.horse_id AND o.date_closed IS NULL'
+        )
+
+    return (
+        'alert_states',
+        f'INSERT INTO {AlertState._meta.db_table} ({", ".join(columns)}) '
+        f'SELECT {", ".join(selects)} FROM {source} '
+        f'ON CONFLICT (rule_id, horse_id) DO UPDATE SET '
+        + ', '.join(
+            f'{column} = EXCLUDED.{column}' for column in columns[2:]
+        ),
+        arrays,
+    )
+
+
+def evaluate(horses):
+    """Return statements feeding written readings through alert states."""
+    breaches = []
+    opened = []
+    closed = []
+    for horse in horses:
+        if not horse['rule_ids']:
+            continue
+        states = zip(*(horse[name] for _, name in STATE_COLUMNS))
+        for (rule_id, field, low, high, hysteresis, min_duration,
+             kind, since, peak, alert_id, state_at) in states:
+            readings = [
+                (date_created, value)
+                for date_created, value in zip(horse['dates'], horse[field])
+                if value is not None
+                and (state_at is None or date_created > state_at)
+            ]
+            if not readings:
+                continue
+            rule = {
+                'id': rule_id,
+                'low': low,
+                'high': high,
+                'hysteresis': hysteresis,
+                'min_duration': min_duration,
+            }
+            breach = Breach(rule, horse['horse_id'], kind, since, peak,
+                            alert_id)
+            for date_created, value in readings:
+                breach.add(date_created, value, opened, closed)
+            if breach.alert is not None:
+                breach.alert.peak = breach.peak
+                if breach.alert.pk is not None:
+                    closed.append(breach.alert)
+            breaches.append(breach)
+
+    if not breaches:
+        return []
+    statements = []
+    if opened:
+        columns = [
+            'rule_id', 'horse_id', 'kind', 'date_created', 'date_closed',
+            'peak',
+        ]
+        types = [
+            'bigint', 'bigint', 'varchar', 'timestamptz', 'timestamptz',
+            'numeric',
+        ]
+        statements.append((
+            'opened_alerts',
+            f'INSERT INTO {Alert._meta.db_table} ({", ".join(columns)}) '
+            f'SELECT * FROM '
+            f'unnest({", ".join(f"%s::{t}[]" for t in types)}) '
+            f'RETURNING id, rule_id, horse_id, date_closed',
+            [
+                [getattr(alert, column) for alert in opened]
+                for column in columns
+            ],
+        ))
+    if closed:
+        statements.append((
+            'closed_alerts',
+            f'UPDATE {Alert._meta.db_table} a '
+            f'SET date_closed = u.date_closed, peak = u.peak '
+            f'FROM unnest(%s::bigint[], %s::timestamptz[], %s::numeric[]) '
+            f'AS u(id, date_closed, peak) WHERE a.id = u.id',
+            [
+                [alert.id for alert in closed],
+                [alert.date_closed for alert in closed],
+                [alert.peak for alert in closed],
+            ],
+        ))
+    statements.append(_states_statement(breaches, bool(opened)))
+
+    return statements
+
+
+def reset(rule):
+    """Close the open alerts of a rule and drop its states."""
+    Alert.objects.filter(rule=rule, date_closed__isnull=True).update(
+        date_closed=timezone.now(),
+    )
+    AlertState.objects.filter(rule=rule).delete()
+
+
+def add_default_rules(user):
+    """Give a new user the default alert rules."""
+    AlertRule.objects.bulk_create([
+        AlertRule(user=user, **rule)
+        for rule in settings.HORSE_DEFAULT_ALERT_RULES
+    ])
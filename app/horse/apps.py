@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class HorseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'horse'
+
+    def ready(self):
+        import horse.signals  # noqa: F401
@@ -0,0 +1,253 @@
+"""
+Per horse baselines of readings, for flagging anomalies.
+
+Each horse has an exponentially weighted moving mean and variance of
+every ANOMALY_FIELDS field in its Baseline row. A reading is flagged when
+a value is more than Z_LIMIT standard deviations from the horse's
+baseline before it, by setting that field's bit in the reading's
+anomalies. The first WARMUP values of a field only build the baseline,
+and the standard deviation is floored at MIN_STD so a very steady signal
+does not flag every small wobble.
+
+Ingest feeds written readings through their horses' baselines in time
+order, in the ingest transaction where the horse rows are locked (see
+effects).
+Readings no newer than a baseline's state_at are left unscored until
+rebuild() runs the horse's whole history again. Both run the same
+recursions with array operations: y[n] = decay * y[n-1] + input[n] is a
+scaled cumulative sum, taken in blocks short enough that the scale stays
+well inside float range.
+"""
+import math
+
+import numpy as np
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.functions import Cast, Coalesce
+
+from core.models import Baseline, DataPoint
+from horse import tracks
+
+
+ANOMALY_FIELDS = ['temp', 'hr', 'hr_interval']
+# Weight of each new value; older values fade with a half life of about
+# 70 readings
+ALPHA = 0.01
+WARMUP = 60
+Z_LIMIT = 4
+MIN_STD = {'temp': 0.1, 'hr': 1, 'hr_interval': 20}
+# A binary COPY row of a non-null int8 id and three float8 values
+COPY_ROW = np.dtype(
+    [('fields', '>i2'), ('id_size', '>i4'), ('id', '>i8')]
+    + [
+        item
+        for field in ANOMALY_FIELDS
+        for item in ((f'{field}_size', '>i4'), (field, '>f8'))
+    ]
+)
+
+
+def flag(field):
+    """Return the anomalies bit of a field."""
+    return 1 << ANOMALY_FIELDS.index(field)
+
+
+def _recurse(inputs, decay, initial):
+    """Return y with y[n] = decay * y[n-1] + inputs[n] and y[-1] = initial."""
+    # decay ** -block stays below e ** 10
+    block = max(1, int(10 / -math.log(decay)))
+    powers = decay ** np.arange(block + 1)
+    outputs = np.empty(len(inputs))
+    for start in range(0, len(inputs), block):
+        chunk = inputs[start:start + block]
+        count = len(chunk)
+        outputs[start:start + count] = (
+            powers[1:count + 1] * initial
+            + powers[:count] * np.cumsum(chunk / powers[:count])
+        )
+        initial = outputs[start + count - 1]
+
+    return outputs
+
+
+def score(values, mean, var, count, min_std):
+    """
+    Run one field's values through its baseline.
+
+    values is a float array in time order, NaN where the field is
+    missing. Returns (z, mean, var, count): the z-score of each value
+    against the baseline before it, NaN when missing or warming up, and
+    the baseline after the last value.
+    """
+    z = np.full(len(values), np.nan)
+    present = np.flatnonzero(~np.isnan(values))
+    if not len(present):
+        return z, mean, var, count
+    x = values[present]
+    if count == 0:
+        # The first value starts the baseline
+        mean, var = x[0], 0.0
+
+    decay = 1 - ALPHA
+    means = _recurse(ALPHA * x, decay, mean)
+    diffs = x - np.concatenate([[mean], means[:-1]])
+    variances = _recurse(decay * ALPHA * diffs ** 2, decay, var)
+    std = np.maximum(np.sqrt(np.concatenate([[var], variances[:-1]])), min_std)
+    warm = count + np.arange(len(x)) >= WARMUP
+    z[present[warm]] = diffs[warm] / std[warm]
+
+    return z, float(means[-1]), float(variances[-1]), count + len(x)
+
+
+def anomalies(columns, baseline):
+    """
+    Return the anomalies of readings given as a dict of field to values array.
+
+    The baseline is moved on past the readings in place. Readings
+    without anomalies get 0.
+    """
+    flags = np.zeros(len(columns[ANOMALY_FIELDS[0]]), dtype=np.int16)
+    for field in ANOMALY_FIELDS:
+        z, mean, var, count = score(
+            columns[field],
+            getattr(baseline, f'{field}_mean'),
+            getattr(baseline, f'{field}_var'),
+            getattr(baseline, f'{field}_count'),
+            MIN_STD[field],
+        )
+        setattr(baseline, f'{field}_mean', mean)
+        setattr(baseline, f'{field}_var', var)
+        setattr(baseline, f'{field}_count', count)
+        flags |= np.where(np.abs(z) > Z_LIMIT, flag(field), 0).astype(np.int16)
+
+    return flags
+
+
+def _baseline_fields():
+    return [
+        field for field in Baseline._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+
+def _statements(baselines, ids, flags):
+    """Return statements flagging readings and upserting baselines."""
+    statements = []
+    if ids:
+        statements.append((
+            'anomalies_flagged',
+            f'UPDATE {DataPoint._meta.db_table} dp SET anomalies = u.flags '
+            f'FROM unnest(%s::bigint[], %s::smallint[]) AS u(id, flags) '
+            f'WHERE dp.id = u.id',
+            [ids, flags],
+        ))
+    fields = _baseline_fields()
+    columns = [field.column for field in fields]
+    arrays = ', '.join(
+        f'%s::{field.db_type(connection)}[]' for field in fields
+    )
+    statements.append((
+        'baselines_saved',
+        f'INSERT INTO {Baseline._meta.db_table} ({", ".join(columns)}) '
+        f'SELECT * FROM unnest({arrays}) ON CONFLICT (horse_id) DO UPDATE SET '
+        + ', '.join(
+            f'{column} = EXCLUDED.{column}'
+            for column in columns
+            if column != 'horse_id'
+        ),
+        [
+            [
+                field.get_db_prep_save(
+                    getattr(baseline, field.attname), connection,
+                )
+                for baseline in baselines
+            ]
+            for field in fields
+        ],
+    ))
+
+    return statements
+
+
+# Baseline of a horse with written readings (see effects)
+STATE_SQL = (
+    'SELECT '
+    + ', '.join(
+        f'{field.column} AS baseline_{field.column}'
+        for field in _baseline_fields()
+    )
+    + f' FROM {Baseline._meta.db_table} WHERE horse_id = written.horse_id'
+)
+
+
+def evaluate(horses):
+    """Return statements scoring written readings against baselines."""
+    fields = _baseline_fields()
+    baselines = []
+    flagged_ids = []
+    flagged = []
+    for horse in horses:
+        state_at = horse['baseline_state_at']
+        readings = [
+            k for k, date_created in enumerate(horse['dates'])
+            if (state_at is None or date_created > state_at)
+            and any(horse[field][k] is not None for field in ANOMALY_FIELDS)
+        ]
+        if not readings:
+            continue
+        if state_at is None:
+            baseline = Baseline(horse_id=horse['horse_id'])
+        else:
+            baseline = Baseline(**{
+                field.attname: horse[f'baseline_{field.column}']
+                for field in fields
+            })
+        columns = {
+            field: np.array([horse[field][k] for k in readings], dtype=float)
+            for field in ANOMALY_FIELDS
+        }
+        flags = anomalies(columns, baseline)
+        baseline.state_at = horse['dates'][readings[-1]]
+        baselines.append(baseline)
+        for index in np.flatnonzero(flags).tolist():
+            flagged_ids.append(horse['ids'][readings[index]])
+            flagged.append(int(flags[index]))
+
+    if not baselines:
+        return []
+    return _statements(baselines, flagged_ids, flagged)
+
+
+def rebuild(horse):
+    """Recompute a horse's baseline and the anomalies of all its readings."""
+    datapoints = DataPoint.objects.filter(horse=horse)
+    columns = [f'baseline_{field}' for field in ANOMALY_FIELDS]
+    query = datapoints.order_by('date_created').annotate(**{
+        column: Coalesce(Cast(field, FloatField()), Value(float('nan')))
+        for column, field in zip(columns, ANOMALY_FIELDS)
+    }).values_list('id', *columns).query
+    rows = tracks.copy_records(query, COPY_ROW)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {DataPoint._meta.db_table} SET anomalies = NULL '
+            f'WHERE horse_id = %s AND anomalies IS NOT NULL',
+            [horse.id],
+        )
+        if not len(rows):
+            Baseline.objects.filter(horse=horse).delete()
+            return
+        baseline = Baseline(horse=horse)
+        values = {field: rows[field].astype(float) for field in ANOMALY_FIELDS}
+        flags = anomalies(values, baseline)
+        baseline.state_at = datapoints.order_by('-date_created').values_list(
+            'date_created', flat=True,
+        ).first()
+        flagged = np.flatnonzero(flags)
+        statements = _statements(
+            [baseline],
+            rows['id'][flagged].tolist(),
+            flags[flagged].tolist(),
+        )
+        for _, sql, params in statements:
+            cursor.execute(sql, params)
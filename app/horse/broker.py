@@ -0,0 +1,257 @@
+"""
+Publish/subscribe fan-out for live data point streams.
+
+Ingest publishes the ids of committed readings, and each is delivered
+once per channel to every open stream subscribed to the channel, so open
+dashboards do not poll the database. Readings are only loaded in a
+process with subscribers. The broker is chosen with HORSE_STREAM_BROKER;
+the in-process broker only reaches streams served by the same process,
+and PostgresBroker carries readings from any process writing them, such
+as uwsgi workers or the spool flusher, to streams served by another.
+"""
+import asyncio
+import functools
+import logging
+import select
+import threading
+from collections import defaultdict
+
+import psycopg2
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+def datapoint_messages(ids):
+    """Return the (channel, message) pairs of data points with ids."""
+    # horse.stream subscribes through this module
+    from horse import stream
+
+    return stream.messages(ids)
+
+
+class Subscription:
+    """Messages published to a set of channels, read on an event loop."""
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        # Set when the subscriber fell too far behind and was dropped
+        self.overflowed = False
+
+    def deliver(self, message):
+        """Queue a message; called on the subscription's event loop."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.broker.unsubscribe(self)
+
+    async def get(self):
+        """Return the next message, or None once the subscription overflows."""
+        if self.overflowed:
+            return None
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Broker fanning messages out to subscriptions in this process.
+
+    publish may be called from any thread; messages are handed to each
+    subscription's event loop. A subscription whose queue is full is
+    dropped rather than holding up ingest, and its stream ends so the
+    client reconnects and catches up.
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, maxsize=None):
+        """Return a Subscription to channels; must run on an event loop."""
+        subscription = Subscription(
+            self,
+            list(channels),
+            maxsize or settings.HORSE_STREAM_QUEUE_SIZE,
+        )
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def has_subscribers(self):
+        """Return whether any channel has a subscriber."""
+        return bool(self._subscriptions)
+
+    def publish_datapoints(self, ids):
+        """Publish committed data points, if any channel has a subscriber."""
+        if self.has_subscribers():
+            self.publish_many(datapoint_messages(ids))
+
+    def publish_many(self, messages):
+        """Publish (channel, message) pairs in order."""
+        for channel, message in messages:
+            self.publish(channel, message)
+
+    def publish(self, channel, message):
+        """Deliver message to every subscription of channel."""
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.deliver, message,
+                )
+            except RuntimeError:
+                # The subscriber's event loop has closed
+                self.unsubscribe(subscription)
+
+
+class PostgresBroker(InProcessBroker):
+    """
+    Broker fanning data points out through PostgreSQL LISTEN/NOTIFY.
+
+    Publishing data points sends their ids with one statement over the
+    default database connection, as it cannot tell whether any process
+    listens. A process with subscribers LISTENs on a connection of its
+    own in a background thread, loads the data points of each
+    notification and delivers them as the in-process broker does. If that
+    connection drops, every open stream is ended so its client reconnects
+    and replays what it missed. Messages published directly only reach
+    subscribers in this process.
+    """
+    pg_channel = 'horse_stream'
+    # Ids per NOTIFY; a payload must stay under 8000 bytes, and an id and
+    # its comma take up to 20
+    notify_size = 390
+    # Seconds between checks for stop() while no notification arrives
+    poll_timeout = 1
+    reconnect_delay = 5
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+        self._stopped = threading.Event()
+
+    def subscribe(self, channels, maxsize=None):
+        subscription = super().subscribe(channels, maxsize)
+        with self._lock:
+            if self._listener is None:
+                self._stopped.clear()
+                self._listener = threading.Thread(
+                    target=self._listen, daemon=True,
+                )
+                self._listener.start()
+
+        return subscription
+
+    def stop(self):
+        """Stop listening, waiting for the listener thread to finish."""
+        with self._lock:
+            listener, self._listener = self._listener, None
+        self._stopped.set()
+        if listener is not None:
+            listener.join()
+
+    def publish_datapoints(self, ids):
+        """Notify every process of committed data points."""
+        ids = [str(pk) for pk in ids]
+        payloads = [
+            ','.join(ids[start:start + self.notify_size])
+            for start in range(0, len(ids), self.notify_size)
+        ]
+        if not payloads:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, payload) '
+                'FROM unnest(%s::text[]) AS payload',
+                [self.pg_channel, payloads],
+            )
+
+    def _end_streams(self):
+        with self._lock:
+            subscriptions = {
+                subscription
+                for subscribers in self._subscriptions.values()
+                for subscription in subscribers
+            }
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(
+                    subscription.deliver, None,
+                )
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+    def _receive(self, listener):
+        """
+        Deliver notifications until stopped.
+
+        Raises psycopg2.Error if the connection fails.
+        """
+        with listener.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.pg_channel}')
+        while not self._stopped.is_set():
+            if not select.select([listener], [], [], self.poll_timeout)[0]:
+                continue
+            listener.poll()
+            while listener.notifies:
+                payload = listener.notifies.pop(0).payload
+                if self.has_subscribers():
+                    # This thread has no request closing its connection
+                    connection.close_if_unusable_or_obsolete()
+                    self.publish_many(datapoint_messages(
+                        [int(pk) for pk in payload.split(',')]
+                    ))
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            try:
+                listener = psycopg2.connect(
+                    **connection.get_connection_params()
+                )
+            except psycopg2.Error:
+                logger.exception(
+                    'Could not connect to listen for stream messages.'
+                )
+                self._stopped.wait(self.reconnect_delay)
+                continue
+            try:
+                listener.autocommit = True
+                self._receive(listener)
+            except (psycopg2.Error, DatabaseError):
+                logger.exception(
+                    'Lost the connection listening for stream messages.'
+                )
+                self._end_streams()
+            finally:
+                listener.close()
+        connection.close()
+
+
+@functools.lru_cache(maxsize=None)
+def get_broker():
+    """Return the process wide broker named by HORSE_STREAM_BROKER."""
+    return import_string(settings.HORSE_STREAM_BROKER)()
@@ -0,0 +1,58 @@
+"""
+Conditional GET support for the horse APIs.
+
+List responses carry an ETag derived from version counters: a per user
+horse version, bumped whenever one of the user's horses changes, and a
+per horse data version, bumped whenever one of the horse's data points is
+written, edited or deleted by the UPDATE that also moves its latest
+reading (see snapshots). Checking them costs one small query, so
+unchanged lists are answered with 304 Not Modified without running the
+list query or serializing anything. There is no Last-Modified: its whole
+seconds cannot tell apart writes made within the same second.
+"""
+import functools
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+
+# SET clause bumping the data version in an UPDATE of horses aliased h
+DATA_VERSION_BUMP = 'data_version = h.data_version + 1'
+
+
+def touch_user(user_id):
+    """Bump the horse version of a user whose horses changed."""
+    get_user_model().objects.filter(pk=user_id).update(
+        horse_version=F('horse_version') + 1,
+    )
+
+
+def conditional_list(method):
+    """
+    Answer conditional GETs of a list method.
+
+    The view's get_list_version(request) returns the list's version.
+    The ETag hashes the version with the request path and accepted media
+    type, so every filter, page and format has its own.
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        version = self.get_list_version(request)
+        key = '|'.join([
+            str(version), request.get_full_path(), request.accepted_media_type,
+        ])
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+
+        return response
+
+    return wrapper
@@ -1,11 +1,116 @@
-from rest_framework.authentication import BaseAuthentication
+"""
+Authentication for horse collar devices.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import (
+    BaseAuthentication,
+    get_authorization_header,
+)
 from rest_framework.exceptions import AuthenticationFailed
 
+from core.models import Horse
+
+
+class DeviceKeyCache:
+    """Bounded LRU cache of api_key to horse entries with a time to live."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, api_key):
+        """Return the cached horse for api_key, or None."""
+        with self._lock:
+            entry = self._entries.get(api_key)
+            if entry is None:
+                return None
+            horse, expires = entry
+            if expires < time.monotonic():
+                del self._entries[api_key]
+                return None
+            self._entries.move_to_end(api_key)
+            return horse
+
+    def set(self, api_key, horse):
+        """Cache horse under api_key, dropping the least recently used."""
+        with self._lock:
+            self._entries[api_key] = (horse, time.monotonic() + self.ttl)
+            self._entries.move_to_end(api_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict_horse(self, horse_id):
+        """Drop any entry for the horse, whatever key it was cached under."""
+        with self._lock:
+            for api_key, (horse, _) in list(self._entries.items()):
+                if horse.id == horse_id:
+                    del self._entries[api_key]
+
+    def evict_user(self, user_id):
+        """Drop the entries of every horse owned by the user."""
+        with self._lock:
+            for api_key, (horse, _) in list(self._entries.items()):
+                if horse.user_id == user_id:
+                    del self._entries[api_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+device_key_cache = DeviceKeyCache(
+    max_size=settings.DEVICE_KEY_CACHE_SIZE,
+    ttl=settings.DEVICE_KEY_CACHE_TTL,
+)
+
+
+class DeviceAPIKeyAuthentication(BaseAuthentication):
+    """
+    Authenticate a collar by its horse api_key.
+
+    Clients send "Authorization: Api-Key <api_key>". The request is
+    authenticated as the horse's owner and request.auth is the horse.
+    Lookups are cached per process; signals in horse.signals evict entries
+    when a horse or its owner changes, and DEVICE_KEY_CACHE_TTL bounds how
+    long other worker processes keep accepting a replaced key. Ingest locks
+    the horse before writing, so a deleted horse is refused then.
+    """
+    keyword = 'Api-Key'
 
-class CustomAuthentication(BaseAuthentication):
     def authenticate(self, request):
-        if request.method == 'POST':
-            request.user = None
-            return None  # success, no authentication necessary
-        else:
-            raise AuthenticationFailed('Authentication credentials were not provided.')
\ No newline at end of file
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid api key header.')
+        try:
+            api_key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed('Invalid api key header.')
+
+        return self.authenticate_credentials(api_key)
+
+    def authenticate_credentials(self, api_key):
+        horse = device_key_cache.get(api_key)
+        if horse is None:
+            try:
+                horse = Horse.objects.select_related('user').get(
+                    api_key=api_key,
+                )
+            except Horse.DoesNotExist:
+                raise AuthenticationFailed('Invalid API key.')
+            device_key_cache.set(api_key, horse)
+
+        if not horse.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+
+        return (horse.user, horse)
+
+    def authenticate_header(self, request):
+        return self.keyword
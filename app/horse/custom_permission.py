@@ -1,8 +1,19 @@
 from rest_framework.permissions import BasePermission
 
-class CustomPermission(BasePermission):
+from core.models import Horse
+
+
+class IsDeviceIngestOrAuthenticated(BasePermission):
+    """
+    Allow collar devices to call the view's ingest actions only.
+
+    Requests authenticated with a horse api_key may only run the actions
+    listed in the view's device_actions; any other request needs an
+    authenticated user.
+    """
+
     def has_permission(self, request, view):
-        if request.method == 'POST':
-            return True
-        else:
-            return request.user and request.user.is_authenticated
\ No newline at end of file
+        if isinstance(request.auth, Horse):
+            return view.action in getattr(view, 'device_actions', [])
+
+        return bool(request.user and request.user.is_authenticated)
@@ -0,0 +1,106 @@
+"""
+Side effects of written data points, in as few statements as possible.
+
+Every statement that writes data points hands its rows to written() in
+the ingest transaction, where the horse rows are already locked. One
+query reads the written readings of each horse, oldest first, together
+with the state of its geofences, alert rules and baseline. These are
+evaluated in memory, and the statements saving their changes run as a
+single statement with the rollup, latest reading, data version and
+movement summary updates. Loading compiled geofences that are not
+cached is the only other query.
+
+Data points saved or deleted with the ORM only change the summaries,
+which changed() updates with one statement.
+"""
+from django.db import connection
+
+from core.models import DataPoint
+from horse import alerts, baselines, geofences, movement, rollups, snapshots
+
+
+# Modules evaluating written readings against the state of their horses.
+# Each has a STATE_SQL subquery of the state of the horse with readings
+# written, and evaluate(horses) returning the statements saving changes.
+EVALUATIONS = [geofences, alerts, baselines]
+READING_FIELDS = ['gps_lat', 'gps_long', 'temp', 'hr', 'hr_interval', 'batt']
+
+
+def run(cursor, statements):
+    """
+    Run (name, sql, params) data-modifying statements as one statement.
+
+    Each becomes a WITH query called name, so later ones can read what
+    earlier ones return. All see the tables as they were before, so no
+    two may change the same row.
+    """
+    if not statements:
+        return
+    queries = ', '.join(f'{name} AS ({sql})' for name, sql, _ in statements)
+    cursor.execute(
+        f'WITH {queries} SELECT 1',
+        [param for _, _, params in statements for param in params],
+    )
+
+
+def read(cursor, ids):
+    """
+    Return a dict per horse of the readings ids and the horse's state.
+
+    Readings are arrays oldest first: ids, dates, positioned and one per
+    READING_FIELDS field. The state columns are each evaluation's.
+    """
+    arrays = [('id', 'ids'), ('date_created', 'dates')]
+    arrays += [(field, field) for field in READING_FIELDS]
+    selects = [
+        f'array_agg(dp.{column} ORDER BY dp.date_created) AS {name}'
+        for column, name in arrays
+    ]
+    selects.append(
+        'array_agg(dp.geocell IS NOT NULL ORDER BY dp.date_created) '
+        'AS positioned'
+    )
+    states = ' '.join(
+        f'LEFT JOIN LATERAL ({evaluation.STATE_SQL}) s{k} ON true'
+        for k, evaluation in enumerate(EVALUATIONS)
+    )
+    cursor.execute(
+        f'SELECT * FROM (SELECT horse_id, user_id, {", ".join(selects)} '
+        f'FROM {DataPoint._meta.db_table} dp WHERE id = ANY(%s) '
+        f'GROUP BY horse_id, user_id) written '
+        f'{states} ORDER BY written.horse_id',
+        [list(ids)],
+    )
+    columns = [column.name for column in cursor.description]
+
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def written(rows):
+    """Apply the side effects of rows written by an ingest statement."""
+    ids = [pk for pk, _, _, _ in rows]
+    keys = [(horse_id, date_created) for _, horse_id, date_created, _ in rows]
+    if all(inserted for _, _, _, inserted in rows):
+        statements = rollups.add_statements(ids)
+    else:
+        # Adding to a bucket and recomputing it would change one row twice
+        statements = rollups.refresh_statements(keys)
+    statements.append(snapshots.advance_statement(ids))
+    statements += movement.invalidate_statements(keys)
+    with connection.cursor() as cursor:
+        horses = read(cursor, ids)
+        for evaluation in EVALUATIONS:
+            statements += evaluation.evaluate(horses)
+        run(cursor, statements)
+
+
+def changed(keys):
+    """Update the summaries of (horse_id, date_created) readings changed."""
+    keys = set(keys)
+    statements = rollups.refresh_statements(keys)
+    statements.append(
+        snapshots.refresh_statement({horse_id for horse_id, _ in keys})
+    )
+    statements += movement.invalidate_statements(keys)
+    with connection.cursor() as cursor:
+        run(cursor, statements)
@@ -0,0 +1,83 @@
+"""
+Streaming export of data points as CSV or newline delimited JSON.
+
+Rows are read through a server side cursor with iterator() and encoded
+a chunk at a time, so memory use does not depend on the export size.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.utils import timezone
+
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('api_key', 'horse__api_key'),
+    ('horse_name', 'horse__name'),
+    ('date_created', 'date_created'),
+    ('hr', 'hr'),
+    ('hr_interval', 'hr_interval'),
+    ('gps_lat', 'gps_lat'),
+    ('gps_long', 'gps_long'),
+    ('temp', 'temp'),
+    ('batt', 'batt'),
+    ('anomalies', 'anomalies'),
+]
+NAMES = [name for name, _ in EXPORT_FIELDS]
+
+
+def _chunks(queryset, chunk_size):
+    """Yield lists of value tuples from a server side cursor."""
+    rows = queryset.values_list(
+        *[lookup for _, lookup in EXPORT_FIELDS]
+    ).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _value(value):
+    """Return a value as the data point API renders it."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+
+    return value
+
+
+def _values(row):
+    return [_value(value) for value in row]
+
+
+def iter_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a CSV export of a data point queryset, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(NAMES)
+    for chunk in _chunks(queryset, chunk_size):
+        writer.writerows(_values(row) for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # An empty export still has its header
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a newline delimited JSON export of a data point queryset."""
+    for chunk in _chunks(queryset, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(NAMES, _values(row)))) + '\n'
+            for row in chunk
+        )
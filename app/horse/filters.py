@@ -1,5 +1,69 @@
+import math
+
 import django_filters
-from core.models import DataPoint
+from django import forms
+from django.db.models import F
+
+from core.models import Horse, DataPoint, GeofenceEvent, Alert
+from horse import baselines, geo
+
+
+class CoordinatesField(forms.CharField):
+    """Comma separated numbers, cleaned to a list of floats."""
+    count = None
+
+    def clean(self, value):
+        value = super().clean(value)
+        if not value:
+            return None
+        try:
+            numbers = [float(part) for part in value.split(',')]
+        except ValueError:
+            raise forms.ValidationError('Enter comma separated numbers.')
+        finite = all(math.isfinite(n) for n in numbers)
+        if len(numbers) != self.count or not finite:
+            raise forms.ValidationError(
+                f'Enter {self.count} comma separated numbers.'
+            )
+        self.validate_numbers(*numbers)
+
+        return numbers
+
+    def validate_position(self, lat, long):
+        if not geo.valid_position(lat, long):
+            raise forms.ValidationError(
+                'Latitudes must be within ±90 and longitudes within ±180.'
+            )
+
+
+class BoundingBoxField(CoordinatesField):
+    """min_lat,min_long,max_lat,max_long"""
+    count = 4
+
+    def validate_numbers(self, min_lat, min_long, max_lat, max_long):
+        self.validate_position(min_lat, min_long)
+        self.validate_position(max_lat, max_long)
+        if min_lat > max_lat or min_long > max_long:
+            raise forms.ValidationError('Minimums must not exceed maximums.')
+
+
+class CircleField(CoordinatesField):
+    """lat,long,meters"""
+    count = 3
+
+    def validate_numbers(self, lat, long, meters):
+        self.validate_position(lat, long)
+        if meters <= 0:
+            raise forms.ValidationError('The radius must be positive.')
+
+
+class BoundingBoxFilter(django_filters.Filter):
+    field_class = BoundingBoxField
+
+
+class CircleFilter(django_filters.Filter):
+    field_class = CircleField
+
 
 class DataPointFilter(django_filters.FilterSet):
     horse__api_key = django_filters.CharFilter(field_name='horse__api_key')
@@ -7,13 +71,119 @@ class DataPointFilter(django_filters.FilterSet):
     date_created__lte = django_filters.DateTimeFilter(field_name='date_created', lookup_expr='lte')
     date_created__lt = django_filters.DateTimeFilter(field_name='date_created', lookup_expr='lt')
     date_created__gt = django_filters.DateTimeFilter(field_name='date_created', lookup_expr='gt')
+    bbox = BoundingBoxFilter(
+        method='filter_bbox',
+        help_text='Readings within min_lat,min_long,max_lat,max_long.',
+    )
+    near = CircleFilter(
+        method='filter_near',
+        help_text='Readings within lat,long,meters, by great circle distance.',
+    )
+    anomaly = django_filters.BooleanFilter(
+        method='filter_anomaly',
+        help_text="Readings flagged, or not, against their horse's baseline.",
+    )
+    anomaly_field = django_filters.ChoiceFilter(
+        choices=[(field, field) for field in baselines.ANOMALY_FIELDS],
+        method='filter_anomaly_field',
+        help_text='Readings flagged for this field.',
+    )
 
     class Meta:
         model = DataPoint
         fields = [
-            'horse__api_key', 
+            'horse__api_key',
             'date_created__lt',
             'date_created__lte',
             'date_created__gt',
             'date_created__gte',
-            ]
\ No newline at end of file
+            'bbox',
+            'near',
+            'anomaly',
+            'anomaly_field',
+            ]
+
+    def filter_cells(self, queryset, min_lat, min_long, max_lat, max_long):
+        """Narrow to readings in the geocells covering a bounding box."""
+        queryset = queryset.filter(
+            geo.cover_q(min_lat, min_long, max_lat, max_long),
+        )
+        if self.request is not None and not self.data.get('horse__api_key'):
+            # Name the horses so the planner can use the per horse cell index
+            horses = Horse.objects.filter(user=self.request.user)
+            queryset = queryset.filter(horse__in=horses)
+
+        return queryset
+
+    def filter_bbox(self, queryset, name, value):
+        min_lat, min_long, max_lat, max_long = value
+
+        return self.filter_cells(queryset, *value).filter(
+            gps_lat__gte=min_lat,
+            gps_lat__lte=max_lat,
+            gps_long__gte=min_long,
+            gps_long__lte=max_long,
+        )
+
+    def filter_near(self, queryset, name, value):
+        lat, long, meters = value
+
+        bounds = geo.circle_bounds(lat, long, meters)
+
+        return self.filter_cells(queryset, *bounds).alias(
+            distance=geo.distance_expression(lat, long),
+        ).filter(distance__lte=meters)
+
+    def filter_anomaly(self, queryset, name, value):
+        # Flagged readings are served by the partial datapoint_anomaly_idx
+        return queryset.filter(anomalies__isnull=not value)
+
+    def filter_anomaly_field(self, queryset, name, value):
+        return queryset.alias(
+            anomaly_bit=F('anomalies').bitand(baselines.flag(value)),
+        ).filter(anomalies__isnull=False, anomaly_bit__gt=0)
+
+
+class GeofenceEventFilter(django_filters.FilterSet):
+    horse__api_key = django_filters.CharFilter(field_name='horse__api_key')
+    date_created__gte = django_filters.DateTimeFilter(
+        field_name='date_created', lookup_expr='gte',
+    )
+    date_created__lt = django_filters.DateTimeFilter(
+        field_name='date_created', lookup_expr='lt',
+    )
+
+    class Meta:
+        model = GeofenceEvent
+        fields = [
+            'horse__api_key',
+            'fence',
+            'kind',
+            'date_created__gte',
+            'date_created__lt',
+            ]
+
+
+class AlertFilter(django_filters.FilterSet):
+    horse__api_key = django_filters.CharFilter(field_name='horse__api_key')
+    # open=true lists the alerts that have not cleared
+    open = django_filters.BooleanFilter(
+        field_name='date_closed', lookup_expr='isnull',
+    )
+    date_created__gte = django_filters.DateTimeFilter(
+        field_name='date_created', lookup_expr='gte',
+    )
+    date_created__lt = django_filters.DateTimeFilter(
+        field_name='date_created', lookup_expr='lt',
+    )
+
+    class Meta:
+        model = Alert
+        fields = [
+            'horse__api_key',
+            'rule',
+            'kind',
+            'open',
+            'date_created__gte',
+            'date_created__lt',
+            ]
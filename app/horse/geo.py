@@ -0,0 +1,187 @@
+"""
+Grid cell spatial indexing of GPS readings without PostGIS.
+
+Each reading with a valid position stores a geocell: its latitude and
+longitude scaled to 26 bit integers and interleaved bit by bit (a Morton,
+or integer geohash, code). Nearby positions share leading bits, so the
+readings inside any square of the quadtree grid form one contiguous range
+of geocells. An area is searched by covering it with a few grid squares,
+scanning their geocell ranges with the (horse, geocell, date_created)
+index and refining the candidates with exact bounds or haversine distance.
+"""
+import math
+
+import numpy as np
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import (
+    ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt,
+)
+
+
+GEOCELL_BITS = 26
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+_SCALE = 1 << GEOCELL_BITS
+_SPREAD = [
+    (16, 0x0000FFFF0000FFFF),
+    (8, 0x00FF00FF00FF00FF),
+    (4, 0x0F0F0F0F0F0F0F0F),
+    (2, 0x3333333333333333),
+    (1, 0x5555555555555555),
+]
+
+
+def _spread(value):
+    """Move the bits of value to the even bit positions."""
+    for shift, mask in _SPREAD:
+        value = (value | (value << shift)) & mask
+    return value
+
+
+def _grid(lat, long):
+    """Return the integer grid row and column of a position."""
+    row = min(int((lat + 90) / 180 * _SCALE), _SCALE - 1)
+    column = min(int((long + 180) / 360 * _SCALE), _SCALE - 1)
+    return row, column
+
+
+def valid_position(lat, long):
+    return (
+        lat is not None and long is not None
+        and -90 <= lat <= 90 and -180 <= long <= 180
+    )
+
+
+def encode(lat, long):
+    """Return the geocell of a position, or None if missing or invalid."""
+    if not valid_position(lat, long):
+        return None
+    row, column = _grid(float(lat), float(long))
+
+    return (_spread(row) << 1) | _spread(column)
+
+
+def encode_array(lats, longs):
+    """
+    Return the geocells of float arrays of positions.
+
+    Missing (NaN) and out of range positions get None.
+    """
+    lats = np.asarray(lats, dtype=float)
+    longs = np.asarray(longs, dtype=float)
+    with np.errstate(invalid='ignore'):
+        valid = (np.abs(lats) <= 90) & (np.abs(longs) <= 180)
+    rows = (np.where(valid, lats, 0) + 90) / 180 * _SCALE
+    columns = (np.where(valid, longs, 0) + 180) / 360 * _SCALE
+    rows = np.minimum(rows.astype(np.uint64), _SCALE - 1)
+    columns = np.minimum(columns.astype(np.uint64), _SCALE - 1)
+    for shift, mask in _SPREAD:
+        rows = (rows | (rows << np.uint64(shift))) & np.uint64(mask)
+        columns = (columns | (columns << np.uint64(shift))) & np.uint64(mask)
+    cells = (rows << np.uint64(1)) | columns
+
+    return [
+        int(cell) if ok else None
+        for cell, ok in zip(cells.tolist(), valid.tolist())
+    ]
+
+
+def cover(min_lat, min_long, max_lat, max_long):
+    """
+    Return inclusive geocell ranges covering a bounding box.
+
+    Uses the smallest grid squares that cover the box with at most
+    MAX_COVER_CELLS squares; adjacent ranges are merged.
+    """
+    row0, column0 = _grid(max(min_lat, -90), max(min_long, -180))
+    row1, column1 = _grid(min(max_lat, 90), min(max_long, 180))
+    for shift in range(GEOCELL_BITS + 1):
+        rows = range(row0 >> shift, (row1 >> shift) + 1)
+        columns = range(column0 >> shift, (column1 >> shift) + 1)
+        if len(rows) * len(columns) <= MAX_COVER_CELLS:
+            break
+
+    ranges = []
+    width = 2 * shift
+    squares = sorted(
+        (_spread(row) << 1) | _spread(column)
+        for row in rows for column in columns
+    )
+    for square in squares:
+        start, end = square << width, ((square + 1) << width) - 1
+        if ranges and ranges[-1][1] + 1 == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+
+    return ranges
+
+
+def cover_q(min_lat, min_long, max_lat, max_long):
+    """
+    Return a Q matching readings in the geocells covering a bounding box.
+
+    The range spanning the whole cover comes first: Postgres does not
+    combine an OR of ranges with the horse into one index condition, but
+    it does scan this range with the (horse, geocell) index prefix.
+    """
+    ranges = cover(min_lat, min_long, max_lat, max_long)
+    condition = Q()
+    for start, end in ranges:
+        condition |= Q(geocell__range=(start, end))
+
+    return Q(geocell__range=(ranges[0][0], ranges[-1][1])) & condition
+
+
+def circle_bounds(lat, long, meters):
+    """
+    Return the (min_lat, min_long, max_lat, max_long) box around a circle.
+
+    Circles reaching a pole or crossing the antimeridian get every
+    longitude, as covers do not wrap around.
+    """
+    angle = meters / EARTH_RADIUS_M
+    delta_lat = math.degrees(angle)
+    if abs(lat) + delta_lat >= 90:
+        delta_long = 180
+    else:
+        delta_long = math.degrees(
+            math.asin(math.sin(angle) / math.cos(math.radians(lat)))
+        )
+    if delta_long >= 180 - abs(long):
+        return lat - delta_lat, -180, lat + delta_lat, 180
+
+    return (
+        lat - delta_lat, long - delta_long,
+        lat + delta_lat, long + delta_long,
+    )
+
+
+def distance_expression(lat, long):
+    """Return an expression of readings' distance in meters to a point."""
+    lat_rad = Radians(Cast(F('gps_lat'), FloatField()))
+    long_rad = Radians(Cast(F('gps_long'), FloatField()))
+    half_chord = (
+        Power(Sin((lat_rad - math.radians(lat)) / 2), 2)
+        + math.cos(math.radians(lat)) * Cos(lat_rad)
+        * Power(Sin((long_rad - math.radians(long)) / 2), 2)
+    )
+
+    # Rounding can take the half chord of nearly antipodal points above 1
+    return 2 * EARTH_RADIUS_M * ASin(Sqrt(Least(half_chord, Value(1.0))))
+
+
+def haversine(lat1, long1, lat2, long2):
+    """Return the haversine distances in meters between arrays of positions."""
+    lat1, long1, lat2, long2 = (
+        np.radians(np.asarray(a, dtype=float))
+        for a in (lat1, long1, lat2, long2)
+    )
+    half_chord = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(half_chord, 1)))
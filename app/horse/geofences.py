@@ -0,0 +1,250 @@
+"""
+Geofence evaluation of ingested readings.
+
+Every statement that writes data points has its readings, read together
+with the state of their horses' fences, passed to evaluate() in the
+ingest transaction, where the horse rows are already locked (see
+effects). Each fence stores whether its horse's latest evaluated reading
+was inside it, so a batch is checked against the fences of its horses
+with a vectorized point in polygon test and only the readings that cross
+a boundary are recorded as GeofenceEvents. Readings no newer than the
+last evaluated one are not evaluated, so late arrivals never rewrite
+recorded history.
+
+Compiled fence geometry is cached per process and per horse, keyed by
+each fence's modified time, so edits made by any process are picked up
+on the next evaluation.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from core.models import Geofence, GeofenceEvent
+
+
+MIN_VERTICES = 3
+MAX_VERTICES = 1000
+# Readings tested against a fence at once; bounds the (readings, edges) arrays
+CHUNK_SIZE = 4096
+
+
+class CompiledFence:
+    """Edge arrays of a polygon, ready for vectorized containment tests."""
+
+    def __init__(self, vertices):
+        points = np.asarray(vertices, dtype=float)
+        self.min_lat, self.min_long = points.min(axis=0)
+        self.max_lat, self.max_long = points.max(axis=0)
+        lats, longs = points[:, 0], points[:, 1]
+        next_lats, next_longs = np.roll(lats, -1), np.roll(longs, -1)
+        # Horizontal edges are never crossed, so their slope is unused
+        rise = np.where(next_lats == lats, 1, next_lats - lats)
+        self.lats = lats
+        self.next_lats = next_lats
+        self.longs = longs
+        self.slopes = (next_longs - longs) / rise
+
+    def contains(self, lats, longs):
+        """
+        Return a boolean array of which positions are inside the polygon.
+
+        Counts the edges a ray cast from each position towards increasing
+        longitude crosses (even-odd rule), treating degrees as a plane.
+        """
+        lats = np.asarray(lats, dtype=float)
+        longs = np.asarray(longs, dtype=float)
+        inside = (
+            (lats >= self.min_lat) & (lats <= self.max_lat)
+            & (longs >= self.min_long) & (longs <= self.max_long)
+        )
+        candidates = np.flatnonzero(inside)
+        for start in range(0, len(candidates), CHUNK_SIZE):
+            chunk = candidates[start:start + CHUNK_SIZE]
+            lat = lats[chunk, np.newaxis]
+            straddles = (self.lats > lat) != (self.next_lats > lat)
+            crossing = self.longs + (lat - self.lats) * self.slopes
+            left = longs[chunk, np.newaxis] < crossing
+            crossings = np.count_nonzero(straddles & left, axis=1)
+            inside[chunk] = crossings % 2 == 1
+
+        return inside
+
+
+class FenceCache:
+    """Bounded LRU cache of horse id to {fence id: (modified, fence)}."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, horse_id):
+        """Return the cached fences of a horse, or an empty dict."""
+        with self._lock:
+            fences = self._entries.get(horse_id)
+            if fences is None:
+                return {}
+            self._entries.move_to_end(horse_id)
+            return fences
+
+    def set(self, horse_id, fences):
+        """Cache the compiled fences of a horse, evicting the oldest used."""
+        with self._lock:
+            self._entries[horse_id] = fences
+            self._entries.move_to_end(horse_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fence_cache = FenceCache(max_size=settings.GEOFENCE_CACHE_SIZE)
+
+
+def compiled_fences(fences):
+    """
+    Return {fence id: CompiledFence} for (id, horse_id, modified) rows.
+
+    Only fences missing from the cache or modified since they were cached
+    are loaded and compiled; cached fences no longer listed are dropped.
+    """
+    by_horse = {}
+    for fence_id, horse_id, modified in fences:
+        by_horse.setdefault(horse_id, {})[fence_id] = modified
+
+    cached = {horse_id: fence_cache.get(horse_id) for horse_id in by_horse}
+    stale = [
+        fence_id
+        for horse_id, fences in by_horse.items()
+        for fence_id, modified in fences.items()
+        if cached[horse_id].get(fence_id, (None,))[0] != modified
+    ]
+    loaded = {}
+    if stale:
+        loaded = {
+            fence_id: (modified, CompiledFence(vertices))
+            for fence_id, modified, vertices in Geofence.objects.filter(
+                id__in=stale,
+            ).values_list('id', 'modified', 'vertices')
+        }
+
+    compiled = {}
+    for horse_id, fences in by_horse.items():
+        entries = {
+            fence_id: loaded.get(fence_id) or cached[horse_id][fence_id]
+            for fence_id in fences
+        }
+        fence_cache.set(horse_id, entries)
+        compiled.update(
+            {fence_id: entry[1] for fence_id, entry in entries.items()}
+        )
+
+    return compiled
+
+
+# Fence state of a horse with written readings (see effects)
+STATE_SQL = (
+    'SELECT array_agg(id ORDER BY id) AS fence_ids, '
+    'array_agg(modified ORDER BY id) AS fence_modified, '
+    'array_agg(inside ORDER BY id) AS fence_inside, '
+    'array_agg(state_at ORDER BY id) AS fence_state_at '
+    f'FROM {Geofence._meta.db_table} WHERE horse_id = written.horse_id'
+)
+
+
+def _candidates(horses):
+    """
+    Return (fence id, horse_id, modified, inside, readings) per fence.
+
+    readings are the (id, date_created, gps_lat, gps_long) of the
+    horse's written positioned readings newer than the fence state,
+    oldest first. Fences without any are left out.
+    """
+    fences = []
+    for horse in horses:
+        positioned = [
+            (pk, date_created, lat, long)
+            for pk, date_created, lat, long, valid in zip(
+                horse['ids'], horse['dates'], horse['gps_lat'],
+                horse['gps_long'], horse['positioned'],
+            )
+            if valid
+        ]
+        states = zip(
+            horse['fence_ids'] or [],
+            horse['fence_modified'] or [],
+            horse['fence_inside'] or [],
+            horse['fence_state_at'] or [],
+        )
+        for fence_id, modified, inside, state_at in states:
+            readings = [
+                reading for reading in positioned
+                if state_at is None or reading[1] > state_at
+            ]
+            if readings:
+                fences.append(
+                    (fence_id, horse['horse_id'], modified, inside, readings)
+                )
+
+    return fences
+
+
+def evaluate(horses):
+    """
+    Return statements recording the geofence transitions of written readings.
+
+    Readings without a valid position are skipped. The first reading
+    evaluated against a new or reshaped fence only sets its state.
+    """
+    fences = _candidates(horses)
+    if not fences:
+        return []
+
+    compiled = compiled_fences([
+        (fence_id, horse_id, modified)
+        for fence_id, horse_id, modified, _, _ in fences
+    ])
+    events = []
+    states = []
+    for fence_id, horse_id, _, inside, readings in fences:
+        pks, dates, lats, longs = zip(*readings)
+        sides = compiled[fence_id].contains(
+            np.array(lats, dtype=float),
+            np.array(longs, dtype=float),
+        )
+        previous = np.concatenate(
+            [[sides[0] if inside is None else inside], sides[:-1]]
+        )
+        for index in np.flatnonzero(sides != previous).tolist():
+            kind = GeofenceEvent.ENTER if sides[index] else GeofenceEvent.EXIT
+            events.append(
+                (fence_id, horse_id, pks[index], kind, dates[index])
+            )
+        states.append((fence_id, bool(sides[-1]), dates[-1]))
+
+    statements = []
+    if events:
+        columns = ['fence_id', 'horse_id', 'datapoint_id', 'kind',
+                   'date_created']
+        types = ['bigint', 'bigint', 'bigint', 'varchar', 'timestamptz']
+        statements.append((
+            'geofence_events',
+            f'INSERT INTO {GeofenceEvent._meta.db_table} '
+            f'({", ".join(columns)}) SELECT * FROM '
+            f'unnest({", ".join(f"%s::{t}[]" for t in types)})',
+            [list(values) for values in zip(*events)],
+        ))
+    statements.append((
+        'geofence_states',
+        f'UPDATE {Geofence._meta.db_table} f '
+        f'SET inside = u.inside, state_at = u.state_at '
+        f'FROM unnest(%s::bigint[], %s::boolean[], %s::timestamptz[]) '
+        f'AS u(id, inside, state_at) WHERE f.id = u.id',
+        [list(values) for values in zip(*states)],
+    ))
+
+    return statements
@@ -0,0 +1,381 @@
+"""
+Bulk ingest helpers for horse data points.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import (
+    Horse,
+    DataPoint,
+)
+from horse import geo
+
+
+BATCH_MAX_SIZE = 5000
+# An API batch is always written with a single statement
+INSERT_BATCH_SIZE = BATCH_MAX_SIZE
+COPY_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+STAGING_TABLE = 'datapoint_upload'
+
+VALUE_FIELDS = ['gps_lat', 'gps_long', 'temp', 'hr', 'hr_interval', 'batt']
+COPY_COLUMNS = (
+    ['horse_id', 'user_id', 'date_created'] + VALUE_FIELDS + ['geocell']
+)
+CONFLICT_COLUMNS = ['horse_id', 'date_created']
+
+ON_CONFLICT_CHOICES = ['ignore', 'update']
+CREATED = 'created'
+UPDATED = 'updated'
+DUPLICATE = 'duplicate'
+
+# Sent inside the ingest transaction after every statement that writes
+# data points, with an (id, horse_id, date_created, inserted) tuple per
+# written row; inserted is False for rows that overwrote a reading.
+datapoints_written = Signal()
+
+
+class UnknownHorses(Exception):
+    """Raised when horses about to get data points no longer exist."""
+
+    def __init__(self, horse_ids):
+        super().__init__(f'Unknown horses: {sorted(horse_ids)}')
+        self.horse_ids = horse_ids
+
+
+def resolve_horses(api_keys, user):
+    """Return a dict of api_key to horse for the user's horses."""
+    horses = Horse.objects.filter(user=user, api_key__in=set(api_keys))
+
+    return {horse.api_key: horse for horse in horses}
+
+
+def _insert_fields():
+    return [
+        field for field in DataPoint._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+
+def _on_conflict_sql(on_conflict):
+    """
+    Return the ON CONFLICT clause for the (horse, date_created) key.
+
+    An update overwrites every column, so those a statement does not
+    insert, such as anomalies, go back to their defaults.
+    """
+    target = ', '.join(CONFLICT_COLUMNS)
+    if on_conflict == 'update':
+        updates = ', '.join(
+            f'{field.column} = EXCLUDED.{field.column}'
+            for field in _insert_fields()
+            if field.column not in CONFLICT_COLUMNS
+        )
+        return f'ON CONFLICT ({target}) DO UPDATE SET {updates}'
+
+    return f'ON CONFLICT ({target}) DO NOTHING'
+
+
+def lock_horses(cursor, horse_ids):
+    """
+    Lock the horses about to get data points until the transaction ends.
+
+    A horse's data points then commit in id order, which delta sync relies
+    on. Rows are locked in id order so concurrent writers cannot deadlock.
+    Raises UnknownHorses when some were deleted, for example after a
+    cached device credential was looked up.
+    """
+    if horse_ids:
+        horse_ids = set(horse_ids)
+        cursor.execute(
+            f'SELECT id FROM {Horse._meta.db_table} '
+            f'WHERE id = ANY(%s) ORDER BY id FOR UPDATE',
+            [sorted(horse_ids)],
+        )
+        missing = horse_ids - {horse_id for horse_id, in cursor.fetchall()}
+        if missing:
+            raise UnknownHorses(missing)
+
+
+def _float(value):
+    return float('nan') if value is None else float(value)
+
+
+def _geocells(positions):
+    """Return the geocells of (gps_lat, gps_long) pairs, computed together."""
+    if not positions:
+        return []
+    lats, longs = zip(*(
+        (_float(lat), _float(long)) for lat, long in positions
+    ))
+
+    return geo.encode_array(lats, longs)
+
+
+def _send_written(returned):
+    """Send datapoints_written for rows returned by an ingest statement."""
+    if returned:
+        datapoints_written.send(sender=DataPoint, rows=returned)
+
+
+def save_datapoints(datapoints, on_conflict='ignore'):
+    """
+    Upsert data points keyed on (horse, date_created) in one transaction.
+
+    Each chunk is a single INSERT ... ON CONFLICT statement, so duplicates
+    are skipped, or overwrite the stored reading when on_conflict is
+    'update', without reading first. Written instances get their id set.
+    Returns the outcome (CREATED, UPDATED or DUPLICATE) of each data point.
+    """
+    fields = _insert_fields()
+    columns = [field.column for field in fields]
+    arrays = ', '.join(
+        f'%s::{field.db_type(connection)}[]' for field in fields
+    )
+    sql = (
+        f'INSERT INTO {DataPoint._meta.db_table} ({", ".join(columns)}) '
+        f'SELECT * FROM unnest({arrays}) {_on_conflict_sql(on_conflict)} '
+        f'RETURNING id, horse_id, date_created, (xmax = 0) AS inserted'
+    )
+
+    # One row per key and statement; later readings win only when updating
+    keyed = {}
+    for dp in datapoints:
+        key = (dp.horse_id, dp.date_created)
+        if on_conflict == 'update' or key not in keyed:
+            keyed[key] = dp
+    rows = list(keyed.values())
+    geocells = _geocells([(dp.gps_lat, dp.gps_long) for dp in rows])
+    for dp, geocell in zip(rows, geocells):
+        dp.geocell = geocell
+
+    written = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        lock_horses(cursor, [dp.horse_id for dp in rows])
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            chunk = rows[start:start + INSERT_BATCH_SIZE]
+            cursor.execute(sql, [
+                [
+                    field.get_db_prep_save(
+                        getattr(dp, field.attname), connection,
+                    )
+                    for dp in chunk
+                ]
+                for field in fields
+            ])
+            returned = cursor.fetchall()
+            for pk, horse_id, date_created, inserted in returned:
+                written[(horse_id, date_created)] = (pk, inserted)
+            _send_written(returned)
+
+    outcomes = []
+    for dp in datapoints:
+        key = (dp.horse_id, dp.date_created)
+        if key in written and keyed[key] is dp:
+            dp.pk, inserted = written[key]
+            outcomes.append(CREATED if inserted else UPDATED)
+        else:
+            outcomes.append(DUPLICATE)
+
+    return outcomes
+
+
+def iter_csv_records(lines):
+    """Yield (line number, record) pairs from CSV lines with a header row."""
+    reader = csv.DictReader(
+        line.decode('utf-8-sig', errors='replace') for line in lines
+    )
+    for record in reader:
+        yield reader.line_num, record
+
+
+def iter_ndjson_records(lines):
+    """Yield (line number, record) pairs from newline delimited JSON."""
+    for line_num, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line.decode('utf-8-sig', errors='replace'))
+        except ValueError:
+            record = None
+        yield line_num, record
+
+
+def _clean_decimal(value, field):
+    """Return value as a Decimal that fits the model field, or None."""
+    if value is None or value == '':
+        return None
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError('A valid number is required.')
+    if not number.is_finite():
+        raise ValueError('A valid number is required.')
+    if number != number.quantize(Decimal(1).scaleb(-field.decimal_places)):
+        raise ValueError(
+            f'Ensure that there are no more than {field.decimal_places} '
+            f'decimal places.'
+        )
+    if abs(number) >= 10 ** (field.max_digits - field.decimal_places):
+        raise ValueError(
+            f'Ensure that there are no more than {field.max_digits} digits '
+            f'in total.'
+        )
+
+    return number
+
+
+def _clean_datetime(value):
+    """Return value as an aware datetime, defaulting to now when blank."""
+    if value is None or value == '':
+        return timezone.now()
+    try:
+        parsed = parse_datetime(str(value).strip())
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError('Datetime has wrong format.')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+
+    return parsed
+
+
+def clean_record(record):
+    """Validate a raw upload record, returning (api_key, values, errors)."""
+    if not isinstance(record, dict):
+        return None, None, {'non_field_errors': ['Invalid data.']}
+
+    errors = {}
+    api_key = record.get('api_key')
+    if not api_key or not isinstance(api_key, str):
+        errors['api_key'] = ['This field is required.']
+
+    values = {}
+    try:
+        values['date_created'] = _clean_datetime(record.get('date_created'))
+    except ValueError as exc:
+        errors['date_created'] = [str(exc)]
+    for name in VALUE_FIELDS:
+        try:
+            values[name] = _clean_decimal(
+                record.get(name),
+                DataPoint._meta.get_field(name),
+            )
+        except ValueError as exc:
+            errors[name] = [str(exc)]
+
+    return api_key, values, errors
+
+
+def _copy_rows(cursor, rows):
+    """Load prepared rows into the upload staging table with COPY."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {STAGING_TABLE} ({", ".join(COPY_COLUMNS)}) '
+        f'FROM STDIN WITH (FORMAT csv)',
+        buffer,
+    )
+
+
+def copy_datapoints(records, resolve, on_conflict='ignore'):
+    """
+    Load (line number, record) pairs with PostgreSQL COPY.
+
+    resolve maps a set of api_keys to a dict of api_key to horse. Rows are
+    validated and mapped to horses chunk by chunk, so memory stays bounded
+    by COPY_CHUNK_SIZE. Each chunk is copied into a temporary staging table
+    and moved into the data point table with INSERT ... ON CONFLICT, so
+    readings already stored are handled as in save_datapoints. Invalid rows
+    are skipped and reported instead of failing the load.
+
+    Returns (created, updated, duplicates, rejected, errors).
+    """
+    horses = {}
+    created = 0
+    updated = 0
+    duplicates = 0
+    rejected = 0
+    errors = []
+    columns = ', '.join(COPY_COLUMNS)
+    key = ', '.join(CONFLICT_COLUMNS)
+    # Staging rows keep file order, so ctid picks the first or last reading
+    move_sql = (
+        f'INSERT INTO {DataPoint._meta.db_table} ({columns}) '
+        f'SELECT DISTINCT ON ({key}) {columns} FROM {STAGING_TABLE} '
+        f'ORDER BY {key}, ctid {"DESC" if on_conflict == "update" else "ASC"} '
+        f'{_on_conflict_sql(on_conflict)} '
+        f'RETURNING id, horse_id, date_created, (xmax = 0) AS inserted'
+    )
+
+    def reject(line_num, row_errors):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': line_num, 'errors': row_errors})
+
+    def flush(cursor, chunk):
+        nonlocal created, updated, duplicates
+        unknown = {api_key for _, api_key, _ in chunk if api_key not in horses}
+        if unknown:
+            found = resolve(unknown)
+            horses.update({api_key: found.get(api_key) for api_key in unknown})
+
+        rows = []
+        for line_num, api_key, values in chunk:
+            horse = horses[api_key]
+            if horse is None:
+                reject(line_num, {'api_key': ['Invalid API key.']})
+                continue
+            rows.append(
+                [horse.id, horse.user_id]
+                + [values[name] for name in COPY_COLUMNS[2:-1]]
+            )
+        if rows:
+            lat = COPY_COLUMNS.index('gps_lat')
+            long = COPY_COLUMNS.index('gps_long')
+            geocells = _geocells([(row[lat], row[long]) for row in rows])
+            for row, geocell in zip(rows, geocells):
+                row.append(geocell)
+            lock_horses(cursor, [row[0] for row in rows])
+            _copy_rows(cursor, rows)
+            cursor.execute(move_sql)
+            returned = cursor.fetchall()
+            inserted = sum(1 for *_, row_inserted in returned if row_inserted)
+            created += inserted
+            updated += len(returned) - inserted
+            duplicates += len(rows) - len(returned)
+            _send_written(returned)
+            cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {STAGING_TABLE} ON COMMIT DROP AS '
+            f'SELECT {columns} FROM {DataPoint._meta.db_table} WITH NO DATA'
+        )
+        chunk = []
+        for line_num, record in records:
+            api_key, values, row_errors = clean_record(record)
+            if row_errors:
+                reject(line_num, row_errors)
+                continue
+            chunk.append((line_num, api_key, values))
+            if len(chunk) >= COPY_CHUNK_SIZE:
+                flush(cursor, chunk)
+                chunk = []
+        if chunk:
+            flush(cursor, chunk)
+        # ON COMMIT only fires for the outermost transaction
+        cursor.execute(f'DROP TABLE {STAGING_TABLE}')
+
+    return created, updated, duplicates, rejected, errors
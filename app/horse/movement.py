@@ -0,0 +1,169 @@
+"""
+Movement analytics of horses' GPS fixes.
+
+Each step between consecutive fixes gets its haversine distance, duration
+and speed with array operations. A step slower than REST_SPEED is still,
+and a run of still steps lasting MIN_REST or more is a rest period; GPS
+wander while a horse stands stays below REST_SPEED, so only moving steps
+add to the distance walked. A step longer than MAX_GAP means the horse
+was not tracked, so it counts towards nothing.
+
+Steps belong to the day, in TIME_ZONE, of the fix they end at. Summaries
+of closed days are stored as DailyMovement the first time they are asked
+for; readings written, edited or deleted later drop the stored summaries
+of the days they change.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from core.models import DataPoint, DailyMovement
+from horse import geo, tracks
+from horse.rollups import local_midnight
+
+
+# Meters per second below which a horse is standing or grazing in place
+REST_SPEED = 0.3
+# Seconds a horse must stay still for a rest period
+MIN_REST = 300
+# Seconds between fixes beyond which the horse was not tracked
+MAX_GAP = 600
+MAX_DAYS = 92
+
+
+def summarize(epochs, lats, longs, first_day, last_day):
+    """
+    Return unsaved DailyMovement summaries of each day first_day to last_day.
+
+    Fixes are (epoch, lat, long) arrays in time order; fixes before
+    first_day only give the step into it.
+    """
+    day_count = (last_day - first_day).days + 1
+    starts = np.array([
+        local_midnight(first_day + timedelta(days=k)).timestamp()
+        for k in range(day_count + 1)
+    ])
+    fix_days = np.searchsorted(starts, epochs, side='right') - 1
+    fix_days = fix_days[(fix_days >= 0) & (fix_days < day_count)]
+
+    seconds = np.diff(epochs)
+    meters = geo.haversine(lats[:-1], longs[:-1], lats[1:], longs[1:])
+    speeds = meters / np.maximum(seconds, 1)
+    days = np.searchsorted(starts, epochs[1:], side='right') - 1
+    counted = (days >= 0) & (days < day_count) & (seconds <= MAX_GAP)
+    still = counted & (speeds < REST_SPEED)
+
+    # Runs of still steps end at any other step and at midnight
+    starts_run = np.ones(len(still), dtype=bool)
+    starts_run[1:] = (still[1:] != still[:-1]) | (days[1:] != days[:-1])
+    runs = np.cumsum(starts_run) - 1
+    run_seconds = np.bincount(runs, weights=np.where(still, seconds, 0))
+    run_days = days[starts_run]
+    rests = still[starts_run] & (run_seconds >= MIN_REST)
+    moving = counted & ~rests[runs]
+
+    rest_days, rest_seconds = run_days[rests], run_seconds[rests]
+    longest_rest = np.zeros(day_count)
+    np.maximum.at(longest_rest, rest_days, rest_seconds)
+    max_speed = np.zeros(day_count)
+    np.maximum.at(max_speed, days[counted], speeds[counted])
+    walked = moving & ~still
+    columns = {
+        'fixes': np.bincount(fix_days, minlength=day_count),
+        'distance': np.bincount(
+            days[walked], weights=meters[walked], minlength=day_count,
+        ),
+        'moving_seconds': np.bincount(
+            days[moving], weights=seconds[moving], minlength=day_count,
+        ),
+        'resting_seconds': np.bincount(
+            rest_days, weights=rest_seconds, minlength=day_count,
+        ),
+        'rest_periods': np.bincount(rest_days, minlength=day_count),
+        'longest_rest': longest_rest,
+        'max_speed': max_speed,
+    }
+    columns = {name: values.tolist() for name, values in columns.items()}
+
+    return [
+        DailyMovement(
+            day=first_day + timedelta(days=k),
+            **{name: values[k] for name, values in columns.items()},
+        )
+        for k in range(day_count)
+    ]
+
+
+def daily(horse, first_day, last_day):
+    """
+    Return DailyMovement summaries of a horse from first_day to last_day.
+
+    Stored summaries are used for closed days; the others are computed
+    from the horse's fixes, and those of closed days are stored.
+    """
+    today = timezone.localdate()
+    stored = {
+        summary.day: summary
+        for summary in DailyMovement.objects.filter(
+            horse=horse,
+            day__gte=first_day,
+            day__lte=last_day,
+        )
+    }
+    missing = [
+        first_day + timedelta(days=k)
+        for k in range((last_day - first_day).days + 1)
+        if first_day + timedelta(days=k) not in stored
+    ]
+    if missing:
+        fixes = DataPoint.objects.filter(
+            horse=horse,
+            date_created__gte=(
+                local_midnight(missing[0]) - timedelta(seconds=MAX_GAP)
+            ),
+            date_created__lt=local_midnight(missing[-1] + timedelta(days=1)),
+        )
+        epochs, lats, longs = tracks.read_fixes(fixes)
+        valid = tracks.valid_fixes(epochs, lats, longs)
+        computed = []
+        summaries = summarize(
+            epochs[valid], lats[valid], longs[valid], missing[0], missing[-1],
+        )
+        for summary in summaries:
+            if summary.day in missing:
+                summary.horse = horse
+                stored[summary.day] = summary
+                if summary.day < today:
+                    computed.append(summary)
+        DailyMovement.objects.bulk_create(computed, ignore_conflicts=True)
+
+    return [stored[day] for day in sorted(stored)]
+
+
+def invalidate_statements(keys):
+    """
+    Return statements dropping stored summaries that readings change.
+
+    Only closed days can have stored summaries, so readings given by
+    (horse_id, date_created) from today on need none.
+    """
+    midnight = local_midnight(timezone.localdate())
+    stale = set()
+    for horse_id, date_created in keys:
+        if timezone.is_naive(date_created):
+            date_created = timezone.make_aware(date_created)
+        if date_created < midnight:
+            gap_end = date_created + timedelta(seconds=MAX_GAP)
+            for moment in (date_created, gap_end):
+                stale.add((horse_id, timezone.localtime(moment).date()))
+    if not stale:
+        return []
+
+    return [(
+        'movement_invalidated',
+        f'DELETE FROM {DailyMovement._meta.db_table} m '
+        f'USING unnest(%s::bigint[], %s::date[]) AS s(horse_id, day) '
+        f'WHERE m.horse_id = s.horse_id AND m.day = s.day',
+        [[horse_id for horse_id, _ in stale], [day for _, day in stale]],
+    )]
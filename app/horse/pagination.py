@@ -0,0 +1,163 @@
+"""
+Pagination for the horse APIs.
+"""
+from base64 import b64decode, b64encode
+from collections import OrderedDict, namedtuple
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+Cursor = namedtuple('Cursor', ['date_created', 'id', 'reverse'])
+
+
+class DataPointCursorPagination(BasePagination):
+    """
+    Keyset pagination of data points over (date_created, id).
+
+    Each page is a range scan that starts right after the cursor position,
+    so the cost of a page does not grow with its depth and pages do not
+    shift while new readings arrive. Pagination is opt in: it applies when
+    the request has a page_size or cursor parameter, and plain list
+    requests keep returning every matching data point.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    default_page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if (
+            self.cursor_query_param not in params
+            and self.page_size_query_param not in params
+        ):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        ordering = params.get(self.ordering_query_param)
+        self.descending = ordering != 'date_created'
+        cursor = self.decode_cursor(params.get(self.cursor_query_param))
+        self.cursor = cursor
+
+        # A previous page is scanned against the list order, then flipped
+        reverse = cursor is not None and cursor.reverse
+        scan_descending = self.descending != reverse
+        if cursor is not None:
+            lookup = 'lt' if scan_descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'date_created__{lookup}': cursor.date_created})
+                | Q(
+                    date_created=cursor.date_created,
+                    **{f'id__{lookup}': cursor.id},
+                )
+            )
+        if scan_descending:
+            queryset = queryset.order_by('-date_created', '-id')
+        else:
+            queryset = queryset.order_by('date_created', 'id')
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        self.page = rows
+
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.default_page_size
+        if page_size <= 0:
+            return self.default_page_size
+
+        return min(page_size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string', 'nullable': True, 'format': 'uri',
+                },
+                'previous': {
+                    'type': 'string', 'nullable': True, 'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            return self.encode_cursor(self.get_position(self.page[-1], False))
+
+        # An empty previous page: continue from where it was requested
+        return self.encode_cursor(self.cursor._replace(reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            return self.encode_cursor(self.get_position(self.page[0], True))
+
+        return self.encode_cursor(self.cursor._replace(reverse=True))
+
+    def get_position(self, row, reverse):
+        """Return a cursor at row, a model instance or a values() dict."""
+        if isinstance(row, dict):
+            return Cursor(row['date_created'], row['id'], reverse)
+
+        return Cursor(row.date_created, row.id, reverse)
+
+    def decode_cursor(self, encoded):
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            date_created = parse_datetime(tokens['d'][0])
+            if date_created is None:
+                raise ValueError
+            return Cursor(
+                date_created, int(tokens['i'][0]), tokens['r'][0] == '1',
+            )
+        except (TypeError, KeyError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        querystring = parse.urlencode({
+            'd': cursor.date_created.isoformat(),
+            'i': cursor.id,
+            'r': '1' if cursor.reverse else '0',
+        })
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded,
+        )
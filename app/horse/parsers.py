@@ -0,0 +1,20 @@
+"""
+Parsers for the horse APIs.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from horse import telemetry
+
+
+class TelemetryParser(BaseParser):
+    """Parse a binary telemetry payload into a TelemetryBatch."""
+    media_type = telemetry.MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            raise ParseError('Empty telemetry payload.')
+        try:
+            return telemetry.decode(stream.read())
+        except ValueError as exc:
+            raise ParseError(str(exc))
@@ -0,0 +1,57 @@
+"""
+Renderers for the horse APIs.
+"""
+from datetime import datetime
+
+from rest_framework.fields import DateTimeField
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ColumnarJSONEncoder(JSONEncoder):
+    """Encodes datetimes as DateTimeField does, in the current time zone."""
+    datetime_field = DateTimeField()
+
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return self.datetime_field.to_representation(obj)
+        return super().default(obj)
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    JSON for data point lists pivoted into one array per field.
+
+    Columns hold raw values() results, so datetimes are encoded here to
+    match the row format.
+    """
+    media_type = 'application/vnd.equusense.columnar+json'
+    format = 'columnar'
+    encoder_class = ColumnarJSONEncoder
+
+
+class ExportRenderer(JSONRenderer):
+    """
+    Negotiates a streamed export format.
+
+    Exports stream their own body, so this only renders error responses,
+    which fall back to plain JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None and response.exception:
+            response['Content-Type'] = JSONRenderer.media_type
+        return super().render(data, None, renderer_context)
+
+
+class CSVExportRenderer(ExportRenderer):
+    """Negotiates CSV exports."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONExportRenderer(ExportRenderer):
+    """Negotiates newline delimited JSON exports."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
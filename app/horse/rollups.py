@@ -0,0 +1,218 @@
+"""
+Hourly and daily rollups of data points.
+
+Rollups hold the count, sum, min and max of each summarized field per
+horse and bucket. Newly inserted readings are added to them with an
+UPSERT in the ingest transaction. Buckets whose readings were changed or
+removed are recomputed from raw rows, and any time range can be rebuilt
+with the rebuild_rollups management command.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from core.models import (
+    DataPoint,
+    HourlyRollup,
+    DailyRollup,
+)
+
+
+ROLLUP_FIELDS = ['temp', 'hr', 'hr_interval', 'batt']
+
+
+class RollupTable:
+    """
+    SQL for one rollup model.
+
+    bucket is an expression of a data point's date_created ({d}) giving
+    its bucket, and start and end give the range of a bucket ({b}).
+    """
+
+    def __init__(self, model, column, bucket, start, end):
+        self.model = model
+        self.column = column
+        self.bucket = bucket
+        self.start = start
+        self.end = end
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    def insert_sql(self, source, where, bucket=None):
+        """Return INSERT ... SELECT aggregating data points into buckets."""
+        columns = ['horse_id', self.column]
+        selects = [
+            'dp.horse_id', bucket or self.bucket.format(d='dp.date_created'),
+        ]
+        for field in ROLLUP_FIELDS:
+            columns += [
+                f'{field}_count', f'{field}_sum',
+                f'{field}_min', f'{field}_max',
+            ]
+            selects += [
+                f'count(dp.{field})',
+                f'coalesce(sum(dp.{field}), 0)',
+                f'min(dp.{field})',
+                f'max(dp.{field})',
+            ]
+
+        return (
+            f'INSERT INTO {self.table} AS r ({", ".join(columns)}) '
+            f'SELECT {", ".join(selects)} FROM {source} WHERE {where} '
+            # A stable order keeps concurrent upserts from deadlocking
+            f'GROUP BY 1, 2 ORDER BY 1, 2'
+        )
+
+    def add_sql(self):
+        """Return SQL adding the data points with ids %s to their buckets."""
+        updates = []
+        for field in ROLLUP_FIELDS:
+            updates += [
+                f'{field}_count = r.{field}_count + EXCLUDED.{field}_count',
+                f'{field}_sum = r.{field}_sum + EXCLUDED.{field}_sum',
+                # LEAST and GREATEST skip NULLs
+                f'{field}_min = LEAST(r.{field}_min, EXCLUDED.{field}_min)',
+                f'{field}_max = GREATEST(r.{field}_max, EXCLUDED.{field}_max)',
+            ]
+        insert = self.insert_sql(
+            f'{DataPoint._meta.db_table} dp', 'dp.id = ANY(%s)',
+        )
+
+        return (
+            f'{insert} ON CONFLICT (horse_id, {self.column}) '
+            f'DO UPDATE SET {", ".join(updates)}'
+        )
+
+    def _keys_sql(self):
+        """Return the distinct buckets of (horse_id, date_created) pairs %s."""
+        bucket = self.bucket.format(d='k.date_created')
+        return (
+            f'(SELECT DISTINCT k.horse_id, {bucket} AS b '
+            f'FROM unnest(%s::bigint[], %s::timestamptz[]) '
+            f'AS k(horse_id, date_created)) keys'
+        )
+
+    def _range_sql(self):
+        return (
+            f'dp.date_created >= {self.start.format(b="keys.b")} '
+            f'AND dp.date_created < {self.end.format(b="keys.b")}'
+        )
+
+    def clear_sql(self):
+        """Return SQL deleting buckets of pairs %s left without readings."""
+        return (
+            f'DELETE FROM {self.table} r USING {self._keys_sql()} '
+            f'WHERE r.horse_id = keys.horse_id AND r.{self.column} = keys.b '
+            f'AND NOT EXISTS (SELECT 1 FROM {DataPoint._meta.db_table} dp '
+            f'WHERE dp.horse_id = keys.horse_id AND {self._range_sql()})'
+        )
+
+    def recompute_sql(self):
+        """Return SQL recomputing the buckets of pairs %s from readings."""
+        insert = self.insert_sql(
+            f'{self._keys_sql()} JOIN {DataPoint._meta.db_table} dp '
+            f'ON dp.horse_id = keys.horse_id',
+            self._range_sql(),
+            bucket='keys.b',
+        )
+        updates = ', '.join(
+            f'{column} = EXCLUDED.{column}'
+            for field in ROLLUP_FIELDS
+            for column in (
+                f'{field}_count', f'{field}_sum',
+                f'{field}_min', f'{field}_max',
+            )
+        )
+
+        return (
+            f'{insert} ON CONFLICT (horse_id, {self.column}) '
+            f'DO UPDATE SET {updates}'
+        )
+
+    def rebuild(self, cursor, start, end, horse_ids=None):
+        """Recompute every bucket from start to end, both local midnights."""
+        horse_filter = ''
+        params = [start, end]
+        if horse_ids is not None:
+            horse_filter = 'AND horse_id = ANY(%s)'
+            params.append(list(horse_ids))
+        cursor.execute(
+            f'DELETE FROM {self.table} '
+            f'WHERE {self.column} >= {self.bucket.format(d="%s")} '
+            f'AND {self.column} < {self.bucket.format(d="%s")} {horse_filter}',
+            params,
+        )
+        cursor.execute(
+            self.insert_sql(
+                f'{DataPoint._meta.db_table} dp',
+                f'dp.date_created >= %s AND dp.date_created < %s '
+                f'{horse_filter}',
+            ),
+            params,
+        )
+
+
+LOCAL = f"'{settings.TIME_ZONE}'"
+HOURLY = RollupTable(
+    HourlyRollup,
+    'hour',
+    bucket="(date_trunc('hour', {d} AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')",
+    start='{b}',
+    end="({b} + interval '1 hour')",
+)
+DAILY = RollupTable(
+    DailyRollup,
+    'day',
+    bucket=f'(({{d}}) AT TIME ZONE {LOCAL})::date',
+    start=f'({{b}}::timestamp AT TIME ZONE {LOCAL})',
+    end=f'(({{b}} + 1)::timestamp AT TIME ZONE {LOCAL})',
+)
+TABLES = [HOURLY, DAILY]
+
+
+def add_statements(ids):
+    """Return statements adding inserted data points to their buckets."""
+    return [
+        (f'{table.table}_added', table.add_sql(), [list(ids)])
+        for table in TABLES
+    ]
+
+
+def refresh_statements(keys):
+    """
+    Return statements recomputing buckets of (horse_id, date_created) pairs.
+
+    Buckets left without readings are deleted and the others upserted, so
+    no two statements touch the same row.
+    """
+    keys = list(keys)
+    params = [
+        [horse_id for horse_id, _ in keys],
+        [date_created for _, date_created in keys],
+    ]
+    statements = []
+    for table in TABLES:
+        statements += [
+            (f'{table.table}_cleared', table.clear_sql(), params),
+            (f'{table.table}_recomputed', table.recompute_sql(), params),
+        ]
+
+    return statements
+
+
+def local_midnight(day):
+    """Return the aware start of a date in TIME_ZONE."""
+    return timezone.make_aware(datetime.combine(day, time()))
+
+
+def rebuild(start_day, end_day, horse_ids=None):
+    """Recompute every rollup bucket for the dates start_day to end_day."""
+    start = local_midnight(start_day)
+    end = local_midnight(end_day + timedelta(days=1))
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            table.rebuild(cursor, start, end, horse_ids)
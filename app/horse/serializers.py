@@ -1,12 +1,22 @@
 """
 Serializers for horse APIs.
 """
-from rest_framework import serializers
+from decimal import Context, Decimal, ROUND_HALF_EVEN
+
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 
 from core.models import (
     Horse, 
-    DataPoint
+    DataPoint,
+    Geofence,
+    GeofenceEvent,
+    DailyMovement,
+    AlertRule,
+    Alert,
 )
+from horse import alerts, geo, geofences
 
 
 class HorseSerializer(serializers.ModelSerializer):
@@ -16,6 +26,20 @@ class HorseSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'api_key', 'image']
         read_only_fields = ['id']
 
+
+class FleetHorseSerializer(serializers.ModelSerializer):
+    """Serializer for horses with their latest reading."""
+    status = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Horse
+        fields = [
+            'id', 'name', 'api_key', 'image', 'status', 'last_seen',
+            'latest_temp', 'latest_hr', 'latest_hr_interval', 'latest_batt',
+            'latest_gps_lat', 'latest_gps_long',
+        ]
+        read_only_fields = fields
+
 class DataPointSerializer(serializers.ModelSerializer):
     """Serializer for data points."""
     api_key = serializers.CharField(source='horse.api_key')
@@ -23,8 +47,69 @@ class DataPointSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = DataPoint
-        fields = ['id', 'api_key', 'horse_name', 'hr', 'hr_interval','date_created', 'gps_lat', 'gps_long', 'temp', 'batt']
-        read_only_fields = ['id', 'api_key', 'horse_name']
+        fields = [
+            'id', 'api_key', 'horse_name', 'hr', 'hr_interval',
+            'date_created', 'gps_lat', 'gps_long', 'temp', 'batt',
+            'anomalies',
+        ]
+        read_only_fields = ['id', 'api_key', 'horse_name', 'anomalies']
+
+
+class DataPointValuesSerializer(serializers.BaseSerializer):
+    """
+    Read only serializer giving values() rows the DataPointSerializer shape.
+
+    Each field is converted by a plain function prepared once from the
+    matching DataPointSerializer field, instead of resolving attributes
+    on model instances.
+    """
+    lookups = {'api_key': 'horse__api_key', 'horse_name': 'horse__name'}
+    _converters = None
+
+    @classmethod
+    def converters(cls):
+        """Return (name, values() key, converter) for every output field."""
+        if cls._converters is None:
+            cls._converters = [
+                (name, cls.lookups.get(name, name), cls.converter(field))
+                for name, field in DataPointSerializer().fields.items()
+            ]
+        return cls._converters
+
+    @staticmethod
+    def converter(field):
+        """Return a function equivalent to field.to_representation."""
+        coerce_to_string = getattr(
+            field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING,
+        )
+        if (isinstance(field, serializers.DecimalField)
+                and coerce_to_string and not field.localize):
+            exponent = Decimal('.1') ** field.decimal_places
+            context = Context(
+                prec=field.max_digits,
+                rounding=field.rounding or ROUND_HALF_EVEN,
+            )
+            return lambda value: '{:f}'.format(
+                value.quantize(exponent, context=context)
+            )
+
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if (isinstance(field, serializers.DateTimeField)
+                and output_format.lower() == ISO_8601):
+            def convert(value):
+                value = value.astimezone(timezone.get_current_timezone())
+                value = value.isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return convert
+
+        return field.to_representation
+
+    def to_representation(self, row):
+        return {
+            name: None if row[key] is None else convert(row[key])
+            for name, key, convert in self.converters()
+        }
+
 
 class HorseDetailSerializer(HorseSerializer):
     """Serializer for horse detail view."""
@@ -44,3 +129,183 @@ class HorseImageSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
 
+
+class GeofenceSerializer(serializers.ModelSerializer):
+    """Serializer for geofences."""
+    api_key = serializers.CharField(source='horse.api_key')
+
+    class Meta:
+        model = Geofence
+        fields = [
+            'id', 'api_key', 'name', 'vertices', 'inside', 'state_at',
+            'modified',
+        ]
+        read_only_fields = ['id', 'inside', 'state_at', 'modified']
+
+    def validate_api_key(self, value):
+        horse = Horse.objects.filter(
+            user=self.context['request'].user, api_key=value,
+        ).first()
+        if horse is None:
+            raise serializers.ValidationError('Invalid API key.')
+
+        return horse
+
+    def validate_vertices(self, value):
+        low, high = geofences.MIN_VERTICES, geofences.MAX_VERTICES
+        if not isinstance(value, list) or not low <= len(value) <= high:
+            raise serializers.ValidationError(
+                f'Must be a list of {geofences.MIN_VERTICES} to '
+                f'{geofences.MAX_VERTICES} [lat, long] pairs.'
+            )
+        for vertex in value:
+            if (not isinstance(vertex, list) or len(vertex) != 2
+                    or not all(
+                        isinstance(n, (int, float))
+                        and not isinstance(n, bool)
+                        for n in vertex
+                    )
+                    or not geo.valid_position(*vertex)):
+                raise serializers.ValidationError(
+                    'Each vertex must be a [lat, long] pair '
+                    'within ±90 and ±180.'
+                )
+
+        return [[float(lat), float(long)] for lat, long in value]
+
+    def to_internal_value(self, data):
+        validated = super().to_internal_value(data)
+        if 'horse' in validated:
+            validated['horse'] = validated['horse']['api_key']
+
+        return validated
+
+    def update(self, instance, validated_data):
+        horse = validated_data.get('horse', instance.horse)
+        vertices = validated_data.get('vertices', instance.vertices)
+        if horse != instance.horse or vertices != instance.vertices:
+            # Readings so far say nothing about the new shape or horse
+            instance.inside = None
+        if horse != instance.horse:
+            instance.state_at = None
+
+        return super().update(instance, validated_data)
+
+
+class GeofenceEventSerializer(serializers.ModelSerializer):
+    """Serializer for geofence enter and exit events."""
+    api_key = serializers.CharField(source='horse.api_key', read_only=True)
+    fence_name = serializers.CharField(source='fence.name', read_only=True)
+
+    class Meta:
+        model = GeofenceEvent
+        fields = [
+            'id', 'fence', 'fence_name', 'api_key', 'kind', 'datapoint_id',
+            'date_created',
+        ]
+        read_only_fields = fields
+
+
+class DailyMovementSerializer(serializers.ModelSerializer):
+    """Serializer for daily movement summaries."""
+
+    class Meta:
+        model = DailyMovement
+        fields = [
+            'day', 'fixes', 'distance', 'moving_seconds', 'resting_seconds',
+            'rest_periods', 'longest_rest', 'max_speed',
+        ]
+        read_only_fields = fields
+
+
+class AlertRuleSerializer(serializers.ModelSerializer):
+    """Serializer for alert rules."""
+    # Every horse of the user when not given
+    api_key = serializers.CharField(
+        source='horse.api_key',
+        required=False,
+        allow_null=True,
+        default=None,
+    )
+
+    class Meta:
+        model = AlertRule
+        fields = [
+            'id', 'api_key', 'name', 'field', 'low', 'high',
+            'hysteresis', 'min_duration', 'enabled',
+        ]
+        read_only_fields = ['id']
+
+    def validate_api_key(self, value):
+        if value is None:
+            return None
+        horse = Horse.objects.filter(
+            user=self.context['request'].user, api_key=value,
+        ).first()
+        if horse is None:
+            raise serializers.ValidationError('Invalid API key.')
+
+        return horse
+
+    def validate_hysteresis(self, value):
+        if value < 0:
+            raise serializers.ValidationError('Must not be negative.')
+
+        return value
+
+    def validate_min_duration(self, value):
+        if value < 0:
+            raise serializers.ValidationError('Must not be negative.')
+
+        return value
+
+    def to_internal_value(self, data):
+        validated = super().to_internal_value(data)
+        if 'horse' in validated:
+            validated['horse'] = validated['horse']['api_key']
+
+        return validated
+
+    def validate(self, attrs):
+        def value(name):
+            if name in attrs:
+                return attrs[name]
+            return getattr(self.instance, name, None)
+
+        low, high = value('low'), value('high')
+        if low is None and high is None:
+            raise serializers.ValidationError('Set low, high or both.')
+        if low is not None and high is not None:
+            if low >= high:
+                raise serializers.ValidationError('low must be below high.')
+            if (value('hysteresis') or 0) >= high - low:
+                raise serializers.ValidationError(
+                    'hysteresis must be smaller than the range.'
+                )
+
+        return attrs
+
+    def update(self, instance, validated_data):
+        changed = any(
+            getattr(instance, name) != value
+            for name, value in validated_data.items()
+            if name != 'name'
+        )
+        if changed:
+            alerts.reset(instance)
+
+        return super().update(instance, validated_data)
+
+
+class AlertSerializer(serializers.ModelSerializer):
+    """Serializer for threshold alerts."""
+    api_key = serializers.CharField(source='horse.api_key', read_only=True)
+    field = serializers.CharField(source='rule.field', read_only=True)
+
+    class Meta:
+        model = Alert
+        fields = [
+            'id', 'rule', 'field', 'api_key', 'kind',
+            'date_created', 'date_closed', 'peak',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,115 @@
+"""
+Downsampled chart series for the horse APIs.
+
+Series are reduced with Largest-Triangle-Three-Buckets (LTTB): the first
+and last readings are kept, the readings between them are split into
+equal sized buckets, and from each bucket the reading forming the largest
+triangle with the reading kept from the previous bucket and the average of
+the next bucket is kept. Readings are read from the database in chunks and
+only two buckets are held in memory at a time.
+"""
+from datetime import datetime, timezone
+from itertools import islice
+
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast, Extract
+
+
+SERIES_FIELDS = ['temp', 'hr', 'hr_interval', 'batt', 'gps_lat', 'gps_long']
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+CHUNK_SIZE = 5000
+
+
+class _ChunkReader:
+    """Hand out (epoch, value) rows of a query as arrays, chunk by chunk."""
+
+    def __init__(self, rows, chunk_size):
+        self.rows = iter(rows)
+        self.chunk_size = chunk_size
+        self.buffer = np.empty((0, 2))
+
+    def take(self, count):
+        """Return the next count rows as a (count, 2) array."""
+        parts = [self.buffer]
+        available = len(self.buffer)
+        while available < count:
+            chunk = list(islice(self.rows, self.chunk_size))
+            if not chunk:
+                break
+            parts.append(np.array(chunk, dtype=float))
+            available += len(chunk)
+        rows = np.concatenate(parts) if len(parts) > 1 else self.buffer
+        self.buffer = rows[count:]
+
+        return rows[:count]
+
+
+def bucket_edges(count, points):
+    """Return the start index of every LTTB bucket, then count."""
+    middle = points - 2
+    return (
+        [0]
+        + [k * (count - 2) // middle + 1 for k in range(middle + 1)]
+        + [count]
+    )
+
+
+def lttb(rows, count, points, chunk_size=CHUNK_SIZE):
+    """
+    Downsample count time ordered (epoch, value) rows to points rows.
+
+    Returns a (points, 2) array. Series with no more than points rows are
+    returned whole. count comes from a separate query, so rows deleted
+    since can run out before the last buckets; those are skipped and fewer
+    rows returned.
+    """
+    reader = _ChunkReader(rows, chunk_size)
+    if count <= points:
+        return reader.take(count)
+
+    edges = bucket_edges(count, points)
+    selected = list(reader.take(1))
+    bucket = reader.take(edges[2] - edges[1])
+    for k in range(1, points - 1):
+        if not len(bucket):
+            break
+        following = reader.take(edges[k + 2] - edges[k + 1])
+        previous = selected[-1]
+        average = following.mean(axis=0) if len(following) else bucket[-1]
+        # Twice the triangle area; the factor does not change the argmax
+        areas = np.abs(
+            (previous[0] - average[0]) * (bucket[:, 1] - previous[1])
+            - (previous[0] - bucket[:, 0]) * (average[1] - previous[1])
+        )
+        selected.append(bucket[np.argmax(areas)])
+        bucket = following
+    selected += list(bucket[-1:])
+
+    return np.array(selected).reshape(-1, 2)
+
+
+def downsample(queryset, field, points, chunk_size=CHUNK_SIZE):
+    """Return the LTTB series of field over a data point queryset."""
+    queryset = queryset.filter(**{f'{field}__isnull': False})
+    count = queryset.count()
+    rows = queryset.order_by('date_created', 'id').annotate(
+        series_epoch=Cast(
+            Extract('date_created', 'epoch', tzinfo=timezone.utc),
+            FloatField(),
+        ),
+        series_value=Cast(field, FloatField()),
+    ).values_list(
+        'series_epoch', 'series_value',
+    ).iterator(chunk_size=chunk_size)
+    series = lttb(rows, count, points, chunk_size)
+
+    return {
+        'count': count,
+        'date_created': [
+            datetime.fromtimestamp(epoch, tz=timezone.utc)
+            for epoch in series[:, 0].tolist()
+        ],
+        'values': series[:, 1].tolist(),
+    }
@@ -0,0 +1,90 @@
+"""
+Signal handlers for the horse app.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Horse, DataPoint
+from horse import alerts, conditional, effects, geo, ingest, stream
+from horse.custom_authentication import device_key_cache
+
+
+@receiver(post_save, sender=Horse)
+@receiver(post_delete, sender=Horse)
+def evict_horse_api_key(sender, instance, **kwargs):
+    """Drop cached device credentials when a horse changes or is deleted."""
+    device_key_cache.evict_horse(instance.id)
+
+
+@receiver(post_save, sender=Horse)
+@receiver(post_delete, sender=Horse)
+def touch_horse_owner(sender, instance, **kwargs):
+    """Invalidate conditional GETs of the owner's horse list."""
+    conditional.touch_user(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def evict_user_api_keys(sender, instance, **kwargs):
+    """Drop cached device credentials of a changed or deleted user."""
+    device_key_cache.evict_user(instance.id)
+
+
+@receiver(post_save, sender=get_user_model())
+def add_default_alert_rules(sender, instance, created, **kwargs):
+    """Start new users with the default alert rules."""
+    if created:
+        alerts.add_default_rules(instance)
+
+
+@receiver(ingest.datapoints_written)
+def apply_written_effects(sender, rows, **kwargs):
+    """Update summaries and evaluate the fences, alerts and anomalies."""
+    effects.written(rows)
+
+
+@receiver(ingest.datapoints_written)
+def publish_written_datapoints(sender, rows, **kwargs):
+    """Push written readings to live streams once they are committed."""
+    ids = [pk for pk, _, _, _ in rows]
+    transaction.on_commit(lambda: stream.publish(ids))
+
+
+@receiver(pre_save, sender=DataPoint)
+def assign_geocell(sender, instance, **kwargs):
+    """Keep the geocell of a data point saved with the ORM up to date."""
+    instance.geocell = geo.encode(instance.gps_lat, instance.gps_long)
+
+
+@receiver(pre_save, sender=DataPoint)
+def remember_stored_datapoint_key(sender, instance, **kwargs):
+    """Note the stored (horse, date_created) of a data point being edited."""
+    instance._stored_key = None
+    if instance.pk is not None:
+        instance._stored_key = DataPoint.objects.filter(
+            pk=instance.pk,
+        ).values_list('horse_id', 'date_created').first()
+
+
+@receiver(post_save, sender=DataPoint)
+def refresh_saved_datapoint(sender, instance, **kwargs):
+    """Update what summarizes a data point saved with the ORM."""
+    keys = {(instance.horse_id, instance.date_created)}
+    if getattr(instance, '_stored_key', None):
+        keys.add(instance._stored_key)
+    effects.changed(keys)
+
+
+@receiver(post_delete, sender=DataPoint)
+def refresh_deleted_datapoint(sender, instance, **kwargs):
+    """Drop a data point deleted with the ORM from what summarizes it."""
+    effects.changed([(instance.horse_id, instance.date_created)])
+
+
+@receiver(post_save, sender=DataPoint)
+def publish_saved_datapoint(sender, instance, created, **kwargs):
+    """Push data points created with the ORM to live streams."""
+    if created:
+        transaction.on_commit(lambda: stream.publish([instance.id]))
@@ -0,0 +1,105 @@
+"""
+Latest reading snapshots on horses.
+
+Each horse carries a copy of its newest reading so fleet views can show
+every horse without scanning data points. Ingest moves the snapshot
+forward with a single UPDATE that only ever replaces an older reading, so
+late or backfilled readings never overwrite a newer one. As a statement
+may change a horse row only once, that UPDATE also bumps the horse's
+data version (see conditional).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, CharField, Q, Value, When
+from django.utils import timezone
+
+from core.models import Horse, DataPoint
+from horse import conditional
+
+
+SNAPSHOT_COLUMNS = {
+    'last_seen': 'date_created',
+    'latest_gps_lat': 'gps_lat',
+    'latest_gps_long': 'gps_long',
+    'latest_temp': 'temp',
+    'latest_hr': 'hr',
+    'latest_hr_interval': 'hr_interval',
+    'latest_batt': 'batt',
+}
+STATUS_NO_DATA = 'no_data'
+STATUS_OFFLINE = 'offline'
+STATUS_OUT_OF_RANGE = 'out_of_range'
+STATUS_LOW_BATTERY = 'low_battery'
+STATUS_OK = 'ok'
+
+
+def _set_sql(newer=None):
+    """Return SET clauses copying dp, where newer holds if given."""
+    sets = [conditional.DATA_VERSION_BUMP]
+    for column, source in SNAPSHOT_COLUMNS.items():
+        value = f'dp.{source}'
+        if newer is not None:
+            value = f'CASE WHEN {newer} THEN {value} ELSE h.{column} END'
+        sets.append(f'{column} = {value}')
+
+    return ', '.join(sets)
+
+
+def advance_statement(ids):
+    """Return a statement moving horse snapshots on to newer data points."""
+    sources = ', '.join(SNAPSHOT_COLUMNS.values())
+    newer = 'h.last_seen IS NULL OR h.last_seen <= dp.date_created'
+    return (
+        'snapshots_advanced',
+        f'UPDATE {Horse._meta.db_table} h SET {_set_sql(newer)} '
+        f'FROM (SELECT DISTINCT ON (horse_id) horse_id, {sources} '
+        f'FROM {DataPoint._meta.db_table} WHERE id = ANY(%s) '
+        f'ORDER BY horse_id, date_created DESC) dp '
+        f'WHERE h.id = dp.horse_id',
+        [list(ids)],
+    )
+
+
+def refresh_statement(horse_ids):
+    """Return a statement recomputing horse snapshots from stored readings."""
+    sources = ', '.join(SNAPSHOT_COLUMNS.values())
+    return (
+        'snapshots_refreshed',
+        f'UPDATE {Horse._meta.db_table} h SET {_set_sql()} '
+        f'FROM {Horse._meta.db_table} k LEFT JOIN LATERAL ('
+        f'SELECT {sources} FROM {DataPoint._meta.db_table} '
+        f'WHERE horse_id = k.id ORDER BY date_created DESC LIMIT 1'
+        f') dp ON true '
+        f'WHERE h.id = k.id AND k.id = ANY(%s)',
+        [list(horse_ids)],
+    )
+
+
+def out_of_range():
+    """Return a Q matching horses with latest readings out of range."""
+    condition = Q()
+    for field, (low, high) in settings.HORSE_NORMAL_RANGES.items():
+        condition |= Q(**{f'latest_{field}__lt': low})
+        condition |= Q(**{f'latest_{field}__gt': high})
+
+    return condition
+
+
+def annotate_status(queryset):
+    """Annotate horses with the status of their latest reading."""
+    offline_since = timezone.now() - timedelta(
+        seconds=settings.HORSE_OFFLINE_AFTER,
+    )
+
+    return queryset.annotate(status=Case(
+        When(last_seen__isnull=True, then=Value(STATUS_NO_DATA)),
+        When(last_seen__lt=offline_since, then=Value(STATUS_OFFLINE)),
+        When(out_of_range(), then=Value(STATUS_OUT_OF_RANGE)),
+        When(
+            latest_batt__lt=settings.HORSE_LOW_BATTERY,
+            then=Value(STATUS_LOW_BATTERY),
+        ),
+        default=Value(STATUS_OK),
+        output_field=CharField(),
+    ))
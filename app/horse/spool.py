@@ -0,0 +1,212 @@
+"""
+Write-behind spool for data point ingest.
+
+Readings are appended as JSON lines to an active spool file and later
+moved into the database by the flush_spool management command. The flusher
+renames the active file to a segment before reading it, and records how far
+into each segment it got in the same transaction as the insert, so every
+line is written exactly once even if the flusher is restarted. Lines that
+cannot be read back, such as one torn by a writer that crashed, are moved
+to REJECT_FILE instead of stopping the flusher.
+"""
+import fcntl
+import json
+import os
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import (
+    Horse,
+    DataPoint,
+    SpoolCheckpoint,
+)
+from horse import ingest
+
+
+ACTIVE_FILE = 'active.log'
+SEGMENT_PREFIX = 'segment-'
+REJECT_FILE = 'rejected.log'
+
+
+def spool_dir():
+    path = settings.DATAPOINT_SPOOL_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def make_record(horse, data):
+    """Return a spool record for validated data point fields."""
+    record = {
+        'horse_id': horse.id,
+        'user_id': horse.user_id,
+        'date_created': (
+            data.get('date_created') or timezone.now()
+        ).isoformat(),
+    }
+    for name in ingest.VALUE_FIELDS:
+        value = data.get(name)
+        record[name] = None if value is None else str(value)
+
+    return record
+
+
+def append(records):
+    """Durably append records to the active spool file."""
+    payload = ''.join(json.dumps(record) + '\n' for record in records).encode()
+    path = os.path.join(spool_dir(), ACTIVE_FILE)
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # The flusher may have rotated the file while we waited
+            try:
+                rotated = os.fstat(fd).st_ino != os.stat(path).st_ino
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                continue
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b'\n':
+                # End a line torn by a crashed writer so it stays on its own
+                payload = b'\n' + payload
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+            return
+        finally:
+            os.close(fd)
+
+
+def rotate():
+    """Move the active spool file aside as a segment ready to flush."""
+    path = os.path.join(spool_dir(), ACTIVE_FILE)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if os.fstat(fd).st_size == 0:
+            return None
+        segment = f'{SEGMENT_PREFIX}{time.time_ns():020d}.log'
+        os.rename(path, os.path.join(spool_dir(), segment))
+        return segment
+    finally:
+        os.close(fd)
+
+
+def _to_datapoint(record):
+    values = {
+        name: record[name]
+        for name in ingest.VALUE_FIELDS
+        if record.get(name) is not None
+    }
+    return DataPoint(
+        horse_id=record['horse_id'],
+        user_id=record['user_id'],
+        date_created=parse_datetime(record['date_created']),
+        **values,
+    )
+
+
+def _parse(line):
+    """Return the record of a spool line, or None when it cannot be read."""
+    # A line without its newline can only come from a crashed writer
+    if not line.endswith(b'\n'):
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    required = {'horse_id', 'user_id', 'date_created'}
+    if not isinstance(record, dict) or not required <= record.keys():
+        return None
+
+    return record
+
+
+def _reject(lines):
+    """Keep unreadable spool lines aside for inspection."""
+    if not lines:
+        return
+    with open(os.path.join(spool_dir(), REJECT_FILE), 'ab') as reject_file:
+        for line in lines:
+            reject_file.write(line if line.endswith(b'\n') else line + b'\n')
+
+
+def _save_batch(segment, records, offset):
+    """Insert a batch and advance the segment checkpoint atomically."""
+    horse_ids = set(
+        Horse.objects.filter(
+            id__in={record['horse_id'] for record in records},
+        ).values_list('id', flat=True)
+    )
+    datapoints = [
+        _to_datapoint(record)
+        for record in records
+        if record['horse_id'] in horse_ids
+    ]
+    while True:
+        try:
+            with transaction.atomic():
+                if datapoints:
+                    ingest.save_datapoints(datapoints)
+                SpoolCheckpoint.objects.update_or_create(
+                    segment=segment,
+                    defaults={'offset': offset},
+                )
+            return len(datapoints)
+        except ingest.UnknownHorses as exc:
+            # Deleted since the check above; their readings are dropped
+            datapoints = [
+                dp for dp in datapoints if dp.horse_id not in exc.horse_ids
+            ]
+
+
+def flush_segment(segment, batch_size):
+    """Write a segment to the database from its checkpoint onwards."""
+    path = os.path.join(spool_dir(), segment)
+    checkpoint = SpoolCheckpoint.objects.filter(segment=segment).first()
+    flushed = 0
+    with open(path, 'rb') as spool_file:
+        spool_file.seek(checkpoint.offset if checkpoint else 0)
+        records = []
+        rejected = []
+        for line in spool_file:
+            record = _parse(line)
+            if record is None:
+                rejected.append(line)
+            else:
+                records.append(record)
+            if len(records) >= batch_size:
+                flushed += _save_batch(segment, records, spool_file.tell())
+                _reject(rejected)
+                records = []
+                rejected = []
+        if records or rejected:
+            flushed += _save_batch(segment, records, spool_file.tell())
+            _reject(rejected)
+
+    os.remove(path)
+    SpoolCheckpoint.objects.filter(segment=segment).delete()
+
+    return flushed
+
+
+def flush(batch_size=5000):
+    """Rotate the active file and flush every pending segment."""
+    rotate()
+    directory = spool_dir()
+    segments = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(SEGMENT_PREFIX)
+    )
+    # Checkpoints of segments removed just before a crash are finished
+    SpoolCheckpoint.objects.exclude(segment__in=segments).delete()
+
+    return sum(flush_segment(segment, batch_size) for segment in segments)
@@ -0,0 +1,201 @@
+"""
+Live Server-Sent Events streams of newly written data points.
+
+GET /api/horse/stream/ streams every reading of the user's horses, or of
+one horse with ?horse=<api_key>, as it is committed. Streams are served by
+a plain ASGI application routed in app.asgi rather than by a Django view,
+so an open stream holds no worker thread. Clients authenticate with an
+"Authorization: Token <key>" header, or ?token=<key> as EventSource cannot
+send headers, and resume with Last-Event-ID after a dropped connection.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+from core.models import Horse, DataPoint
+from horse import exports, serializers
+from horse.broker import get_broker
+
+
+STREAM_PATH = '/api/horse/stream/'
+EVENT_NAME = 'datapoint'
+REPLAY_LIMIT = 1000
+
+
+class StreamError(Exception):
+    """Raised to refuse a stream with an HTTP status and detail."""
+
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def horse_channel(horse_id):
+    return f'horse:{horse_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def _rows(queryset):
+    lookups = [lookup for _, lookup in exports.EXPORT_FIELDS]
+
+    return queryset.values('horse_id', 'user_id', *lookups)
+
+
+def encode_event(row):
+    """Return a values() row as a Server-Sent Event."""
+    data = json.dumps(
+        serializers.DataPointValuesSerializer(row).data, separators=(',', ':'),
+    )
+
+    return f'id: {row["id"]}\nevent: {EVENT_NAME}\ndata: {data}\n\n'.encode()
+
+
+def messages(ids):
+    """Return the (channel, event) pairs of data points, oldest first."""
+    datapoints = DataPoint.objects.filter(id__in=ids).order_by(
+        'date_created', 'id',
+    )
+    messages = []
+    for row in _rows(datapoints):
+        event = encode_event(row)
+        messages.append((horse_channel(row['horse_id']), event))
+        messages.append((user_channel(row['user_id']), event))
+
+    return messages
+
+
+def publish(ids):
+    """Publish written data points to their horse and user channels."""
+    if ids:
+        get_broker().publish_datapoints(ids)
+
+
+def resolve_stream(key, api_key):
+    """Return the (channel, data points) a token may stream."""
+    token = None
+    if key:
+        token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        raise StreamError(401, 'Invalid token.')
+
+    datapoints = DataPoint.objects.filter(user=token.user)
+    if not api_key:
+        return user_channel(token.user.id), datapoints
+    horse = Horse.objects.filter(user=token.user, api_key=api_key).first()
+    if horse is None:
+        raise StreamError(404, 'Not found.')
+
+    return horse_channel(horse.id), datapoints.filter(horse=horse)
+
+
+def replay_events(datapoints, last_event_id):
+    """Return events for readings inserted after the one a client saw last."""
+    if not last_event_id.isdigit():
+        return []
+    missed = datapoints.filter(id__gt=int(last_event_id)).order_by('id')
+    missed = missed[:REPLAY_LIMIT]
+
+    return [encode_event(row) for row in _rows(missed)]
+
+
+async def _respond(send, status, detail):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': detail}).encode(),
+    })
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def application(scope, receive, send):
+    """ASGI application serving data point streams."""
+    if scope['method'] != 'GET':
+        await _respond(send, 405, f'Method "{scope["method"]}" not allowed.')
+        return
+    headers = {
+        name.decode('latin-1').lower(): value.decode('latin-1')
+        for name, value in scope['headers']
+    }
+    params = parse_qs(scope['query_string'].decode('latin-1'))
+    authorization = headers.get('authorization', '').split()
+    if len(authorization) == 2 and authorization[0].lower() == 'token':
+        key = authorization[1]
+    else:
+        key = params.get('token', [None])[0]
+
+    try:
+        channel, datapoints = await sync_to_async(resolve_stream)(
+            key,
+            params.get('horse', [None])[0],
+        )
+    except StreamError as exc:
+        await _respond(send, exc.status, exc.detail)
+        return
+
+    # Subscribe before replaying so nothing committed in between is missed
+    subscription = get_broker().subscribe([channel])
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    message = None
+    try:
+        replayed = await sync_to_async(replay_events)(
+            datapoints, headers.get('last-event-id', ''),
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b''.join(replayed),
+            'more_body': True,
+        })
+        while True:
+            if message is None:
+                message = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {message, disconnect},
+                timeout=settings.HORSE_STREAM_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnect in done:
+                return
+            if message in done:
+                event, message = message.result(), None
+                if event is None:
+                    # Fell behind; the client reconnects and replays
+                    break
+                body = event
+            else:
+                body = b': keepalive\n\n'
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+                'more_body': True,
+            })
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if message is not None:
+            message.cancel()
+        disconnect.cancel()
+        subscription.close()
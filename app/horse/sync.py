@@ -0,0 +1,137 @@
+"""
+Delta sync of data points for polling clients.
+
+A sync token is an opaque record of the last data point id and tombstone
+id a client has seen for each horse. Each poll reads only the rows after
+those marks with per horse index range scans, so it costs O(new rows).
+Ingest locks a horse before writing its data points, so a horse's readings
+commit in id order and a per horse mark never passes one still in flight.
+Readings overwritten by ingest or edited later keep their id and are not
+sent again.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Max
+from django.db.models.expressions import RawSQL
+
+from core.models import DataPoint, DataPointTombstone
+from horse import exports, serializers
+
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 5000
+
+
+def decode_token(token):
+    """Return the {horse_id: (datapoint_id, tombstone_id)} marks in a token."""
+    if not token:
+        return {}
+    try:
+        marks = json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return {
+            int(horse_id): (int(datapoint_id), int(tombstone_id))
+            for horse_id, (datapoint_id, tombstone_id) in marks.items()
+        }
+    except (TypeError, ValueError, AttributeError, UnicodeError):
+        raise ValueError('Invalid sync token.')
+
+
+def encode_token(marks):
+    data = json.dumps(
+        {
+            str(horse_id): list(mark)
+            for horse_id, mark in sorted(marks.items())
+        },
+        separators=(',', ':'),
+    )
+
+    return urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def _after(model, marks, limit):
+    """Return a queryset of the first ids after each horse's mark."""
+    table = model._meta.db_table
+    subquery = RawSQL(
+        f'SELECT r.id FROM unnest(%s::bigint[], %s::bigint[]) '
+        f'AS m(horse_id, after) CROSS JOIN LATERAL ('
+        f'SELECT id FROM {table} WHERE horse_id = m.horse_id '
+        f'AND id > m.after ORDER BY id LIMIT %s) r',
+        [list(marks), list(marks.values()), limit],
+    )
+
+    return model.objects.filter(id__in=subquery).order_by('id')
+
+
+def _advance(marks, rows, limit):
+    """Keep the first limit rows by id; return (rows, new marks, has_more)."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    marks = dict(marks)
+    for row in rows:
+        marks[row['horse_id']] = max(marks[row['horse_id']], row['id'])
+
+    return rows, marks, has_more
+
+
+def changes(horse_ids, marks, limit=DEFAULT_LIMIT):
+    """
+    Return the changes to horses since marks.
+
+    Horses the client has not seen before start from their first reading,
+    with none of their earlier deletions. Returns (data points, deleted,
+    new marks, has_more); has_more is set when rows were held back to stay
+    within limit.
+    """
+    marks = {
+        horse_id: marks[horse_id]
+        for horse_id in horse_ids if horse_id in marks
+    }
+    new = [horse_id for horse_id in horse_ids if horse_id not in marks]
+    if new:
+        new_tombstones = DataPointTombstone.objects.filter(horse_id__in=new)
+        deleted_before = dict(
+            new_tombstones.values('horse_id').annotate(
+                last=Max('id'),
+            ).values_list('horse_id', 'last')
+        )
+        for horse_id in new:
+            marks[horse_id] = (0, deleted_before.get(horse_id, 0))
+    if not marks:
+        return [], [], {}, False
+
+    lookups = [lookup for _, lookup in exports.EXPORT_FIELDS]
+    rows = list(_after(
+        DataPoint,
+        {horse_id: mark[0] for horse_id, mark in marks.items()},
+        limit + 1,
+    ).values('horse_id', *lookups))
+    rows, datapoint_marks, more_rows = _advance(
+        {horse_id: mark[0] for horse_id, mark in marks.items()}, rows, limit,
+    )
+
+    tombstones = list(_after(
+        DataPointTombstone,
+        {horse_id: mark[1] for horse_id, mark in marks.items()},
+        limit + 1,
+    ).values('id', 'horse_id', 'datapoint_id', 'horse__api_key'))
+    tombstones, tombstone_marks, more_tombstones = _advance(
+        {horse_id: mark[1] for horse_id, mark in marks.items()},
+        tombstones,
+        limit,
+    )
+
+    datapoints = serializers.DataPointValuesSerializer(rows, many=True).data
+    deleted = [
+        {
+            'id': tombstone['datapoint_id'],
+            'api_key': tombstone['horse__api_key'],
+        }
+        for tombstone in tombstones
+    ]
+    marks = {
+        horse_id: (datapoint_marks[horse_id], tombstone_marks[horse_id])
+        for horse_id in marks
+    }
+
+    return datapoints, deleted, marks, more_rows or more_tombstones
@@ -0,0 +1,147 @@
+"""
+Compact binary telemetry format for collar uploads.
+
+A payload is a 20 byte header followed by fixed 24 byte records, all
+little endian:
+
+    header  magic b'EQ', version (u8), reserved (u8), api_key (12 bytes),
+            record count (u32)
+    record  epoch seconds (u32), gps_lat (i32), gps_long (i32), temp (i16),
+            hr (i32), hr_interval (i32), batt (i16)
+
+Readings are stored as integers scaled by 10 ** decimal_places of the
+matching DataPoint field. The minimum value of each integer type marks a
+missing reading, and an epoch of 0 means the time the server received it.
+"""
+import struct
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.utils import timezone
+
+from core.models import DataPoint
+
+
+MEDIA_TYPE = 'application/vnd.equusense.telemetry'
+MAGIC = b'EQ'
+VERSION = 1
+HEADER = struct.Struct('<2sBB12sI')
+RECORD_DTYPE = np.dtype([
+    ('epoch', '<u4'),
+    ('gps_lat', '<i4'),
+    ('gps_long', '<i4'),
+    ('temp', '<i2'),
+    ('hr', '<i4'),
+    ('hr_interval', '<i4'),
+    ('batt', '<i2'),
+])
+VALUE_FIELDS = RECORD_DTYPE.names[1:]
+
+
+class TelemetryBatch:
+    """Decoded telemetry payload: one api_key and a structured record array."""
+
+    def __init__(self, api_key, records):
+        self.api_key = api_key
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+
+def _missing(name):
+    return np.iinfo(RECORD_DTYPE[name]).min
+
+
+def decode(payload):
+    """Return a TelemetryBatch viewing the records of payload in place."""
+    if len(payload) < HEADER.size:
+        raise ValueError('Telemetry payload is shorter than its header.')
+    magic, version, _, api_key, count = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Unsupported telemetry payload version.')
+    if len(payload) != HEADER.size + count * RECORD_DTYPE.itemsize:
+        raise ValueError(
+            'Telemetry payload length does not match its record count.'
+        )
+
+    records = np.frombuffer(
+        payload, dtype=RECORD_DTYPE, count=count, offset=HEADER.size,
+    )
+
+    return TelemetryBatch(api_key.decode('ascii', errors='replace'), records)
+
+
+def encode(api_key, readings):
+    """Encode reading dicts as a telemetry payload, for tests and tools."""
+    records = np.zeros(len(readings), dtype=RECORD_DTYPE)
+    for i, reading in enumerate(readings):
+        date_created = reading.get('date_created')
+        if date_created:
+            records['epoch'][i] = int(date_created.timestamp())
+        for name in VALUE_FIELDS:
+            value = reading.get(name)
+            if value is None:
+                records[name][i] = _missing(name)
+            else:
+                places = DataPoint._meta.get_field(name).decimal_places
+                records[name][i] = round(float(value) * 10 ** places)
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, api_key.encode('ascii'), len(records),
+    )
+
+    return header + records.tobytes()
+
+
+def validate(batch):
+    """
+    Return a list of (data, errors) pairs, one per record.
+
+    Range checks run over whole columns; Python values are only built for
+    the records that pass.
+    """
+    records = batch.records
+    errors = [None] * len(records)
+    invalid = np.zeros(len(records), dtype=bool)
+    for name in VALUE_FIELDS:
+        field = DataPoint._meta.get_field(name)
+        column = records[name].astype(np.int64)
+        bad = (
+            (column != _missing(name))
+            & (np.abs(column) >= 10 ** field.max_digits)
+        )
+        for i in np.flatnonzero(bad):
+            errors[i] = errors[i] or {}
+            errors[i][name] = [
+                f'Ensure that there are no more than {field.max_digits} '
+                f'digits in total.'
+            ]
+        invalid |= bad
+
+    now = timezone.now()
+    columns = {name: records[name].tolist() for name in RECORD_DTYPE.names}
+    places = {
+        name: DataPoint._meta.get_field(name).decimal_places
+        for name in VALUE_FIELDS
+    }
+    missing = {name: _missing(name) for name in VALUE_FIELDS}
+    results = []
+    for i in range(len(records)):
+        if invalid[i]:
+            results.append((None, errors[i]))
+            continue
+        epoch = columns['epoch'][i]
+        data = {
+            'date_created': (
+                datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+                if epoch else now
+            ),
+        }
+        for name in VALUE_FIELDS:
+            value = columns[name][i]
+            if value != missing[name]:
+                data[name] = Decimal(value).scaleb(-places[name])
+        results.append((data, None))
+
+    return results
@@ -0,0 +1,149 @@
+"""
+Tests for the data point aggregation API.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from horse.tests.test_data_api import create_user, create_horse, create_dp
+
+
+AGGREGATE_URL = reverse('horse:datapoint-aggregate')
+
+
+def local(*args):
+    """Return an aware datetime in the project time zone."""
+    return timezone.make_aware(datetime(*args))
+
+
+class AggregateApiTests(TestCase):
+    """Test time bucketed aggregation."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+
+    def test_hourly_stats(self):
+        """Test min, max, avg and count per local hour."""
+        for minute, temp in [(0, 36), (20, 38), (59, 37)]:
+            create_dp(self.user, self.horse, {
+                'date_created': local(2023, 3, 17, 10, minute),
+                'temp': temp,
+            })
+        create_dp(self.user, self.horse, {
+            'date_created': local(2023, 3, 17, 11, 5),
+            'temp': 40,
+        })
+        res = self.client.get(
+            AGGREGATE_URL, {'bucket': 'hour', 'fields': 'temp'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rows = res.data['results']
+        self.assertEqual([row['bucket'] for row in rows], [
+            local(2023, 3, 17, 10), local(2023, 3, 17, 11),
+        ])
+        self.assertEqual(rows[0]['temp']['count'], 3)
+        self.assertEqual(rows[0]['temp']['min'], Decimal('36'))
+        self.assertEqual(rows[0]['temp']['max'], Decimal('38'))
+        self.assertEqual(rows[0]['temp']['avg'], Decimal('37'))
+        self.assertEqual(rows[0]['api_key'], self.horse.api_key)
+
+    def test_day_buckets_are_local(self):
+        """Test days follow the project time zone, not UTC."""
+        # 23:30 local is already the next day in UTC
+        create_dp(self.user, self.horse, {
+            'date_created': local(2023, 3, 17, 23, 30), 'hr': 30,
+        })
+        create_dp(self.user, self.horse, {
+            'date_created': local(2023, 3, 17, 0, 30), 'hr': 32,
+        })
+        res = self.client.get(AGGREGATE_URL, {'bucket': 'day', 'fields': 'hr'})
+
+        rows = res.data['results']
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['bucket'], local(2023, 3, 17))
+        self.assertEqual(rows[0]['hr']['count'], 2)
+
+    def test_five_minute_buckets(self):
+        """Test readings group into five minute buckets."""
+        for minute in [0, 4, 5, 13]:
+            create_dp(self.user, self.horse, {
+                'date_created': local(2023, 3, 17, 10, minute),
+                'temp': 37,
+            })
+        res = self.client.get(
+            AGGREGATE_URL, {'bucket': '5min', 'fields': 'temp'},
+        )
+
+        self.assertEqual(
+            [
+                (row['bucket'], row['temp']['count'])
+                for row in res.data['results']
+            ],
+            [
+                (local(2023, 3, 17, 10, 0), 2),
+                (local(2023, 3, 17, 10, 5), 1),
+                (local(2023, 3, 17, 10, 10), 1),
+            ],
+        )
+
+    def test_fill_gaps(self):
+        """Test empty buckets in the filtered range are filled."""
+        create_dp(self.user, self.horse, {
+            'date_created': local(2023, 3, 17, 10, 30), 'temp': 37,
+        })
+        res = self.client.get(AGGREGATE_URL, {
+            'bucket': 'hour',
+            'fields': 'temp',
+            'fill': 'true',
+            'date_created__gte': local(2023, 3, 17, 9).isoformat(),
+            'date_created__lt': local(2023, 3, 17, 12).isoformat(),
+        })
+
+        rows = res.data['results']
+        self.assertEqual([row['bucket'] for row in rows], [
+            local(2023, 3, 17, 9),
+            local(2023, 3, 17, 10),
+            local(2023, 3, 17, 11),
+        ])
+        self.assertEqual([row['temp']['count'] for row in rows], [0, 1, 0])
+        self.assertIsNone(rows[0]['temp']['avg'])
+
+    def test_fill_gaps_across_dst(self):
+        """Test filled hours skip the local hour lost to daylight saving."""
+        for hour in (0, 4):
+            create_dp(self.user, self.horse, {
+                'date_created': local(2023, 3, 12, hour, 30), 'temp': 37,
+            })
+        res = self.client.get(
+            AGGREGATE_URL, {'bucket': 'hour', 'fields': 'temp', 'fill': '1'},
+        )
+
+        buckets = [row['bucket'] for row in res.data['results']]
+        self.assertEqual(len(buckets), 4)
+        for earlier, later in zip(buckets, buckets[1:]):
+            self.assertEqual(later - earlier, timedelta(hours=1))
+
+    def test_limited_to_user(self):
+        """Test other users' readings are not aggregated."""
+        other = create_user(email='other@example.com')
+        create_dp(other, create_horse(other), {
+            'date_created': local(2023, 3, 17, 10), 'temp': 37,
+        })
+        res = self.client.get(AGGREGATE_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_invalid_bucket(self):
+        """Test an unknown bucket width is rejected."""
+        res = self.client.get(AGGREGATE_URL, {'bucket': 'week'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,226 @@
+"""
+Tests for threshold alerts and their evaluation on ingest.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import AlertRule, Alert, AlertState
+from horse.tests.test_data_api import BATCH_URL, create_user, create_horse
+
+
+RULES_URL = reverse('horse:alertrule-list')
+ALERTS_URL = reverse('horse:alert-list')
+
+
+def rule_url(rule_id):
+    return reverse('horse:alertrule-detail', args=[rule_id])
+
+
+class AlertEvaluationTests(TestCase):
+    """Test alerts opened and closed by ingested readings."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        AlertRule.objects.filter(user=self.user).delete()
+        self.rule = AlertRule.objects.create(
+            user=self.user,
+            field='temp',
+            low=Decimal('36.5'),
+            high=Decimal('39.5'),
+            hysteresis=Decimal('0.5'),
+            min_duration=120,
+        )
+
+    def post(self, values, first_minute=0, horse=None):
+        """Post a reading a minute from first_minute per temperature given."""
+        horse = horse or self.horse
+        payload = [
+            {
+                'api_key': horse.api_key,
+                'date_created': (
+                    self.start + timedelta(minutes=first_minute + k)
+                ).isoformat(),
+                'temp': value,
+            }
+            for k, value in enumerate(values)
+        ]
+        res = self.client.post(BATCH_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED, res.content)
+
+    def test_default_rules(self):
+        """Test new users start with the default temperature and HR rules."""
+        user = create_user(email='new@example.com')
+
+        rules = AlertRule.objects.filter(user=user).order_by('field')
+        self.assertEqual(
+            [(rule.field, rule.low, rule.high) for rule in rules],
+            [('hr', 20, 40), ('temp', Decimal('36.5'), Decimal('39.5'))],
+        )
+
+    def test_alert_opens_after_min_duration(self):
+        """Test an alert opens after min_duration, dated when breached."""
+        self.post([38, 40, 40.2])
+        self.assertFalse(Alert.objects.exists())
+
+        self.post([39.8], first_minute=3)
+
+        alert = Alert.objects.get()
+        self.assertEqual(alert.kind, Alert.HIGH)
+        self.assertEqual(alert.date_created, self.start + timedelta(minutes=1))
+        self.assertIsNone(alert.date_closed)
+        self.assertEqual(alert.peak, Decimal('40.2'))
+
+    def test_hysteresis(self):
+        """Test an alert stays open until values are back by the hysteresis."""
+        self.post([40, 40, 40, 41])
+        self.post([39.2, 39.4], first_minute=4)
+        alert = Alert.objects.get()
+        self.assertIsNone(alert.date_closed)
+        self.assertEqual(alert.peak, 41)
+
+        self.post([38.9, 40, 38], first_minute=6)
+
+        alert.refresh_from_db()
+        self.assertEqual(alert.date_closed, self.start + timedelta(minutes=6))
+        self.assertEqual(Alert.objects.count(), 1)
+        state = AlertState.objects.get()
+        self.assertEqual(
+            (state.kind, state.alert, state.state_at),
+            (None, None, self.start + timedelta(minutes=8)),
+        )
+
+    def test_short_breach_and_low_side(self):
+        """Test short breaches open nothing and low alerts track minimums."""
+        self.post([40, 40, 38, 36, 35.5, 35.8, 37.2])
+
+        alert = Alert.objects.get()
+        self.assertEqual(
+            (alert.kind, alert.peak), (Alert.LOW, Decimal('35.5')),
+        )
+        self.assertEqual(alert.date_created, self.start + timedelta(minutes=3))
+        self.assertEqual(alert.date_closed, self.start + timedelta(minutes=6))
+
+    def test_late_readings_ignored(self):
+        """Test readings older than a rule's state are not evaluated."""
+        self.post([38], first_minute=10)
+        self.post([40, 40, 40, 40])
+
+        self.assertFalse(Alert.objects.exists())
+
+    def test_rule_scope(self):
+        """Test disabled rules and rules for other horses are skipped."""
+        other = create_horse(self.user, 'Other')
+        self.rule.horse = other
+        self.rule.save()
+        AlertRule.objects.create(
+            user=self.user, field='temp', high=30, enabled=False,
+        )
+
+        self.post([41, 41, 41])
+        self.assertFalse(Alert.objects.exists())
+
+        self.post([41, 41, 41], horse=other)
+        self.assertEqual(Alert.objects.get().horse, other)
+
+
+class AlertApiTests(TestCase):
+    """Test the alert rule and alert endpoints."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.rule = AlertRule.objects.get(user=self.user, field='temp')
+
+    def test_create_rule(self):
+        payload = {'api_key': self.horse.api_key, 'field': 'hr', 'high': 60}
+        res = self.client.post(RULES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED, res.content)
+        rule = AlertRule.objects.get(id=res.data['id'])
+        self.assertEqual(
+            (rule.user, rule.horse, rule.low), (self.user, self.horse, None),
+        )
+
+    def test_invalid_rules(self):
+        """Test missing or crossed limits and other users' horses fail."""
+        other = create_horse(create_user(email='other@example.com'), 'Other')
+        for payload in (
+            {'field': 'temp'},
+            {'field': 'temp', 'low': 40, 'high': 38},
+            {'field': 'temp', 'low': 38, 'high': 39, 'hysteresis': 1},
+            {'field': 'temp', 'high': 39, 'hysteresis': -1},
+            {'field': 'temp', 'high': 39, 'min_duration': -5},
+            {'field': 'speed', 'high': 39},
+            {'field': 'temp', 'high': 39, 'api_key': other.api_key},
+        ):
+            res = self.client.post(RULES_URL, payload, format='json')
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, payload,
+            )
+
+    def test_list_open_alerts(self):
+        """Test filtering alerts down to the open ones of the user's horses."""
+        now = timezone.now()
+        closed = Alert.objects.create(
+            rule=self.rule, horse=self.horse, kind=Alert.HIGH,
+            date_created=now - timedelta(hours=2),
+            date_closed=now - timedelta(hours=1),
+            peak=40,
+        )
+        opened = Alert.objects.create(
+            rule=self.rule, horse=self.horse, kind=Alert.LOW,
+            date_created=now, peak=36,
+        )
+        other_user = create_user(email='other@example.com')
+        Alert.objects.create(
+            rule=AlertRule.objects.filter(user=other_user).first(),
+            horse=create_horse(other_user, 'Other'),
+            kind=Alert.HIGH, date_created=now, peak=40,
+        )
+
+        res = self.client.get(ALERTS_URL)
+        self.assertEqual(
+            [alert['id'] for alert in res.data], [opened.id, closed.id],
+        )
+
+        res = self.client.get(ALERTS_URL, {'open': 'true'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([alert['id'] for alert in res.data], [opened.id])
+        self.assertEqual(res.data[0]['field'], 'temp')
+
+    def test_update_rule_resets(self):
+        """Test changing a rule's limits closes its alerts and drops states."""
+        alert = Alert.objects.create(
+            rule=self.rule, horse=self.horse, kind=Alert.HIGH,
+            date_created=timezone.now(), peak=40,
+        )
+        AlertState.objects.create(
+            rule=self.rule, horse=self.horse, kind=Alert.HIGH, alert=alert,
+            since=alert.date_created, peak=40, state_at=alert.date_created,
+        )
+
+        res = self.client.patch(
+            rule_url(self.rule.id), {'name': 'Fever'}, format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        self.assertTrue(AlertState.objects.exists())
+
+        res = self.client.patch(
+            rule_url(self.rule.id), {'high': '40.5'}, format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.date_closed)
+        self.assertFalse(AlertState.objects.exists())
@@ -0,0 +1,192 @@
+"""
+Tests for per horse baselines and anomaly flags.
+"""
+from datetime import timedelta
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Baseline, DataPoint
+from horse import baselines
+from horse.tests.test_data_api import (
+    BATCH_URL, DATAPOINT_URL, UPLOAD_URL, create_user, create_horse,
+)
+
+
+def reference_score(values, min_std):
+    """EWMA mean and variance updated value by value, z-scoring each first."""
+    mean = var = None
+    count = 0
+    scores = []
+    for value in values:
+        if np.isnan(value):
+            scores.append(np.nan)
+            continue
+        if count == 0:
+            mean, var = value, 0.0
+        diff = value - mean
+        std = max(np.sqrt(var), min_std)
+        scores.append(diff / std if count >= baselines.WARMUP else np.nan)
+        mean += baselines.ALPHA * diff
+        var = (1 - baselines.ALPHA) * (var + diff * baselines.ALPHA * diff)
+        count += 1
+    return np.array(scores), mean, var, count
+
+
+class ScoreTests(SimpleTestCase):
+    """Test vectorized baseline recursions."""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.values = 38 + rng.normal(0, 0.3, 5000)
+        self.values[rng.random(5000) < 0.1] = np.nan
+
+    def test_matches_reference(self):
+        """Test scores and the final baseline match a value by value update."""
+        z, mean, var, count = baselines.score(self.values, None, None, 0, 0.1)
+        expected_z, expected_mean, expected_var, expected_count = (
+            reference_score(self.values, 0.1)
+        )
+
+        np.testing.assert_allclose(z, expected_z, rtol=1e-9)
+        self.assertAlmostEqual(mean, expected_mean, places=9)
+        self.assertAlmostEqual(var, expected_var, places=9)
+        self.assertEqual(count, expected_count)
+
+    def test_incremental(self):
+        """Test scoring in pieces from a stored baseline equals one pass."""
+        z, *state = baselines.score(self.values, None, None, 0, 0.1)
+        pieces = []
+        piece_state = (None, None, 0)
+        for start in range(0, len(self.values), 7):
+            piece_z, *piece_state = baselines.score(
+                self.values[start:start + 7], *piece_state, 0.1,
+            )
+            pieces.append(piece_z)
+
+        np.testing.assert_allclose(np.concatenate(pieces), z, rtol=1e-9)
+        np.testing.assert_allclose(piece_state, state, rtol=1e-9)
+
+    def test_min_std(self):
+        """Test a constant signal is not flagged for a tiny change."""
+        values = np.full(100, 38.0)
+        values[-1] = 38.2
+
+        z, *_ = baselines.score(values, None, None, 0, 0.1)
+
+        self.assertAlmostEqual(z[-1], 2)
+
+
+class AnomalyIngestTests(TestCase):
+    """Test readings flagged on ingest and the anomaly filters."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        rng = np.random.default_rng(8)
+        self.temps = np.round(38 + rng.normal(0, 0.2, 200), 2)
+        self.temps[150] = 40.5
+
+    def post(self, first, last):
+        payload = [
+            {
+                'api_key': self.horse.api_key,
+                'date_created': (
+                    self.start + timedelta(minutes=k)
+                ).isoformat(),
+                'temp': float(self.temps[k]),
+                'hr': 30,
+            }
+            for k in range(first, last)
+        ]
+        res = self.client.post(BATCH_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED, res.content)
+
+    def flagged(self):
+        flagged = DataPoint.objects.filter(anomalies__isnull=False)
+        return list(
+            flagged.order_by('date_created').values_list(
+                'date_created', 'anomalies',
+            )
+        )
+
+    def test_spike_flagged(self):
+        """Test spikes are flagged however batched, and filters find them."""
+        for first in range(0, 200, 40):
+            self.post(first, first + 40)
+
+        spike = self.start + timedelta(minutes=150)
+        self.assertEqual(self.flagged(), [(spike, baselines.flag('temp'))])
+        self.assertEqual(Baseline.objects.get().temp_count, 200)
+
+        res = self.client.get(DATAPOINT_URL, {'anomaly': 'true'})
+        spike_id = DataPoint.objects.get(date_created=spike).id
+        self.assertEqual([dp['id'] for dp in res.data], [spike_id])
+        self.assertEqual(res.data[0]['anomalies'], baselines.flag('temp'))
+        res = self.client.get(DATAPOINT_URL, {'anomaly_field': 'temp'})
+        self.assertEqual(len(res.data), 1)
+        res = self.client.get(DATAPOINT_URL, {'anomaly_field': 'hr'})
+        self.assertEqual(res.data, [])
+        res = self.client.get(DATAPOINT_URL, {'anomaly': 'false'})
+        self.assertEqual(len(res.data), 199)
+
+    def test_overwrite_clears_flags(self):
+        """Test overwrites by batch or upload clear a reading's flags."""
+        self.post(0, 200)
+        spike = self.start + timedelta(minutes=150)
+        self.assertEqual(self.flagged(), [(spike, baselines.flag('temp'))])
+
+        res = self.client.post(
+            f'{UPLOAD_URL}?on_conflict=update',
+            'api_key,date_created,temp\n'
+            f'{self.horse.api_key},{spike.isoformat()},40.5',
+            content_type='text/csv',
+        )
+        self.assertEqual(res.data['updated'], 1)
+        self.assertEqual(self.flagged(), [])
+
+        DataPoint.objects.filter(date_created=spike).update(
+            anomalies=baselines.flag('temp'),
+        )
+        res = self.client.post(
+            f'{BATCH_URL}?on_conflict=update',
+            [{
+                'api_key': self.horse.api_key,
+                'date_created': spike.isoformat(),
+                'temp': 40.5,
+            }],
+            format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED, res.content)
+        self.assertEqual(self.flagged(), [])
+
+    def test_rebuild_command(self):
+        """Test rebuilding matches ingest and scores late readings too."""
+        self.post(0, 100)
+        self.post(101, 200)
+        # Late, so not scored on ingest
+        self.temps[100] = 41
+        self.post(100, 101)
+        stored = Baseline.objects.get()
+        self.assertEqual(stored.temp_count, 199)
+
+        call_command('rebuild_baselines', stdout=StringIO())
+
+        rebuilt = Baseline.objects.get()
+        self.assertEqual(rebuilt.temp_count, 200)
+        self.assertEqual(rebuilt.state_at, stored.state_at)
+        self.assertEqual(
+            [date_created for date_created, _ in self.flagged()],
+            [
+                self.start + timedelta(minutes=100),
+                self.start + timedelta(minutes=150),
+            ],
+        )
@@ -0,0 +1,146 @@
+"""
+Tests for conditional GETs of the horse and data point lists.
+"""
+import time
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Horse
+
+from horse.tests.test_data_api import (
+    DATAPOINT_URL,
+    BATCH_URL,
+    UPLOAD_URL,
+    sample_dps,
+    create_user,
+    create_horse,
+    create_dp,
+    detail_url,
+)
+
+
+HORSES_URL = reverse('horse:horse-list')
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag handling."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.dp = create_dp(self.user, self.horse, sample_dps[0])
+
+    def assertNotModified(self, url, **params):
+        etag = self.client.get(url, params)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('core_datapoint', queries[0]['sql'])
+        return etag
+
+    def assertChanged(self, url, etag):
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_horse_list_not_modified(self):
+        """Test an unchanged horse list answers 304 from the version."""
+        etag = self.assertNotModified(HORSES_URL)
+        create_horse(self.user, 'Second Horse')
+
+        self.assertChanged(HORSES_URL, etag)
+
+    def test_horse_list_rename(self):
+        """Test renaming a horse changes the horse list ETag."""
+        etag = self.client.get(HORSES_URL)['ETag']
+        url = reverse('horse:horse-detail', args=[self.horse.id])
+        self.client.patch(url, {'name': 'New'})
+
+        self.assertChanged(HORSES_URL, etag)
+
+    def test_datapoint_list_not_modified(self):
+        """Test an unchanged data point list answers 304."""
+        self.assertNotModified(DATAPOINT_URL)
+
+    def test_datapoint_list_ignores_if_modified_since(self):
+        """Test lists have no Last-Modified, so writes within a second show."""
+        res = self.client.get(DATAPOINT_URL)
+        self.assertNotIn('Last-Modified', res)
+
+        create_dp(self.user, self.horse, sample_dps[1])
+        res = self.client.get(
+            DATAPOINT_URL,
+            HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60),
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_etag_varies_with_query(self):
+        """Test every filter and format has its own ETag."""
+        plain = self.client.get(DATAPOINT_URL)['ETag']
+        filtered = self.client.get(
+            DATAPOINT_URL, {'horse__api_key': self.horse.api_key},
+        )['ETag']
+        columnar = self.client.get(
+            DATAPOINT_URL, {'format': 'columnar'},
+        )['ETag']
+
+        self.assertEqual(len({plain, filtered, columnar}), 3)
+
+    def test_writes_invalidate_datapoint_list(self):
+        """Test every write path changes the data point list ETag."""
+        other = create_user(email='other@example.com')
+        other_horse = create_horse(other, 'Other')
+        writes = [
+            lambda: self.client.post(
+                BATCH_URL,
+                [{'api_key': self.horse.api_key, **sample_dps[1]}],
+                format='json',
+            ),
+            lambda: self.client.post(
+                UPLOAD_URL,
+                f'api_key,temp\n{self.horse.api_key},37.1\n',
+                content_type='text/csv',
+            ),
+            lambda: self.client.patch(detail_url(self.dp.id), {'temp': 39.5}),
+            lambda: self.client.patch(
+                reverse('horse:horse-detail', args=[self.horse.id]),
+                {'name': 'Renamed'},
+            ),
+            lambda: self.client.delete(detail_url(self.dp.id)),
+        ]
+        for write in writes:
+            etag = self.client.get(DATAPOINT_URL)['ETag']
+            write()
+            self.assertChanged(DATAPOINT_URL, etag)
+
+        # Other users' writes leave the list alone
+        self.assertNotModified(DATAPOINT_URL)
+        create_dp(other, other_horse, sample_dps[2])
+        etag = self.client.get(DATAPOINT_URL)['ETag']
+        res = self.client.get(DATAPOINT_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_saving_stale_horse_keeps_versions(self):
+        """Test saving a horse loaded before ingest keeps ingest's columns."""
+        stale = Horse.objects.get(id=self.horse.id)
+        create_dp(self.user, self.horse, sample_dps[1])
+        stale.name = 'Stale'
+        stale.save()
+        horse = Horse.objects.get(id=self.horse.id)
+
+        self.assertEqual(horse.name, 'Stale')
+        self.assertGreater(horse.data_version, stale.data_version)
+        self.assertIsNotNone(horse.last_seen)
@@ -3,18 +3,25 @@ Tests for the DataPoints API.
 """
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.crypto import get_random_string
 
 from rest_framework import status
 from rest_framework.test import APIClient
-from datetime import datetime
+from rest_framework.renderers import JSONRenderer
+from datetime import datetime, timedelta
+import json
 from core.models import Horse, DataPoint
 
 from horse.serializers import DataPointSerializer
+from horse.custom_authentication import device_key_cache
 
 
 DATAPOINT_URL = reverse('horse:datapoint-list')
+BATCH_URL = reverse('horse:datapoint-batch')
+UPLOAD_URL = reverse('horse:datapoint-upload')
 
 sample_dps=[
     {'gps_lat': 123.456789,
@@ -178,3 +185,489 @@ class PrivateDataPointApiTests(TestCase):
         for dp in res.data:
             self.assertEqual(dp['api_key'], horse1.api_key)
 
+    def test_batch_create_datapoints(self):
+        """Test creating datapoints for several horses in one batch."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        horse2 = create_horse(self.user, "Sample Horse 2")
+        payload = [
+            {'api_key': horse1.api_key, **sample_dps[0]},
+            {'api_key': horse2.api_key, **sample_dps[1]},
+            {'api_key': horse1.api_key, **sample_dps[2]},
+        ]
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 3)
+        self.assertEqual(DataPoint.objects.filter(horse=horse1).count(), 2)
+        self.assertEqual(DataPoint.objects.filter(horse=horse2).count(), 1)
+        for item in res.data['results']:
+            self.assertEqual(item['status'], status.HTTP_201_CREATED)
+            dp = DataPoint.objects.get(id=item['id'])
+            self.assertEqual(dp.user, self.user)
+
+    def test_batch_reports_invalid_items(self):
+        """Test invalid batch items are reported while valid ones are saved."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        user2 = create_user(email="user2@example.com")
+        horse2 = create_horse(user=user2, name="test horse 2")
+        payload = [
+            {'api_key': horse1.api_key, **sample_dps[0]},
+            {'api_key': horse2.api_key, **sample_dps[1]},
+            {'api_key': horse1.api_key, 'temp': 'hot'},
+        ]
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(res.data['created'], 1)
+        results = res.data['results']
+        self.assertEqual(results[0]['status'], status.HTTP_201_CREATED)
+        self.assertEqual(results[1]['status'], status.HTTP_400_BAD_REQUEST)
+        self.assertIn('api_key', results[1]['errors'])
+        self.assertEqual(results[2]['status'], status.HTTP_400_BAD_REQUEST)
+        self.assertIn('temp', results[2]['errors'])
+        self.assertFalse(DataPoint.objects.filter(horse=horse2).exists())
+
+    def test_batch_requires_list(self):
+        """Test a batch body that is not a list is rejected."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        payload = {'api_key': horse1.api_key, **sample_dps[0]}
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DataPoint.objects.exists())
+
+    def test_upload_csv(self):
+        """Test bulk loading datapoints from a CSV body."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        lines = [
+            'api_key,date_created,gps_lat,gps_long,temp,hr,hr_interval,batt'
+        ]
+        for i, dp in enumerate(sample_dps[:3]):
+            lines.append(
+                f"{horse1.api_key},2023-03-1{i}T12:00:00,{dp['gps_lat']},"
+                f"{dp['gps_long']},{dp['temp']},{dp['hr']},"
+                f"{dp['hr_interval']},{dp['batt']}"
+            )
+        res = self.client.post(
+            UPLOAD_URL,
+            '\n'.join(lines),
+            content_type='text/csv',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 3)
+        dps = DataPoint.objects.filter(horse=horse1, user=self.user)
+        self.assertEqual(dps.count(), 3)
+        self.assertEqual(
+            sorted(float(dp.temp) for dp in dps),
+            sorted(dp['temp'] for dp in sample_dps[:3]),
+        )
+
+    def test_upload_ndjson_reports_bad_rows(self):
+        """Test bad NDJSON rows are reported without failing the load."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        user2 = create_user(email="user2@example.com")
+        horse2 = create_horse(user=user2, name="test horse 2")
+        lines = [
+            json.dumps({'api_key': horse1.api_key, **sample_dps[0]}),
+            'not json',
+            json.dumps({'api_key': horse2.api_key, **sample_dps[1]}),
+            json.dumps({'api_key': horse1.api_key, 'temp': 1234.5}),
+            json.dumps({'api_key': horse1.api_key, **sample_dps[2]}),
+        ]
+        res = self.client.post(
+            UPLOAD_URL,
+            '\n'.join(lines),
+            content_type='application/x-ndjson',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(res.data['rejected'], 3)
+        self.assertEqual(
+            sorted(error['line'] for error in res.data['errors']),
+            [2, 3, 4],
+        )
+        self.assertEqual(DataPoint.objects.filter(horse=horse1).count(), 2)
+        self.assertFalse(DataPoint.objects.filter(horse=horse2).exists())
+
+    def test_upload_unsupported_media_type(self):
+        """Test uploads must be CSV or NDJSON."""
+        res = self.client.post(UPLOAD_URL, '<xml/>', content_type='text/xml')
+
+        self.assertEqual(
+            res.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        )
+
+    def test_create_duplicate_datapoint_is_idempotent(self):
+        """Test re-posting a reading returns the stored one."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        payload = {
+            'api_key': horse1.api_key,
+            'date_created': '2023-03-17T12:00:00Z',
+            **sample_dps[0],
+        }
+        res1 = self.client.post(DATAPOINT_URL, payload)
+        res2 = self.client.post(DATAPOINT_URL, {**payload, 'temp': 38.1})
+
+        self.assertEqual(res1.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res2.data['id'], res1.data['id'])
+        dp = DataPoint.objects.get(horse=horse1)
+        self.assertEqual(float(dp.temp), sample_dps[0]['temp'])
+
+    def test_create_duplicate_datapoint_update(self):
+        """Test on_conflict=update overwrites the stored reading."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        payload = {
+            'api_key': horse1.api_key,
+            'date_created': '2023-03-17T12:00:00Z',
+            **sample_dps[0],
+        }
+        res1 = self.client.post(DATAPOINT_URL, payload)
+        res2 = self.client.post(
+            f'{DATAPOINT_URL}?on_conflict=update',
+            {**payload, 'temp': 38.1},
+        )
+
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res2.data['id'], res1.data['id'])
+        dp = DataPoint.objects.get(horse=horse1)
+        self.assertEqual(float(dp.temp), 38.1)
+
+    def test_batch_skips_duplicates(self):
+        """Test batches ignore readings that are already stored."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        item = {
+            'api_key': horse1.api_key,
+            'date_created': '2023-03-17T12:00:00Z',
+            **sample_dps[0],
+        }
+        create_dp(
+            self.user,
+            horse1,
+            {
+                'date_created': datetime.fromisoformat(
+                    '2023-03-17T12:00:00+00:00'
+                ),
+            },
+        )
+        other = {**item, 'date_created': '2023-03-17T12:05:00Z'}
+        res = self.client.post(BATCH_URL, [item, other, other], format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 1)
+        results = res.data['results']
+        self.assertTrue(results[0]['duplicate'])
+        self.assertEqual(results[1]['status'], status.HTTP_201_CREATED)
+        self.assertTrue(results[2]['duplicate'])
+        self.assertEqual(DataPoint.objects.filter(horse=horse1).count(), 2)
+
+    def test_upload_skips_duplicates(self):
+        """Test uploads ignore readings that are already stored."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        lines = ['api_key,date_created,temp']
+        lines += [f'{horse1.api_key},2023-03-17T12:00:00Z,36.5'] * 2
+        lines += [f'{horse1.api_key},2023-03-17T12:05:00Z,36.6']
+        body = '\n'.join(lines)
+        self.client.post(UPLOAD_URL, body, content_type='text/csv')
+        res = self.client.post(UPLOAD_URL, body, content_type='text/csv')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 0)
+        self.assertEqual(res.data['duplicates'], 3)
+        self.assertEqual(DataPoint.objects.filter(horse=horse1).count(), 2)
+
+    def test_upload_counts_updates(self):
+        """Test uploads overwriting stored readings count them as updated."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        lines = ['api_key,date_created,temp']
+        lines += [f'{horse1.api_key},2023-03-17T12:00:00Z,36.5']
+        self.client.post(UPLOAD_URL, '\n'.join(lines), content_type='text/csv')
+        lines[1] = lines[1].replace('36.5', '36.7')
+        lines += [f'{horse1.api_key},2023-03-17T12:05:00Z,36.6']
+        res = self.client.post(
+            f'{UPLOAD_URL}?on_conflict=update',
+            '\n'.join(lines),
+            content_type='text/csv',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((res.data['created'], res.data['updated']), (1, 1))
+        self.assertEqual(res.data['duplicates'], 0)
+        dp = DataPoint.objects.get(
+            horse=horse1, date_created='2023-03-17T12:00:00Z',
+        )
+        self.assertEqual(float(dp.temp), 36.7)
+
+    def test_invalid_on_conflict(self):
+        """Test an unknown on_conflict mode is rejected."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        payload = {'api_key': horse1.api_key, **sample_dps[0]}
+        res = self.client.post(f'{DATAPOINT_URL}?on_conflict=merge', payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def create_series(self, horse, count):
+        """Create count datapoints five minutes apart."""
+        start = datetime.fromisoformat('2023-03-17T00:00:00+00:00')
+        return [
+            create_dp(self.user, horse, {
+                'date_created': start + timedelta(minutes=5 * i),
+                'temp': 37 + i / 10,
+            })
+            for i in range(count)
+        ]
+
+    def test_cursor_pagination(self):
+        """Test paging through datapoints newest first with cursors."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        dps = self.create_series(horse1, 5)
+        ids = []
+        url = f'{DATAPOINT_URL}?page_size=2'
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                res = self.client.get(url)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                ids += [dp['id'] for dp in res.data['results']]
+                url = res.data['next']
+
+        self.assertEqual(ids, [dp.id for dp in reversed(dps)])
+        for query in queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_cursor_pagination_previous(self):
+        """Test the previous cursor returns the page before."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        self.create_series(horse1, 5)
+        page1 = self.client.get(DATAPOINT_URL, {'page_size': 2}).data
+        page2 = self.client.get(page1['next']).data
+        res = self.client.get(page2['previous'])
+
+        self.assertIsNone(page1['previous'])
+        self.assertEqual(res.data['results'], page1['results'])
+
+    def test_cursor_pagination_stable_with_new_readings(self):
+        """Test new readings do not shift later pages."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        dps = self.create_series(horse1, 4)
+        page1 = self.client.get(DATAPOINT_URL, {'page_size': 2}).data
+        create_dp(self.user, horse1, {
+            'date_created': dps[-1].date_created + timedelta(minutes=5),
+        })
+        page2 = self.client.get(page1['next']).data
+
+        self.assertEqual(
+            [dp['id'] for dp in page2['results']],
+            [dps[1].id, dps[0].id],
+        )
+
+    def test_cursor_pagination_with_filters(self):
+        """Test cursor pagination respects date filters and ordering."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        dps = self.create_series(horse1, 6)
+        params = {
+            'page_size': 2,
+            'ordering': 'date_created',
+            'horse__api_key': horse1.api_key,
+            'date_created__gte': dps[1].date_created.isoformat(),
+            'date_created__lt': dps[5].date_created.isoformat(),
+        }
+        page1 = self.client.get(DATAPOINT_URL, params).data
+        page2 = self.client.get(page1['next']).data
+
+        self.assertEqual(
+            [dp['id'] for dp in page1['results'] + page2['results']],
+            [dp.id for dp in dps[1:5]],
+        )
+        self.assertIsNone(page2['next'])
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor returns 404."""
+        res = self.client.get(DATAPOINT_URL, {'cursor': 'garbage'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_matches_model_serializer(self):
+        """Test the values() list renders what DataPointSerializer does."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        horse2 = create_horse(self.user, "Sample Horse 2")
+        for dp in sample_dps:
+            create_dp(self.user, horse1, dp)
+        create_dp(self.user, horse2, {
+            'date_created': datetime.fromisoformat(
+                '2023-07-01T12:34:56.789012+00:00'
+            ),
+            'gps_lat': -0.000001,
+            'temp': 0,
+        })
+        create_dp(self.user, horse2, {
+            'date_created': datetime.fromisoformat(
+                '2023-01-01T00:00:00+00:00'
+            ),
+        })
+        datapoints = DataPoint.objects.filter(user=self.user).order_by('-id')
+
+        def render(queryset):
+            data = DataPointSerializer(queryset, many=True).data
+            return JSONRenderer().render(data)
+
+        expected = render(datapoints)
+        self.assertEqual(self.client.get(DATAPOINT_URL).content, expected)
+        with self.settings(TIME_ZONE='UTC'):
+            expected = render(datapoints)
+            self.assertEqual(self.client.get(DATAPOINT_URL).content, expected)
+        page = self.client.get(DATAPOINT_URL, {
+            'page_size': 3, 'ordering': 'date_created',
+        })
+        ordered = datapoints.order_by('date_created', 'id')[:3]
+        self.assertEqual(page.json()['results'], json.loads(render(ordered)))
+
+    def test_columnar_format(self):
+        """Test ?format=columnar returns one array per field."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        create_dp(self.user, horse1, sample_dps[0])
+        create_dp(self.user, horse1, sample_dps[1])
+        res = self.client.get(DATAPOINT_URL, {'format': 'columnar'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['Content-Type'], 'application/vnd.equusense.columnar+json',
+        )
+        rows = self.client.get(DATAPOINT_URL).json()
+        columns = json.loads(res.content)
+        self.assertEqual(set(columns), set(rows[0]))
+        self.assertEqual(columns['id'], [row['id'] for row in rows])
+        self.assertEqual(columns['api_key'], [horse1.api_key] * 2)
+        names = ['temp', 'hr', 'hr_interval', 'gps_lat', 'gps_long', 'batt']
+        for name in names:
+            self.assertEqual(columns[name], [float(row[name]) for row in rows])
+
+    def test_columnar_format_datetimes(self):
+        """Test columnar datetimes are formatted like rows, paged or not."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        self.create_series(horse1, 3)
+        rows = self.client.get(DATAPOINT_URL).json()
+        columns = json.loads(self.client.get(
+            DATAPOINT_URL, {'format': 'columnar'},
+        ).content)
+        page = json.loads(self.client.get(
+            DATAPOINT_URL, {'format': 'columnar', 'page_size': 3},
+        ).content)
+
+        expected = [row['date_created'] for row in rows]
+        self.assertFalse(expected[0].endswith('Z'))
+        self.assertEqual(columns['date_created'], expected)
+        self.assertEqual(page['results']['date_created'], expected)
+
+    def test_columnar_format_paginated(self):
+        """Test columnar lists page with cursors like row lists."""
+        horse1 = create_horse(self.user, "Sample Horse 1")
+        dps = self.create_series(horse1, 5)
+        page1 = json.loads(self.client.get(
+            DATAPOINT_URL, {'format': 'columnar', 'page_size': 3},
+        ).content)
+        page2 = json.loads(self.client.get(page1['next']).content)
+
+        self.assertEqual(
+            page1['results']['id'] + page2['results']['id'],
+            [dp.id for dp in reversed(dps)],
+        )
+        self.assertIsNone(page2['next'])
+
+    def test_columnar_format_empty(self):
+        """Test an empty columnar list still names every field."""
+        res = self.client.get(DATAPOINT_URL, {'format': 'columnar'})
+
+        self.assertEqual(json.loads(res.content)['temp'], [])
+
+
+class DeviceDataPointApiTests(TestCase):
+    """Test requests authenticated with a horse api key."""
+
+    def setUp(self):
+        device_key_cache.clear()
+        self.user = create_user()
+        self.horse = create_horse(self.user, "Sample Horse 1")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Api-Key {self.horse.api_key}',
+        )
+
+    def test_device_create_datapoint(self):
+        """Test a device can post datapoints for its own horse."""
+        payload = {'api_key': self.horse.api_key, **sample_dps[0]}
+        res = self.client.post(DATAPOINT_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        dp = DataPoint.objects.get(id=res.data['id'])
+        self.assertEqual(dp.horse, self.horse)
+        self.assertEqual(dp.user, self.user)
+
+    def test_cached_device_create_skips_auth_queries(self):
+        """Test steady state device posts make no auth queries."""
+        payload = {'api_key': self.horse.api_key, **sample_dps[0]}
+        self.client.post(DATAPOINT_URL, payload)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(DATAPOINT_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        for query in queries:
+            # Ingest itself locks the horse and updates its latest reading
+            sql = query['sql']
+            if 'UPDATE core_horse' in sql or sql.endswith('FOR UPDATE'):
+                continue
+            self.assertNotIn('core_horse', query['sql'])
+            self.assertNotIn('authtoken', query['sql'])
+
+    def test_device_cannot_post_for_other_horse(self):
+        """Test a device cannot post datapoints for another horse."""
+        horse2 = create_horse(self.user, "Sample Horse 2")
+        payload = {'api_key': horse2.api_key, **sample_dps[0]}
+        res = self.client.post(DATAPOINT_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DataPoint.objects.exists())
+
+    def test_device_cannot_list_datapoints(self):
+        """Test device credentials are limited to ingest."""
+        res = self.client.get(DATAPOINT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_invalid_api_key(self):
+        """Test an unknown api key is rejected."""
+        self.client.credentials(HTTP_AUTHORIZATION='Api-Key notavalidkey')
+        payload = {'api_key': self.horse.api_key, **sample_dps[0]}
+        res = self.client.post(DATAPOINT_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rekeyed_horse_evicted_from_cache(self):
+        """Test changing a horse's api key invalidates the cached key."""
+        payload = {'api_key': self.horse.api_key, **sample_dps[0]}
+        self.client.post(DATAPOINT_URL, payload)
+        old_key = self.horse.api_key
+        self.assertIsNotNone(device_key_cache.get(old_key))
+
+        self.horse.api_key = get_random_string(length=12)
+        self.horse.save()
+        res = self.client.post(DATAPOINT_URL, payload)
+
+        self.assertIsNone(device_key_cache.get(old_key))
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_horse_cached_in_other_process(self):
+        """Test a key another process caches for a deleted horse is refused."""
+        payload = {'api_key': self.horse.api_key, **sample_dps[0]}
+        self.client.post(DATAPOINT_URL, payload)
+        cached = device_key_cache.get(self.horse.api_key)
+        self.horse.delete()
+        # Eviction only reaches the process that deleted the horse
+        device_key_cache.set(cached.api_key, cached)
+
+        res = self.client.post(DATAPOINT_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(device_key_cache.get(cached.api_key))
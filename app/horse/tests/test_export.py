@@ -0,0 +1,115 @@
+"""
+Tests for streaming data point exports.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from django.http import StreamingHttpResponse
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from horse import exports
+from horse.tests.test_data_api import (
+    DATAPOINT_URL,
+    create_user,
+    create_horse,
+    create_dp,
+)
+
+
+EXPORT_URL = reverse('horse:datapoint-export')
+
+
+class ExportApiTests(TestCase):
+    """Test the data point export endpoint."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        start = datetime.fromisoformat('2023-03-17T00:00:00+00:00')
+        self.dps = [
+            create_dp(self.user, self.horse, {
+                'date_created': start + timedelta(minutes=5 * i),
+                'temp': 37 + i / 10,
+                'hr': None if i % 2 else 30,
+            })
+            for i in range(5)
+        ]
+
+    def read(self, res):
+        self.assertIsInstance(res, StreamingHttpResponse)
+        return b''.join(res.streaming_content).decode()
+
+    def test_export_csv(self):
+        """Test CSV exports match the data point list, oldest first."""
+        res = self.client.get(EXPORT_URL, {'format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        self.assertIn('datapoints.csv', res['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(self.read(res))))
+        listed = list(reversed(self.client.get(DATAPOINT_URL).json()))
+        self.assertEqual(len(rows), 5)
+        for row, expected in zip(rows, listed):
+            for name, value in expected.items():
+                text = '' if value is None else str(value)
+                self.assertEqual(row[name], text)
+
+    def test_export_ndjson(self):
+        """Test NDJSON exports one object per line with the list values."""
+        res = self.client.get(EXPORT_URL, {'format': 'ndjson'})
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in self.read(res).splitlines()]
+        listed = list(reversed(self.client.get(DATAPOINT_URL).json()))
+        self.assertEqual(lines, listed)
+
+    def test_export_accept_header(self):
+        """Test the format can be negotiated with Accept."""
+        res = self.client.get(EXPORT_URL, HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+
+    def test_export_filters_and_chunks(self):
+        """Test filters apply and chunk boundaries do not drop rows."""
+        queryset = self.user.datapoint_set.filter(
+            date_created__gte=self.dps[1].date_created,
+        ).order_by('date_created', 'id')
+        content = ''.join(exports.iter_csv(queryset, chunk_size=2))
+
+        self.assertEqual(
+            [int(row['id']) for row in csv.DictReader(io.StringIO(content))],
+            [dp.id for dp in self.dps[1:]],
+        )
+
+        res = self.client.get(EXPORT_URL, {
+            'format': 'csv',
+            'date_created__gte': self.dps[3].date_created.isoformat(),
+        })
+        self.assertEqual(len(self.read(res).splitlines()), 3)
+
+    def test_export_empty_has_header(self):
+        """Test an empty CSV export still has its header row."""
+        res = self.client.get(EXPORT_URL, {
+            'format': 'csv', 'horse__api_key': 'missing',
+        })
+
+        lines = self.read(res).splitlines()
+        self.assertEqual(lines, [','.join(exports.NAMES)])
+
+    def test_export_invalid_filter(self):
+        """Test an invalid filter is rejected before streaming."""
+        for export_format in ['csv', 'ndjson']:
+            res = self.client.get(EXPORT_URL, {
+                'format': export_format, 'date_created__gte': 'soon',
+            })
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(res['Content-Type'], 'application/json')
+            self.assertIn('date_created__gte', res.json())
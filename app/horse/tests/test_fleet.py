@@ -0,0 +1,135 @@
+"""
+Tests for latest reading snapshots and the fleet API.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Horse
+from horse.tests.test_data_api import (
+    BATCH_URL,
+    create_user,
+    create_horse,
+    create_dp,
+    detail_url,
+)
+
+
+FLEET_URL = reverse('horse:horse-fleet')
+
+
+class FleetApiTests(TestCase):
+    """Test the fleet endpoint and the snapshots behind it."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def post_batch(self, readings):
+        payload = [
+            {
+                'api_key': self.horse.api_key,
+                'date_created': date.isoformat(),
+                **values,
+            }
+            for date, values in readings
+        ]
+        return self.client.post(BATCH_URL, payload, format='json')
+
+    def test_ingest_updates_snapshot(self):
+        """Test the newest reading of a batch becomes the snapshot."""
+        self.post_batch([
+            (self.now - timedelta(minutes=10), {'temp': 37.9, 'batt': 80}),
+            (
+                self.now - timedelta(minutes=5),
+                {'temp': 38.1, 'hr': 33, 'gps_lat': 51.5},
+            ),
+        ])
+        self.horse.refresh_from_db()
+
+        self.assertEqual(self.horse.last_seen, self.now - timedelta(minutes=5))
+        self.assertEqual(self.horse.latest_temp, Decimal('38.1'))
+        self.assertEqual(self.horse.latest_hr, Decimal('33'))
+        self.assertIsNone(self.horse.latest_batt)
+
+    def test_late_reading_does_not_regress_snapshot(self):
+        """Test backfilled readings leave a newer snapshot alone."""
+        self.post_batch([(self.now, {'temp': 38})])
+        self.post_batch([(self.now - timedelta(hours=3), {'temp': 41})])
+        self.horse.refresh_from_db()
+
+        self.assertEqual(self.horse.last_seen, self.now)
+        self.assertEqual(self.horse.latest_temp, Decimal('38'))
+
+    def test_delete_latest_reading_refreshes_snapshot(self):
+        """Test deleting the newest reading falls back to the one before."""
+        create_dp(self.user, self.horse, {
+            'date_created': self.now - timedelta(minutes=5), 'temp': 37.6,
+        })
+        latest = create_dp(self.user, self.horse, {
+            'date_created': self.now, 'temp': 39,
+        })
+        self.client.delete(detail_url(latest.id))
+        self.horse.refresh_from_db()
+
+        self.assertEqual(self.horse.last_seen, self.now - timedelta(minutes=5))
+        self.assertEqual(self.horse.latest_temp, Decimal('37.6'))
+
+    def test_fleet_statuses(self):
+        """Test the fleet lists every horse with its status in one query."""
+        fever = create_horse(self.user, 'Fever')
+        create_dp(self.user, fever, {'temp': 40, 'hr': 35, 'batt': 90})
+        offline = create_horse(self.user, 'Offline')
+        create_dp(self.user, offline, {
+            'date_created': self.now - timedelta(days=1), 'temp': 38,
+        })
+        low = create_horse(self.user, 'Low battery')
+        create_dp(self.user, low, {'temp': 38, 'batt': 5})
+        healthy = create_horse(self.user, 'Healthy')
+        create_dp(self.user, healthy, {'temp': 38, 'hr': 36, 'batt': 70})
+        create_horse(create_user(email='other@example.com'), 'Other')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(FLEET_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        statuses = {horse['name']: horse['status'] for horse in res.data}
+        self.assertEqual(statuses, {
+            self.horse.name: 'no_data',
+            'Fever': 'out_of_range',
+            'Offline': 'offline',
+            'Low battery': 'low_battery',
+            'Healthy': 'ok',
+        })
+        healthy_data = next(
+            horse for horse in res.data if horse['name'] == 'Healthy'
+        )
+        self.assertEqual(Decimal(healthy_data['latest_batt']), Decimal(70))
+
+    def test_fleet_status_filter(self):
+        """Test filtering the fleet by status."""
+        create_dp(self.user, self.horse, {'temp': 36})
+        create_horse(self.user, 'Quiet')
+        res = self.client.get(FLEET_URL, {'status': 'out_of_range'})
+
+        self.assertEqual([horse['id'] for horse in res.data], [self.horse.id])
+
+    def test_snapshot_not_editable(self):
+        """Test horse updates cannot set the snapshot."""
+        url = reverse('horse:horse-detail', args=[self.horse.id])
+        self.client.patch(url, {'latest_temp': 39, 'name': 'Renamed'})
+        horse = Horse.objects.get(id=self.horse.id)
+
+        self.assertEqual(horse.name, 'Renamed')
+        self.assertIsNone(horse.latest_temp)
@@ -0,0 +1,214 @@
+"""
+Tests for geocells and the spatial data point filters.
+"""
+import random
+from datetime import timedelta
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import DataPoint
+from horse import geo
+from horse.tests.test_data_api import (
+    BATCH_URL,
+    DATAPOINT_URL,
+    UPLOAD_URL,
+    create_user,
+    create_horse,
+    create_dp,
+)
+
+
+BARN = (51.0447, -114.0719)
+
+
+class GeocellTests(SimpleTestCase):
+    """Test geocell encoding and covering."""
+
+    def test_encode_array_matches_encode(self):
+        """Test vectorized encoding agrees with scalar encoding."""
+        rng = random.Random(1)
+        lats = [rng.uniform(-90, 90) for _ in range(500)]
+        lats += [90, -90, 95, float('nan')]
+        longs = [rng.uniform(-180, 180) for _ in range(500)]
+        longs += [180, -180, 0, 0]
+        expected = [
+            None if np.isnan(lat) else geo.encode(lat, long)
+            for lat, long in zip(lats, longs)
+        ]
+
+        self.assertEqual(geo.encode_array(lats, longs), expected)
+        self.assertIsNone(geo.encode(95, 0))
+        self.assertIsNone(geo.encode(None, 0))
+
+    def test_cover_contains_points_in_box(self):
+        """Test every position inside a box falls in one of its ranges."""
+        rng = random.Random(2)
+        for _ in range(50):
+            lat, long = rng.uniform(-80, 80), rng.uniform(-170, 170)
+            size = 10 ** rng.uniform(-4, 1)
+            box = (lat, long, lat + size, long + size * 2)
+            ranges = geo.cover(*box)
+            self.assertLessEqual(len(ranges), geo.MAX_COVER_CELLS)
+            for _ in range(20):
+                cell = geo.encode(
+                    rng.uniform(box[0], box[2]), rng.uniform(box[1], box[3]),
+                )
+                self.assertTrue(
+                    any(start <= cell <= end for start, end in ranges)
+                )
+
+    def test_haversine(self):
+        """Test haversine distances in meters."""
+        distances = geo.haversine(
+            [0, BARN[0]], [0, BARN[1]], [1, BARN[0]], [0, BARN[1]],
+        )
+
+        self.assertAlmostEqual(distances[0], 111195, delta=1)
+        self.assertEqual(distances[1], 0)
+
+    def test_circle_bounds_contain_circle(self):
+        """Test positions within a circle's radius fall inside its bounds."""
+        rng = random.Random(3)
+        for _ in range(200):
+            lat, long = rng.uniform(-89, 89), rng.uniform(-180, 180)
+            meters = 10 ** rng.uniform(2, 7)
+            min_lat, min_long, max_lat, max_long = geo.circle_bounds(
+                lat, long, meters,
+            )
+            points = np.array([
+                (rng.uniform(-90, 90), rng.uniform(-180, 180))
+                for _ in range(200)
+            ])
+            distances = geo.haversine(lat, long, points[:, 0], points[:, 1])
+            inside = distances <= meters
+            for point_lat, point_long in points[inside]:
+                self.assertTrue(min_lat <= point_lat <= max_lat)
+                self.assertTrue(min_long <= point_long <= max_long)
+
+
+class SpatialFilterApiTests(TestCase):
+    """Test the bounding box and radius filters."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def add(self, lat, long, minutes=0):
+        return create_dp(self.user, self.horse, {
+            'date_created': self.now - timedelta(minutes=minutes),
+            'gps_lat': round(lat, 6),
+            'gps_long': round(long, 6),
+        })
+
+    def ids(self, **params):
+        res = self.client.get(DATAPOINT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        return sorted(dp['id'] for dp in res.data)
+
+    def test_bbox(self):
+        """Test only readings inside the box are listed."""
+        inside = self.add(51.05, -114.07, 1)
+        edge = self.add(51.06, -114.06, 2)
+        self.add(51.07, -114.07, 3)
+        self.add(51.05, -114.05, 4)
+        create_dp(self.user, self.horse, {
+            'date_created': self.now - timedelta(minutes=5),
+        })
+
+        self.assertEqual(
+            self.ids(bbox='51.04,-114.08,51.06,-114.06'),
+            sorted([inside.id, edge.id]),
+        )
+
+    def test_near(self):
+        """Test the radius filter refines candidates by their distance."""
+        barn = self.add(*BARN, 1)
+        # About 450 m north and 550 m east of the barn
+        north = self.add(BARN[0] + 0.00405, BARN[1], 2)
+        east = self.add(BARN[0], BARN[1] + 0.0078, 3)
+
+        self.assertEqual(
+            self.ids(near=f'{BARN[0]},{BARN[1]},500'),
+            sorted([barn.id, north.id]),
+        )
+        self.assertEqual(
+            self.ids(near=f'{BARN[0]},{BARN[1]},600'),
+            sorted([barn.id, north.id, east.id]),
+        )
+
+    def test_near_antipode(self):
+        """Test a radius reaching the far side of the earth still works."""
+        near = self.add(0.007496, 0, 1)
+        # Its half chord to the point rounds to just above 1
+        self.add(-0.007496, 180, 2)
+
+        self.assertEqual(self.ids(near='0.007496,0,20000000'), [near.id])
+        self.assertEqual(len(self.ids(near='0.007496,0,20100000')), 2)
+
+    def test_combined_with_horse_and_time(self):
+        """Test spatial filters combine with the other filters."""
+        recent = self.add(*BARN, 1)
+        self.add(*BARN, 120)
+        other = create_horse(self.user, 'Other')
+        create_dp(self.user, other, {'gps_lat': BARN[0], 'gps_long': BARN[1]})
+
+        self.assertEqual(
+            self.ids(
+                near=f'{BARN[0]},{BARN[1]},100',
+                horse__api_key=self.horse.api_key,
+                date_created__gte=(self.now - timedelta(hours=1)).isoformat(),
+            ),
+            [recent.id],
+        )
+
+    def test_invalid_filters(self):
+        """Test malformed areas are rejected."""
+        for params in (
+            {'bbox': '1,2,3'},
+            {'bbox': '51,-114,50,-113'},
+            {'bbox': 'a,b,c,d'},
+            {'near': '91,0,100'},
+            {'near': '51,-114,0'},
+        ):
+            res = self.client.get(DATAPOINT_URL, params)
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params,
+            )
+
+    def test_ingest_assigns_geocells(self):
+        """Test every ingest path stores the geocell of valid positions."""
+        payload = [
+            {
+                'api_key': self.horse.api_key,
+                'date_created': self.now.isoformat(),
+                'gps_lat': BARN[0],
+                'gps_long': BARN[1],
+            },
+            {
+                'api_key': self.horse.api_key,
+                'date_created': (self.now - timedelta(minutes=1)).isoformat(),
+                'gps_lat': 123.4,
+            },
+        ]
+        self.client.post(BATCH_URL, payload, format='json')
+        uploaded = self.now - timedelta(minutes=2)
+        upload = (
+            'api_key,date_created,gps_lat,gps_long\n'
+            f'{self.horse.api_key},{uploaded.isoformat()},51.1,-114.1\n'
+        )
+        self.client.generic(
+            'POST', UPLOAD_URL, upload, content_type='text/csv',
+        )
+        self.add(51.2, -114.2, 3)
+
+        for dp in DataPoint.objects.all():
+            self.assertEqual(dp.geocell, geo.encode(dp.gps_lat, dp.gps_long))
+        located = DataPoint.objects.filter(geocell__isnull=False)
+        self.assertEqual(located.count(), 3)
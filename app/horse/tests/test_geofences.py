@@ -0,0 +1,228 @@
+"""
+Tests for geofences and their evaluation on ingest.
+"""
+import random
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Geofence, GeofenceEvent
+from horse import geofences
+from horse.tests.test_data_api import (
+    BATCH_URL,
+    DATAPOINT_URL,
+    UPLOAD_URL,
+    create_user,
+    create_horse,
+)
+
+
+GEOFENCES_URL = reverse('horse:geofence-list')
+EVENTS_URL = reverse('horse:geofenceevent-list')
+
+# A paddock shaped like an L, so the notch is outside
+PADDOCK = [
+    [51.0, -114.0], [51.0, -113.98], [51.01, -113.98],
+    [51.01, -113.99], [51.02, -113.99], [51.02, -114.0],
+]
+INSIDE = (51.005, -113.99)
+NOTCH = (51.015, -113.985)
+OUTSIDE = (51.03, -114.01)
+
+
+def fence_url(fence_id):
+    return reverse('horse:geofence-detail', args=[fence_id])
+
+
+def contains_scalar(vertices, lat, long):
+    """Reference even-odd test, one position at a time."""
+    inside = False
+    edges = zip(vertices, vertices[1:] + vertices[:1])
+    for (lat1, long1), (lat2, long2) in edges:
+        if (lat1 > lat) != (lat2 > lat):
+            if long < long1 + (lat - lat1) * (long2 - long1) / (lat2 - lat1):
+                inside = not inside
+    return inside
+
+
+class CompiledFenceTests(SimpleTestCase):
+    """Test vectorized point in polygon tests."""
+
+    def test_concave_polygon(self):
+        """Test positions in the notch of a concave polygon are outside."""
+        fence = geofences.CompiledFence(PADDOCK)
+        lats, longs = zip(INSIDE, NOTCH, OUTSIDE)
+
+        self.assertEqual(
+            fence.contains(lats, longs).tolist(), [True, False, False],
+        )
+
+    def test_matches_scalar_test(self):
+        """Test vectorized results agree with a position by position test."""
+        rng = random.Random(3)
+        vertices = [
+            [51 + rng.uniform(-0.01, 0.01), -114 + rng.uniform(-0.01, 0.01)]
+            for _ in range(12)
+        ]
+        lats = [51 + rng.uniform(-0.012, 0.012) for _ in range(2000)]
+        longs = [-114 + rng.uniform(-0.012, 0.012) for _ in range(2000)]
+
+        # Small chunks so several are tested
+        with patch.object(geofences, 'CHUNK_SIZE', 64):
+            fence = geofences.CompiledFence(vertices)
+            inside = fence.contains(lats, longs).tolist()
+
+        self.assertEqual(inside, [
+            contains_scalar(vertices, lat, long)
+            for lat, long in zip(lats, longs)
+        ])
+
+
+class GeofenceApiTests(TestCase):
+    """Test managing geofences and recording their transitions."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.now = timezone.now().replace(microsecond=0)
+        self.minute = 0
+        res = self.client.post(GEOFENCES_URL, {
+            'api_key': self.horse.api_key,
+            'name': 'Paddock',
+            'vertices': PADDOCK,
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED, res.content)
+        self.fence = Geofence.objects.get(id=res.data['id'])
+
+    def reading(self, position, minute=None):
+        if minute is None:
+            self.minute += 1
+            minute = self.minute
+        return {
+            'api_key': self.horse.api_key,
+            'date_created': (self.now + timedelta(minutes=minute)).isoformat(),
+            'gps_lat': position[0],
+            'gps_long': position[1],
+        }
+
+    def post_batch(self, *positions):
+        payload = [self.reading(p) for p in positions]
+        res = self.client.post(BATCH_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED, res.content)
+        return [result['id'] for result in res.data['results']]
+
+    def events(self):
+        events = GeofenceEvent.objects.order_by('date_created')
+        return list(events.values_list('kind', 'datapoint_id'))
+
+    def test_batch_transitions(self):
+        """Test only readings crossing the boundary are recorded."""
+        ids = self.post_batch(INSIDE, INSIDE, NOTCH, OUTSIDE, INSIDE, INSIDE)
+
+        self.assertEqual(self.events(), [('exit', ids[2]), ('enter', ids[4])])
+        self.fence.refresh_from_db()
+        self.assertTrue(self.fence.inside)
+        self.assertEqual(self.fence.state_at, self.now + timedelta(minutes=6))
+
+    def test_transitions_across_requests(self):
+        """Test state carries over between single readings and batches."""
+        self.post_batch(INSIDE)
+        res = self.client.post(
+            DATAPOINT_URL, self.reading(OUTSIDE), format='json',
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        upload = 'api_key,date_created,gps_lat,gps_long\n' + ''.join(
+            '{api_key},{date_created},{gps_lat},{gps_long}\n'.format(
+                **self.reading(position)
+            )
+            for position in (OUTSIDE, INSIDE)
+        )
+        self.client.generic(
+            'POST', UPLOAD_URL, upload, content_type='text/csv',
+        )
+
+        kinds = [kind for kind, _ in self.events()]
+        self.assertEqual(kinds, ['exit', 'enter'])
+        self.assertEqual(self.events()[0][1], res.data['id'])
+
+    def test_late_and_unpositioned_readings_ignored(self):
+        """Test late readings and readings without a position are ignored."""
+        self.post_batch(INSIDE)
+        res = self.client.post(BATCH_URL, [
+            self.reading(OUTSIDE, minute=-5),
+            {
+                'api_key': self.horse.api_key,
+                'date_created': (self.now + timedelta(minutes=5)).isoformat(),
+            },
+        ], format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(self.events(), [])
+        self.fence.refresh_from_db()
+        self.assertEqual(self.fence.state_at, self.now + timedelta(minutes=1))
+
+    def test_reshaped_fence(self):
+        """Test a changed shape is used right away and restarts its state."""
+        self.post_batch(INSIDE)
+        res = self.client.patch(fence_url(self.fence.id), {
+            'vertices': [
+                [51.02, -114.02], [51.02, -114.0],
+                [51.04, -114.0], [51.04, -114.02],
+            ],
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['inside'])
+
+        self.post_batch(OUTSIDE, INSIDE)
+        self.assertEqual([kind for kind, _ in self.events()], ['exit'])
+
+    def test_events_list(self):
+        """Test events are listed newest first and can be filtered."""
+        self.post_batch(INSIDE, OUTSIDE, INSIDE)
+        other = create_user(email='other@example.com')
+        create_horse(other, 'Other')
+
+        res = self.client.get(EVENTS_URL)
+        kinds = [event['kind'] for event in res.data]
+        self.assertEqual(kinds, ['enter', 'exit'])
+        self.assertEqual(res.data[0]['fence_name'], 'Paddock')
+        self.assertEqual(res.data[0]['api_key'], self.horse.api_key)
+
+        res = self.client.get(EVENTS_URL, {
+            'kind': 'exit', 'horse__api_key': self.horse.api_key,
+        })
+        self.assertEqual([event['kind'] for event in res.data], ['exit'])
+
+        other_client = APIClient()
+        other_client.force_authenticate(other)
+        self.assertEqual(other_client.get(EVENTS_URL).data, [])
+        self.assertEqual(other_client.get(GEOFENCES_URL).data, [])
+
+    def test_invalid_fences(self):
+        """Test bad vertices and other users' horses are rejected."""
+        other = create_user(email='other@example.com')
+        other_horse = create_horse(other, 'Other')
+        for payload in (
+            {'vertices': [[51, -114], [51.1, -114]]},
+            {'vertices': [[51, -114], [51.1, -114], [91, -114]]},
+            {'vertices': [[51, -114], [51.1, -114], ['a', -114]]},
+            {'vertices': {'lat': 51}},
+            {'api_key': other_horse.api_key},
+        ):
+            data = {
+                'api_key': self.horse.api_key,
+                'name': 'Bad',
+                'vertices': PADDOCK,
+                **payload,
+            }
+            res = self.client.post(GEOFENCES_URL, data, format='json')
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, payload,
+            )
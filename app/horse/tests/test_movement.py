@@ -0,0 +1,184 @@
+"""
+Tests for movement analytics.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import DailyMovement
+from horse import geo, movement
+from horse.rollups import local_midnight
+from horse.tests.test_data_api import (
+    BATCH_URL, create_user, create_horse, create_dp,
+)
+
+
+DAY = date(2024, 5, 1)
+STEP = 60
+# Degrees of latitude in 60 m, walked in one step at 1 m/s
+WALK = 60 / geo.METERS_PER_DEGREE
+# Degrees of latitude in 1 m of GPS wander
+WANDER = 1 / geo.METERS_PER_DEGREE
+
+
+def movement_url(horse_id):
+    return reverse('horse:horse-movement', args=[horse_id])
+
+
+class Path:
+    """Fixes built one step at a time."""
+
+    def __init__(self, start):
+        self.epochs = [start.timestamp()]
+        self.lats = [51.0]
+
+    def walk(self, steps, degrees=WALK, seconds=STEP):
+        for _ in range(steps):
+            self.epochs.append(self.epochs[-1] + seconds)
+            self.lats.append(self.lats[-1] + degrees)
+        return self
+
+    def wander(self, steps):
+        for step in range(steps):
+            self.walk(1, WANDER if step % 2 else -WANDER)
+        return self
+
+    def arrays(self):
+        longs = np.full(len(self.lats), -114.0)
+        return np.array(self.epochs), np.array(self.lats), longs
+
+
+class SummarizeTests(SimpleTestCase):
+    """Test daily movement summaries."""
+
+    def test_walks_and_rests(self):
+        """Test distance, moving time and rest periods of one day."""
+        path = Path(local_midnight(DAY) + timedelta(hours=8))
+        path.walk(10).wander(10).walk(5).wander(2).walk(5)
+        # Not tracked for twenty minutes, then three more steps
+        path.walk(1, seconds=1200).walk(3)
+
+        summary, = movement.summarize(*path.arrays(), DAY, DAY)
+
+        self.assertEqual(summary.day, DAY)
+        self.assertEqual(summary.fixes, 37)
+        self.assertAlmostEqual(summary.distance, 23 * 60, places=3)
+        self.assertEqual(summary.rest_periods, 1)
+        self.assertEqual(summary.resting_seconds, 600)
+        self.assertEqual(summary.longest_rest, 600)
+        self.assertEqual(summary.moving_seconds, 25 * STEP)
+        self.assertAlmostEqual(summary.max_speed, 1, places=3)
+
+    def test_rest_split_at_midnight(self):
+        """Test steps count on the day they end, and rests end at midnight."""
+        next_day = DAY + timedelta(days=1)
+        path = Path(local_midnight(next_day) - timedelta(minutes=8))
+        path.wander(16)
+
+        first, second = movement.summarize(*path.arrays(), DAY, next_day)
+
+        self.assertEqual((first.fixes, second.fixes), (8, 9))
+        # The step ending at midnight belongs to the new day
+        self.assertEqual(
+            (first.rest_periods, first.resting_seconds), (1, 420),
+        )
+        self.assertEqual(
+            (second.rest_periods, second.resting_seconds), (1, 540),
+        )
+        self.assertEqual(first.distance + second.distance, 0)
+
+    def test_no_fixes(self):
+        empty = np.array([])
+        summary, = movement.summarize(empty, empty, empty, DAY, DAY)
+
+        self.assertEqual(
+            (summary.fixes, summary.distance, summary.max_speed), (0, 0, 0),
+        )
+
+
+class MovementApiTests(TestCase):
+    """Test the daily movement endpoint."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+
+    def walk(self, start, steps):
+        for step in range(steps + 1):
+            create_dp(self.user, self.horse, {
+                'date_created': start + timedelta(seconds=step * STEP),
+                'gps_lat': round(51 + step * WALK, 6),
+                'gps_long': -114,
+            })
+
+    def get_days(self, **params):
+        res = self.client.get(movement_url(self.horse.id), params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        return {day['day']: day for day in res.data['days']}
+
+    def test_closed_days_stored(self):
+        """Test closed days are computed once and today always recomputed."""
+        yesterday, today = self.yesterday.isoformat(), self.today.isoformat()
+        self.walk(local_midnight(self.yesterday) + timedelta(hours=12), 10)
+        days = self.get_days(start=yesterday, end=today)
+
+        self.assertEqual(list(days), [yesterday, today])
+        self.assertEqual(days[yesterday]['fixes'], 11)
+        self.assertAlmostEqual(days[yesterday]['distance'], 600, delta=1)
+        self.assertEqual(
+            list(DailyMovement.objects.values_list('day', flat=True)),
+            [self.yesterday],
+        )
+
+        DailyMovement.objects.update(fixes=99)
+        days = self.get_days(start=yesterday, end=today)
+        self.assertEqual(days[yesterday]['fixes'], 99)
+
+    def test_late_reading_drops_stored_day(self):
+        """Test a reading written for a closed day drops its stored summary."""
+        yesterday = self.yesterday.isoformat()
+        self.walk(local_midnight(self.yesterday) + timedelta(hours=12), 2)
+        self.get_days(start=yesterday, end=yesterday)
+        self.assertEqual(DailyMovement.objects.count(), 1)
+
+        payload = [{
+            'api_key': self.horse.api_key,
+            'date_created': (
+                local_midnight(self.yesterday) + timedelta(hours=13)
+            ).isoformat(),
+            'gps_lat': 51.1,
+            'gps_long': -114,
+        }]
+        self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(DailyMovement.objects.count(), 0)
+        days = self.get_days(start=yesterday, end=yesterday)
+        self.assertEqual(days[yesterday]['fixes'], 4)
+
+    def test_default_week(self):
+        days = self.get_days()
+
+        self.assertEqual(len(days), 7)
+        self.assertEqual(max(days), self.today.isoformat())
+
+    def test_invalid_days(self):
+        """Test malformed, reversed and too long ranges are rejected."""
+        for params in (
+            {'start': 'yesterday'},
+            {'end': '2024-02-30'},
+            {'start': '2024-05-02', 'end': '2024-05-01'},
+            {'start': '2024-01-01', 'end': '2024-12-31'},
+        ):
+            res = self.client.get(movement_url(self.horse.id), params)
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params,
+            )
@@ -0,0 +1,140 @@
+"""
+Tests that horse API query counts do not grow with result size.
+"""
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from horse.tests.test_data_api import (
+    BATCH_URL,
+    DATAPOINT_URL,
+    create_user,
+    create_horse,
+    create_dp,
+    detail_url,
+)
+
+
+HORSES_URL = reverse('horse:horse-list')
+FLEET_URL = reverse('horse:horse-fleet')
+AGGREGATE_URL = reverse('horse:datapoint-aggregate')
+EXPORT_URL = reverse('horse:datapoint-export')
+SYNC_URL = reverse('horse:datapoint-sync')
+
+
+def series_url(horse_id):
+    return reverse('horse:horse-chart-series', args=[horse_id])
+
+
+class QueryBudgetApiTests(TestCase):
+    """Test API requests within their query budgets at any size."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        # Authenticate with a token so budgets include the lookup
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.now = timezone.now().replace(microsecond=0)
+        self.horses = []
+
+    def add_data(self, horses, readings):
+        """Add horses, each with readings a minute apart."""
+        for _ in range(horses):
+            horse = create_horse(self.user, f'Horse {len(self.horses)}')
+            self.horses.append(horse)
+            for minute in range(readings):
+                create_dp(self.user, horse, {
+                    'date_created': self.now - timedelta(minutes=minute),
+                    'temp': 38,
+                    'hr': 30,
+                })
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            res = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(res.status_code, 300, res.content)
+
+        return len(queries)
+
+    def assertSameQueries(self, method, url_or_factory, data_or_factory=None):
+        """Assert a request runs as many queries with more horses and data."""
+        def request():
+            url, data = url_or_factory, data_or_factory
+            if callable(url):
+                url = url()
+            if callable(data):
+                data = data()
+            return self.count_queries(method, url, data)
+
+        self.add_data(1, 2)
+        small = request()
+        self.add_data(4, 20)
+        self.assertEqual(request(), small)
+
+    def test_horse_list(self):
+        self.assertSameQueries('get', HORSES_URL)
+
+    def test_fleet(self):
+        self.assertSameQueries('get', FLEET_URL)
+
+    def test_series(self):
+        self.assertSameQueries('get', lambda: series_url(self.horses[-1].id))
+
+    def test_datapoint_list(self):
+        self.assertSameQueries('get', DATAPOINT_URL)
+
+    def test_datapoint_page(self):
+        self.assertSameQueries('get', DATAPOINT_URL, {'page_size': 10})
+
+    def test_aggregate(self):
+        self.assertSameQueries('get', AGGREGATE_URL, {'bucket': 'hour'})
+
+    def test_sync(self):
+        self.assertSameQueries('get', SYNC_URL)
+
+    def test_update(self):
+        def url():
+            return detail_url(self.horses[-1].datapoint_set.latest('id').id)
+        self.assertSameQueries('patch', url, {'temp': 39})
+
+    def test_batch(self):
+        """Test batches spanning many horses resolve them together."""
+        def payload():
+            return [
+                {
+                    'api_key': horse.api_key,
+                    'date_created': (
+                        self.now + timedelta(minutes=minute)
+                    ).isoformat(),
+                    'temp': 38,
+                }
+                for horse in self.horses
+                for minute in range(1, 6)
+            ]
+        self.assertSameQueries('post', BATCH_URL, payload)
+
+    def test_large_batch_single_statement(self):
+        """Test a full batch is written within the budget."""
+        self.add_data(1, 0)
+        horse = self.horses[0]
+        payload = [
+            {
+                'api_key': horse.api_key,
+                'date_created': (
+                    self.now + timedelta(seconds=second)
+                ).isoformat(),
+            }
+            for second in range(2000)
+        ]
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 2000)
@@ -0,0 +1,271 @@
+"""
+Tests for hourly and daily rollups.
+"""
+from datetime import date, datetime, timedelta
+from io import StringIO
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    DataPoint,
+    HourlyRollup,
+    DailyRollup,
+    DailyMovement,
+    RollupRebuild,
+)
+from horse import aggregation
+from horse.tests.test_data_api import (
+    BATCH_URL,
+    UPLOAD_URL,
+    create_user,
+    create_horse,
+    create_dp,
+    detail_url,
+)
+
+
+AGGREGATE_URL = reverse('horse:datapoint-aggregate')
+
+
+def local(*args):
+    """Return an aware datetime in the project time zone."""
+    return timezone.make_aware(datetime(*args))
+
+
+class RollupTests(TestCase):
+    """Test rollups follow ingest and edits."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+
+    def post_batch(self, readings, **params):
+        payload = [
+            {
+                'api_key': self.horse.api_key,
+                'date_created': date.isoformat(),
+                'temp': temp,
+            }
+            for date, temp in readings
+        ]
+        url = BATCH_URL
+        if params:
+            url += '?' + '&'.join(
+                f'{key}={value}' for key, value in params.items()
+            )
+        return self.client.post(url, payload, format='json')
+
+    def assertHour(self, hour, count, total, low, high):
+        rollup = HourlyRollup.objects.get(horse=self.horse, hour=hour)
+        self.assertEqual(
+            (
+                rollup.temp_count, rollup.temp_sum,
+                rollup.temp_min, rollup.temp_max,
+            ),
+            (count, Decimal(total), Decimal(low), Decimal(high)),
+        )
+
+    def test_batch_ingest_adds_to_rollups(self):
+        """Test batch ingest upserts hourly and daily rollups."""
+        self.post_batch([
+            (local(2023, 3, 17, 10, 0), 36), (local(2023, 3, 17, 10, 30), 38),
+        ])
+        self.post_batch([
+            (local(2023, 3, 17, 10, 45), 40), (local(2023, 3, 17, 23, 50), 35),
+        ])
+
+        self.assertHour(local(2023, 3, 17, 10), 3, 114, 36, 40)
+        self.assertHour(local(2023, 3, 17, 23), 1, 35, 35, 35)
+        daily = DailyRollup.objects.get(horse=self.horse)
+        self.assertEqual(daily.day.isoformat(), '2023-03-17')
+        self.assertEqual((daily.temp_count, daily.temp_sum), (4, Decimal(149)))
+        self.assertEqual(daily.hr_count, 0)
+        self.assertIsNone(daily.hr_min)
+
+    def test_duplicates_not_counted(self):
+        """Test an ignored duplicate leaves rollups unchanged."""
+        self.post_batch([(local(2023, 3, 17, 10), 36)])
+        self.post_batch([(local(2023, 3, 17, 10), 39)])
+
+        self.assertHour(local(2023, 3, 17, 10), 1, 36, 36, 36)
+
+    def test_overwrite_recomputes_bucket(self):
+        """Test on_conflict=update replaces the reading in rollups."""
+        self.post_batch([
+            (local(2023, 3, 17, 10), 36), (local(2023, 3, 17, 10, 5), 37),
+        ])
+        self.post_batch([(local(2023, 3, 17, 10), 39)], on_conflict='update')
+
+        self.assertHour(local(2023, 3, 17, 10), 2, 76, 37, 39)
+
+    def test_upload_adds_to_rollups(self):
+        """Test COPY uploads update rollups."""
+        first, second = local(2023, 3, 17, 10), local(2023, 3, 17, 10, 5)
+        body = (
+            'api_key,date_created,temp\n'
+            f'{self.horse.api_key},{first.isoformat()},36.5\n'
+            f'{self.horse.api_key},{second.isoformat()},37.5\n'
+        )
+        res = self.client.post(UPLOAD_URL, body, content_type='text/csv')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertHour(local(2023, 3, 17, 10), 2, 74, '36.5', '37.5')
+
+    def test_edit_and_delete_refresh_rollups(self):
+        """Test moving and deleting readings recomputes their buckets."""
+        dp1 = create_dp(self.user, self.horse, {
+            'date_created': local(2023, 3, 17, 10), 'temp': 36,
+        })
+        dp2 = create_dp(self.user, self.horse, {
+            'date_created': local(2023, 3, 17, 10, 5), 'temp': 38,
+        })
+        self.client.patch(detail_url(dp1.id), {
+            'date_created': local(2023, 3, 17, 11).isoformat(),
+        })
+
+        self.assertHour(local(2023, 3, 17, 10), 1, 38, 38, 38)
+        self.assertHour(local(2023, 3, 17, 11), 1, 36, 36, 36)
+
+        self.client.delete(detail_url(dp2.id))
+
+        self.assertFalse(
+            HourlyRollup.objects.filter(hour=local(2023, 3, 17, 10)).exists()
+        )
+        daily = DailyRollup.objects.get(horse=self.horse)
+        self.assertEqual(daily.temp_count, 1)
+
+    def test_orm_delete_refreshes_summaries(self):
+        """Test deleting with the ORM updates what summarized the reading."""
+        create_dp(self.user, self.horse, {
+            'date_created': local(2023, 3, 17, 10),
+            'temp': 36,
+        })
+        dp = create_dp(self.user, self.horse, {
+            'date_created': local(2023, 3, 17, 11),
+            'temp': 38,
+        })
+        DailyMovement.objects.create(horse=self.horse, day=date(2023, 3, 17))
+        self.horse.refresh_from_db()
+        data_version = self.horse.data_version
+
+        dp.delete()
+
+        self.assertFalse(
+            HourlyRollup.objects.filter(hour=local(2023, 3, 17, 11)).exists()
+        )
+        daily = DailyRollup.objects.get(horse=self.horse)
+        self.assertEqual(daily.temp_count, 1)
+        self.horse.refresh_from_db()
+        self.assertEqual(self.horse.last_seen, local(2023, 3, 17, 10))
+        self.assertGreater(self.horse.data_version, data_version)
+        self.assertFalse(DailyMovement.objects.exists())
+
+    def test_rebuild_command(self):
+        """Test rebuild_rollups recomputes rollups from raw rows."""
+        self.post_batch([
+            (local(2023, 3, 17, 10), 36), (local(2023, 3, 18, 9), 38),
+        ])
+        HourlyRollup.objects.all().delete()
+        DailyRollup.objects.update(temp_count=99)
+        call_command('rebuild_rollups', stdout=StringIO())
+
+        self.assertHour(local(2023, 3, 17, 10), 1, 36, 36, 36)
+        self.assertHour(local(2023, 3, 18, 9), 1, 38, 38, 38)
+        counts = DailyRollup.objects.order_by('day').values_list(
+            'temp_count', flat=True,
+        )
+        self.assertEqual(list(counts), [1, 1])
+
+    def test_rebuild_command_once(self):
+        """Test --once rebuilds until a rebuild of everything completes."""
+        self.post_batch([(local(2023, 3, 17, 10), 36)])
+        # Rollups left by a rebuild that stopped early
+        HourlyRollup.objects.update(temp_count=99)
+        call_command('rebuild_rollups', once=True, stdout=StringIO())
+        self.assertHour(local(2023, 3, 17, 10), 1, 36, 36, 36)
+        self.assertEqual(RollupRebuild.objects.count(), 1)
+
+        HourlyRollup.objects.update(temp_count=99)
+        call_command('rebuild_rollups', once=True, stdout=StringIO())
+        self.assertEqual(HourlyRollup.objects.get().temp_count, 99)
+
+    def test_partial_rebuild_not_recorded(self):
+        """Test rebuilding some horses or days does not satisfy --once."""
+        self.post_batch([(local(2023, 3, 17, 10), 36)])
+        call_command(
+            'rebuild_rollups',
+            api_keys=[self.horse.api_key],
+            stdout=StringIO(),
+        )
+        call_command(
+            'rebuild_rollups',
+            start=local(2023, 3, 17).date(),
+            stdout=StringIO(),
+        )
+
+        self.assertFalse(RollupRebuild.objects.exists())
+
+
+class RollupAggregationTests(TestCase):
+    """Test aggregation answered from rollups matches raw rows."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        start = local(2023, 3, 10, 22)
+        for i in range(0, 7 * 24 * 60, 37):
+            create_dp(self.user, self.horse, {
+                'date_created': start + timedelta(minutes=i),
+                'temp': 36 + i % 50 / 10,
+                'hr': 20 + i % 30,
+            })
+
+    def test_rollups_match_raw(self):
+        """Test rollup reads with partial edge buckets match raw rows."""
+        queryset = DataPoint.objects.filter(user=self.user)
+        start, end = local(2023, 3, 11, 7, 13), local(2023, 3, 16, 18, 41)
+        for width in ['hour', 'day']:
+            ranged = queryset.filter(
+                date_created__gte=start, date_created__lte=end,
+            )
+            raw = aggregation.aggregate(ranged, width, ['temp', 'hr'])
+            rolled = aggregation.aggregate_rollups(
+                ranged, self.user.horse_set.all(), width, ['temp', 'hr'],
+                start, end,
+            )
+            self.assertEqual(len(rolled), len(raw))
+            for a, b in zip(raw, rolled):
+                self.assertEqual(a['bucket'], b['bucket'])
+                for field in ['temp', 'hr']:
+                    self.assertEqual(a[field]['count'], b[field]['count'])
+                    self.assertEqual(a[field]['min'], b[field]['min'])
+                    self.assertEqual(a[field]['max'], b[field]['max'])
+                    self.assertAlmostEqual(a[field]['avg'], b[field]['avg'])
+
+    def test_aggregate_endpoint_reads_rollups(self):
+        """Test the endpoint skips raw rows for whole days."""
+        HourlyRollup.objects.update(temp_count=0)
+        DailyRollup.objects.filter(day='2023-03-12').update(temp_max=99)
+        res = self.client.get(AGGREGATE_URL, {
+            'bucket': 'day',
+            'fields': 'temp',
+            'date_created__gte': local(2023, 3, 11, 12).isoformat(),
+            'date_created__lt': local(2023, 3, 14).isoformat(),
+        })
+
+        rows = res.data['results']
+        self.assertEqual([row['bucket'] for row in rows], [
+            local(2023, 3, 11), local(2023, 3, 12), local(2023, 3, 13),
+        ])
+        self.assertEqual(rows[1]['temp']['max'], 99)
+        self.assertLess(rows[0]['temp']['max'], 99)
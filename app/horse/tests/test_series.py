@@ -0,0 +1,152 @@
+"""
+Tests for downsampled chart series.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from horse import series
+from horse.tests.test_data_api import create_user, create_horse, create_dp
+
+
+def series_url(horse_id):
+    """Create and return a horse series url."""
+    return reverse('horse:horse-chart-series', args=[horse_id])
+
+
+def reference_lttb(rows, points):
+    """Straightforward in-memory LTTB to check the chunked version against."""
+    rows = np.asarray(rows, dtype=float)
+    count = len(rows)
+    every = (count - 2) / (points - 2)
+    selected = [rows[0]]
+    a = rows[0]
+    for i in range(points - 2):
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        next_start = end
+        next_end = min(int(np.floor((i + 2) * every)) + 1, count)
+        average = rows[next_start:next_end].mean(axis=0)
+        best, best_area = None, -1
+        for row in rows[start:end]:
+            area = abs(
+                (a[0] - average[0]) * (row[1] - a[1])
+                - (a[0] - row[0]) * (average[1] - a[1])
+            )
+            if area > best_area:
+                best, best_area = row, area
+        selected.append(best)
+        a = best
+    selected.append(rows[-1])
+
+    return np.array(selected)
+
+
+class LttbTests(TestCase):
+    """Test the LTTB implementation."""
+
+    def test_matches_reference(self):
+        """Test chunked LTTB picks the points a plain implementation does."""
+        rng = np.random.default_rng(7)
+        rows = np.column_stack(
+            [np.arange(1000.0) * 300, rng.normal(37, 1, 1000)]
+        )
+        for points in [3, 10, 97, 500]:
+            result = series.lttb(
+                map(tuple, rows), len(rows), points, chunk_size=64,
+            )
+            np.testing.assert_array_equal(result, reference_lttb(rows, points))
+
+    def test_short_series_returned_whole(self):
+        """Test series no longer than the target are not downsampled."""
+        rows = [(0.0, 1.0), (1.0, 2.0), (2.0, 3.0)]
+        result = series.lttb(iter(rows), 3, 10)
+
+        np.testing.assert_array_equal(result, rows)
+
+    def test_keeps_spike(self):
+        """Test a single spike survives downsampling."""
+        values = np.full(1000, 37.0)
+        values[400] = 41.0
+        rows = np.column_stack([np.arange(1000.0), values])
+        result = series.lttb(map(tuple, rows), 1000, 20, chunk_size=100)
+
+        self.assertIn(41.0, result[:, 1])
+        self.assertEqual(len(result), 20)
+
+    def test_rows_deleted_after_count(self):
+        """Test fewer rows than counted leave out the empty buckets."""
+        rows = np.column_stack([np.arange(1000.0), np.sin(np.arange(1000.0))])
+        for available in [0, 1, 2, 500, 999]:
+            result = series.lttb(
+                map(tuple, rows[:available]), 1000, 20, chunk_size=64,
+            )
+
+            self.assertLessEqual(len(result), min(available, 20))
+            if available:
+                self.assertEqual(result[0].tolist(), rows[0].tolist())
+
+
+class SeriesApiTests(TestCase):
+    """Test the horse series endpoint."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.start = datetime.fromisoformat('2023-03-17T00:00:00+00:00')
+        for i in range(50):
+            create_dp(self.user, self.horse, {
+                'date_created': self.start + timedelta(minutes=5 * i),
+                'temp': 37 + (i % 7) / 10,
+                'hr': None if i % 2 else 30 + i % 5,
+            })
+
+    def test_series_downsamples(self):
+        """Test each field is downsampled to the requested points."""
+        res = self.client.get(
+            series_url(self.horse.id), {'fields': 'temp,hr', 'points': 10},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        temp = res.data['series']['temp']
+        self.assertEqual(temp['count'], 50)
+        self.assertEqual(len(temp['values']), 10)
+        self.assertEqual(temp['date_created'][0], self.start)
+        self.assertEqual(
+            temp['date_created'][-1], self.start + timedelta(minutes=5 * 49),
+        )
+        self.assertEqual(res.data['series']['hr']['count'], 25)
+
+    def test_series_time_range(self):
+        """Test the series respects date filters."""
+        res = self.client.get(series_url(self.horse.id), {
+            'fields': 'temp',
+            'date_created__gte': (
+                self.start + timedelta(minutes=50)
+            ).isoformat(),
+        })
+
+        temp = res.data['series']['temp']
+        self.assertEqual(temp['count'], 40)
+        self.assertEqual(
+            temp['date_created'][0], self.start + timedelta(minutes=50),
+        )
+
+    def test_series_invalid_params(self):
+        """Test unknown fields and out of range points are rejected."""
+        for params in [{'fields': 'name'}, {'points': 2}, {'points': 'many'}]:
+            res = self.client.get(series_url(self.horse.id), params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_series_limited_to_user(self):
+        """Test another user's horse is not found."""
+        other = create_horse(create_user(email='other@example.com'))
+        res = self.client.get(series_url(other.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
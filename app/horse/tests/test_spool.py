@@ -0,0 +1,145 @@
+"""
+Tests for the data point ingest spool.
+"""
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import DataPoint, SpoolCheckpoint
+
+from horse import spool
+from horse.custom_authentication import device_key_cache
+from horse.tests.test_data_api import (
+    create_user,
+    create_horse,
+    sample_dps,
+)
+
+
+DATAPOINT_URL = reverse('horse:datapoint-list')
+BATCH_URL = reverse('horse:datapoint-batch')
+
+
+class SpoolTests(TestCase):
+    """Test spooled ingest and flushing."""
+
+    def setUp(self):
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            DATAPOINT_INGEST_MODE='spool',
+            DATAPOINT_SPOOL_DIR=self.spool_dir.name,
+        )
+        self.settings_override.enable()
+        self.user = create_user()
+        self.horse = create_horse(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.spool_dir.cleanup()
+
+    def test_create_is_queued_until_flushed(self):
+        """Test a spooled datapoint is written by flush_spool."""
+        payload = {'api_key': self.horse.api_key, **sample_dps[0]}
+        res = self.client.post(DATAPOINT_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(DataPoint.objects.exists())
+
+        call_command('flush_spool', stdout=open(os.devnull, 'w'))
+
+        dp = DataPoint.objects.get(horse=self.horse)
+        self.assertEqual(dp.user, self.user)
+        self.assertEqual(float(dp.temp), sample_dps[0]['temp'])
+        self.assertFalse(SpoolCheckpoint.objects.exists())
+
+    def test_batch_is_queued(self):
+        """Test a spooled batch reports every item as accepted."""
+        payload = [
+            {'api_key': self.horse.api_key, **dp} for dp in sample_dps
+        ]
+        res = self.client.post(BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        spool.flush()
+        self.assertEqual(DataPoint.objects.count(), len(sample_dps))
+
+    def test_flush_is_exactly_once(self):
+        """Test flushing twice does not duplicate datapoints."""
+        payload = {'api_key': self.horse.api_key, **sample_dps[0]}
+        self.client.post(DATAPOINT_URL, payload)
+
+        self.assertEqual(spool.flush(), 1)
+        self.assertEqual(spool.flush(), 0)
+        self.assertEqual(DataPoint.objects.count(), 1)
+
+    def test_flush_resumes_from_checkpoint(self):
+        """Test a restarted flusher skips lines it already wrote."""
+        records = [
+            spool.make_record(self.horse, {'temp': dp['temp']})
+            for dp in sample_dps[:2]
+        ]
+        spool.append(records)
+        segment = spool.rotate()
+        first_line = json.dumps(records[0]) + '\n'
+        SpoolCheckpoint.objects.create(segment=segment, offset=len(first_line))
+
+        self.assertEqual(spool.flush(), 1)
+        dp = DataPoint.objects.get()
+        self.assertEqual(float(dp.temp), sample_dps[1]['temp'])
+
+    def test_torn_line_rejected(self):
+        """Test a line torn by a crash is set aside and later lines flush."""
+        records = [
+            spool.make_record(self.horse, {'temp': dp['temp']})
+            for dp in sample_dps[:2]
+        ]
+        spool.append(records[:1])
+        path = os.path.join(self.spool_dir.name, spool.ACTIVE_FILE)
+        with open(path, 'ab') as active:
+            active.write(b'{"horse_id": 1, "te')
+        spool.append(records[1:])
+
+        self.assertEqual(spool.flush(), 2)
+        self.assertEqual(DataPoint.objects.count(), 2)
+        reject_path = os.path.join(self.spool_dir.name, spool.REJECT_FILE)
+        with open(reject_path, 'rb') as rejected:
+            self.assertEqual(rejected.read(), b'{"horse_id": 1, "te\n')
+
+    def test_invalid_line_rejected(self):
+        """Test an unreadable complete line does not stop the flush."""
+        path = os.path.join(self.spool_dir.name, spool.ACTIVE_FILE)
+        with open(path, 'ab') as active:
+            active.write(b'not json\n[1, 2]\n')
+        spool.append([
+            spool.make_record(self.horse, {'temp': sample_dps[0]['temp']}),
+        ])
+
+        self.assertEqual(spool.flush(), 1)
+        reject_path = os.path.join(self.spool_dir.name, spool.REJECT_FILE)
+        with open(reject_path, 'rb') as rejected:
+            self.assertEqual(rejected.read(), b'not json\n[1, 2]\n')
+
+    def test_cached_device_spools_without_queries(self):
+        """Test a collar with a cached key is spooled without any queries."""
+        device_key_cache.clear()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Api-Key {self.horse.api_key}')
+        payload = {'api_key': self.horse.api_key, **sample_dps[0]}
+        client.post(DATAPOINT_URL, payload)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = client.post(DATAPOINT_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(len(queries), 0)
@@ -0,0 +1,341 @@
+"""
+Tests for live data point streams.
+"""
+import asyncio
+import json
+import threading
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from horse import stream
+from horse.broker import InProcessBroker, PostgresBroker, get_broker
+from horse.tests.test_data_api import (
+    BATCH_URL,
+    create_user,
+    create_horse,
+    create_dp,
+)
+
+
+def make_scope(query='', headers=(), method='GET'):
+    return {
+        'type': 'http',
+        'method': method,
+        'path': stream.STREAM_PATH,
+        'query_string': query.encode(),
+        'headers': [
+            (name.encode(), value.encode()) for name, value in headers
+        ],
+    }
+
+
+def parse_events(body):
+    """Return the data of every event in an event stream body."""
+    events = []
+    for block in body.decode().split('\n\n'):
+        fields = dict(
+            line.split(': ', 1) for line in block.splitlines()
+            if not line.startswith(':')
+        )
+        if fields.get('event') == stream.EVENT_NAME:
+            events.append(json.loads(fields['data']))
+    return events
+
+
+class BrokerTests(TestCase):
+    """Test the in-process broker."""
+
+    def test_fan_out_from_another_thread(self):
+        """Test every subscriber of a channel gets messages from a thread."""
+        broker = InProcessBroker()
+
+        async def main():
+            first = broker.subscribe(['horse:1'])
+            second = broker.subscribe(['horse:1', 'user:1'])
+            other = broker.subscribe(['horse:2'])
+            thread = threading.Thread(
+                target=broker.publish, args=('horse:1', b'event'),
+            )
+            thread.start()
+            thread.join()
+            received = await asyncio.wait_for(
+                asyncio.gather(first.get(), second.get()), timeout=1,
+            )
+            self.assertTrue(other.queue.empty())
+            for subscription in (first, second, other):
+                subscription.close()
+            return received
+
+        self.assertEqual(async_to_sync(main)(), [b'event', b'event'])
+        self.assertFalse(broker.has_subscribers())
+
+    def test_slow_subscriber_dropped(self):
+        """Test a full subscriber is dropped and its stream ends."""
+        broker = InProcessBroker()
+
+        async def main():
+            subscription = broker.subscribe(['horse:1'], maxsize=1)
+            broker.publish('horse:1', b'first')
+            broker.publish('horse:1', b'second')
+            await asyncio.sleep(0)
+            return await subscription.get()
+
+        self.assertIsNone(async_to_sync(main)())
+        self.assertFalse(broker.has_subscribers())
+
+    def test_datapoints_not_loaded_without_subscribers(self):
+        """Test publishing data points runs no queries without subscribers."""
+        user = create_user()
+        dp = create_dp(user, create_horse(user), {'temp': 38})
+
+        with CaptureQueriesContext(connection) as queries:
+            InProcessBroker().publish_datapoints([dp.id])
+
+        self.assertEqual(len(queries), 0)
+
+
+class PostgresBrokerTests(TransactionTestCase):
+    """Test the broker carrying messages through LISTEN/NOTIFY."""
+
+    def setUp(self):
+        self.broker = PostgresBroker()
+        self.addCleanup(self.broker.stop)
+
+    def listener_pids(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pid FROM pg_stat_activity '
+                'WHERE query = %s AND pid <> pg_backend_pid()',
+                [f'LISTEN {PostgresBroker.pg_channel}'],
+            )
+            return [pid for pid, in cursor.fetchall()]
+
+    def terminate(self, pids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_terminate_backend(pid) '
+                'FROM unnest(%s::int[]) pid',
+                [pids],
+            )
+
+    async def wait_for_listener(self):
+        for _ in range(200):
+            pids = await sync_to_async(self.listener_pids)()
+            if pids:
+                return pids
+            await asyncio.sleep(0.01)
+        self.fail('The broker did not start listening.')
+
+    def test_datapoints_from_another_connection(self):
+        """Test data points published on another connection reach here."""
+        user = create_user()
+        horse = create_horse(user)
+        other_horse = create_horse(user, name='Other')
+        now = timezone.now()
+        first = create_dp(user, horse, {'date_created': now, 'temp': 38})
+        second = create_dp(user, horse, {
+            'date_created': now + timedelta(seconds=1), 'temp': 39,
+        })
+        create_dp(user, other_horse, {'temp': 40})
+
+        async def main():
+            subscription = self.broker.subscribe(
+                [stream.horse_channel(horse.id)],
+            )
+            other = self.broker.subscribe(
+                [stream.horse_channel(other_horse.id)],
+            )
+            await self.wait_for_listener()
+
+            def publish():
+                # More ids than one NOTIFY carries
+                padding = [0] * PostgresBroker.notify_size
+                PostgresBroker().publish_datapoints(
+                    [second.id, first.id] + padding,
+                )
+                connection.close()
+
+            thread = threading.Thread(target=publish)
+            thread.start()
+            thread.join()
+            received = [
+                await asyncio.wait_for(subscription.get(), timeout=2)
+                for _ in range(2)
+            ]
+            self.assertTrue(other.queue.empty())
+            subscription.close()
+            other.close()
+            return received
+
+        events = parse_events(b''.join(async_to_sync(main)()))
+        self.assertEqual(
+            [event['id'] for event in events], [first.id, second.id],
+        )
+
+    def test_lost_connection_ends_streams(self):
+        """Test subscriptions end when the listening connection drops."""
+        async def main():
+            subscription = self.broker.subscribe(['horse:1'])
+            await sync_to_async(self.terminate)(await self.wait_for_listener())
+            return await asyncio.wait_for(subscription.get(), timeout=2)
+
+        with self.assertLogs('horse.broker', 'ERROR'):
+            self.assertIsNone(async_to_sync(main)())
+
+
+class StreamTests(TestCase):
+    """Test the ASGI data point stream."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+        self.horse = create_horse(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def run_stream(self, scope, during=None, events=0):
+        """Run a stream, calling during once started, until it sent events."""
+        sent = []
+
+        async def main():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            task = asyncio.ensure_future(
+                stream.application(scope, receive, send)
+            )
+            for _ in range(200):
+                if sent or task.done():
+                    break
+                await asyncio.sleep(0.01)
+            if during is not None:
+                await sync_to_async(during)()
+            for _ in range(200):
+                if len(parse_events(self.body(sent))) >= events or task.done():
+                    break
+                await asyncio.sleep(0.01)
+            disconnected.set()
+            await asyncio.wait_for(task, timeout=1)
+
+        async_to_sync(main)()
+        return sent
+
+    def body(self, sent):
+        return b''.join(
+            m.get('body', b'') for m in sent
+            if m['type'] == 'http.response.body'
+        )
+
+    def post_batch(self, horse, count):
+        now = timezone.now().replace(microsecond=0)
+        payload = [
+            {
+                'api_key': horse.api_key,
+                'date_created': (
+                    now - timezone.timedelta(minutes=i)
+                ).isoformat(),
+                'temp': 38,
+            }
+            for i in range(count)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(BATCH_URL, payload, format='json')
+
+    def test_requires_token(self):
+        """Test streams are refused without a valid token."""
+        sent = self.run_stream(make_scope('token=wrong'))
+
+        self.assertEqual(sent[0]['status'], 401)
+        self.assertFalse(get_broker().has_subscribers())
+
+    def test_unknown_horse(self):
+        """Test streaming another user's horse is not found."""
+        other = create_horse(create_user(email='other@example.com'), 'Other')
+        sent = self.run_stream(
+            make_scope(f'token={self.token.key}&horse={other.api_key}'),
+        )
+
+        self.assertEqual(sent[0]['status'], 404)
+
+    def test_user_stream_receives_committed_readings(self):
+        """Test a user stream gets readings of all horses as they commit."""
+        second = create_horse(self.user, 'Second')
+        other = create_horse(create_user(email='other@example.com'), 'Other')
+
+        def ingest():
+            self.post_batch(self.horse, 2)
+            self.post_batch(second, 1)
+            create_dp(other.user, other, {'temp': 40})
+
+        sent = self.run_stream(
+            make_scope(headers=[('Authorization', f'Token {self.token.key}')]),
+            during=ingest,
+            events=3,
+        )
+
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/event-stream'), sent[0]['headers'],
+        )
+        events = parse_events(self.body(sent))
+        self.assertEqual(
+            sorted(event['api_key'] for event in events),
+            sorted([self.horse.api_key] * 2 + [second.api_key]),
+        )
+        self.assertEqual(events[0]['temp'], '38.00')
+        self.assertFalse(get_broker().has_subscribers())
+
+    def test_horse_stream_filters_horse(self):
+        """Test a horse stream only gets that horse's readings."""
+        second = create_horse(self.user, 'Second')
+
+        def ingest():
+            self.post_batch(second, 1)
+            self.post_batch(self.horse, 1)
+
+        sent = self.run_stream(
+            make_scope(f'token={self.token.key}&horse={self.horse.api_key}'),
+            during=ingest,
+            events=1,
+        )
+
+        events = parse_events(self.body(sent))
+        self.assertEqual(
+            [event['api_key'] for event in events], [self.horse.api_key],
+        )
+
+    def test_replay_after_last_event_id(self):
+        """Test a reconnecting client gets readings since its last event."""
+        seen = create_dp(self.user, self.horse, {'temp': 37.6})
+        missed = create_dp(
+            self.user, self.horse,
+            {
+                'temp': 37.8,
+                'date_created': (
+                    seen.date_created + timezone.timedelta(minutes=1)
+                ),
+            },
+        )
+        sent = self.run_stream(
+            make_scope(
+                f'token={self.token.key}',
+                headers=[('Last-Event-ID', str(seen.id))],
+            ),
+            events=1,
+        )
+
+        events = parse_events(self.body(sent))
+        self.assertEqual([event['id'] for event in events], [missed.id])
@@ -0,0 +1,142 @@
+"""
+Tests for the delta sync API.
+"""
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from horse.tests.test_data_api import (
+    BATCH_URL,
+    create_user,
+    create_horse,
+    create_dp,
+    detail_url,
+)
+
+
+SYNC_URL = reverse('horse:datapoint-sync')
+
+
+class SyncApiTests(TestCase):
+    """Test syncing data point changes since a token."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def add_readings(self, horse, count, start=0):
+        return [
+            create_dp(self.user, horse, {
+                'date_created': self.now + timedelta(minutes=start + minute),
+                'temp': 38,
+            })
+            for minute in range(count)
+        ]
+
+    def get_sync(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK, res.content)
+        return res.data
+
+    def test_initial_sync_then_only_new_readings(self):
+        """Test a sync returns everything once, then only what is new."""
+        first = self.add_readings(self.horse, 3)
+        data = self.get_sync()
+
+        self.assertEqual(
+            [dp['id'] for dp in data['datapoints']], [dp.id for dp in first],
+        )
+        self.assertEqual(data['datapoints'][0]['api_key'], self.horse.api_key)
+        self.assertFalse(data['has_more'])
+
+        data = self.get_sync(data['since'])
+        self.assertEqual(data['datapoints'], [])
+
+        payload = [{
+            'api_key': self.horse.api_key,
+            'date_created': (self.now + timedelta(hours=1)).isoformat(),
+            'temp': 39,
+        }]
+        res = self.client.post(BATCH_URL, payload, format='json')
+        created = res.data['results'][0]['id']
+        data = self.get_sync(data['since'])
+        self.assertEqual([dp['id'] for dp in data['datapoints']], [created])
+
+    def test_deleted_readings_are_tombstoned(self):
+        """Test readings deleted through the API are reported once."""
+        readings = self.add_readings(self.horse, 2)
+        since = self.get_sync()['since']
+        self.client.delete(detail_url(readings[0].id))
+        data = self.get_sync(since)
+
+        self.assertEqual(data['datapoints'], [])
+        self.assertEqual(
+            data['deleted'],
+            [{'id': readings[0].id, 'api_key': self.horse.api_key}],
+        )
+        self.assertEqual(self.get_sync(data['since'])['deleted'], [])
+
+    def test_new_client_skips_earlier_deletions(self):
+        """Test deletions before a client's first sync are not sent."""
+        readings = self.add_readings(self.horse, 2)
+        self.client.delete(detail_url(readings[0].id))
+        data = self.get_sync()
+
+        self.assertEqual(data['deleted'], [])
+        ids = [dp['id'] for dp in data['datapoints']]
+        self.assertEqual(ids, [readings[1].id])
+
+    def test_limit_pages_across_horses(self):
+        """Test limited syncs deliver every reading exactly once."""
+        second = create_horse(self.user, 'Second')
+        readings = self.add_readings(self.horse, 4)
+        readings += self.add_readings(second, 5)
+        expected = {dp.id for dp in readings}
+        seen = []
+        data = {'since': None, 'has_more': True}
+        while data['has_more']:
+            data = self.get_sync(data['since'], limit=3)
+            self.assertLessEqual(len(data['datapoints']), 3)
+            seen += [dp['id'] for dp in data['datapoints']]
+
+        self.assertEqual(sorted(seen), sorted(expected))
+
+    def test_single_horse_keeps_other_marks(self):
+        """Test syncing one horse leaves the other horses' marks alone."""
+        second = create_horse(self.user, 'Second')
+        self.add_readings(self.horse, 1)
+        since = self.get_sync()['since']
+        new_first = self.add_readings(self.horse, 1, start=10)
+        new_second = self.add_readings(second, 1, start=10)
+
+        since = self.get_sync(since, horse__api_key=second.api_key)['since']
+        data = self.get_sync(since)
+
+        ids = [dp['id'] for dp in data['datapoints']]
+        self.assertEqual(ids, [new_first[0].id])
+        self.assertNotIn(new_second[0].id, ids)
+
+    def test_limited_to_user(self):
+        """Test other users' readings are not synced."""
+        other = create_user(email='other@example.com')
+        create_dp(other, create_horse(other, 'Other'), {'temp': 38})
+
+        self.assertEqual(self.get_sync()['datapoints'], [])
+
+    def test_invalid_parameters(self):
+        """Test a malformed token or limit is rejected."""
+        invalid = [{'since': 'not-a-token'}, {'limit': 0}, {'limit': 'all'}]
+        for params in invalid:
+            res = self.client.get(SYNC_URL, params)
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params,
+            )
@@ -0,0 +1,113 @@
+"""
+Tests for the binary telemetry format.
+"""
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import DataPoint
+
+from horse import telemetry
+from horse.tests.test_data_api import (
+    create_user,
+    create_horse,
+)
+
+
+BATCH_URL = reverse('horse:datapoint-batch')
+
+sample_readings = [
+    {'date_created': datetime(2023, 3, 17, 12, 0, tzinfo=dt_timezone.utc),
+     'gps_lat': 51.078621,
+     'gps_long': -114.135491,
+     'temp': 37.45,
+     'hr': 31.8,
+     'hr_interval': 1886.79,
+     'batt': 88.2},
+    {'date_created': datetime(2023, 3, 17, 12, 5, tzinfo=dt_timezone.utc),
+     'gps_lat': None,
+     'gps_long': None,
+     'temp': 37.5,
+     'hr': 32.0,
+     'hr_interval': 1875.0,
+     'batt': 88.1},
+]
+
+
+class TelemetryFormatTests(SimpleTestCase):
+    """Test encoding and decoding telemetry payloads."""
+
+    def test_round_trip(self):
+        """Test readings survive an encode and decode round trip."""
+        payload = telemetry.encode('abcdefghijkl', sample_readings)
+        batch = telemetry.decode(payload)
+
+        self.assertEqual(batch.api_key, 'abcdefghijkl')
+        self.assertEqual(len(payload), 20 + 24 * len(sample_readings))
+        results = telemetry.validate(batch)
+        for reading, (data, errors) in zip(sample_readings, results):
+            self.assertIsNone(errors)
+            self.assertEqual(data['date_created'], reading['date_created'])
+            for name in telemetry.VALUE_FIELDS:
+                if reading[name] is None:
+                    self.assertNotIn(name, data)
+                else:
+                    self.assertEqual(data[name], Decimal(str(reading[name])))
+
+    def test_decode_rejects_bad_length(self):
+        """Test truncated payloads are rejected."""
+        payload = telemetry.encode('abcdefghijkl', sample_readings)
+
+        with self.assertRaises(ValueError):
+            telemetry.decode(payload[:-1])
+
+    def test_validate_rejects_out_of_range(self):
+        """Test readings too large for their field are reported."""
+        readings = [{**sample_readings[0], 'hr': 1000.0}]
+        batch = telemetry.decode(telemetry.encode('abcdefghijkl', readings))
+        data, errors = telemetry.validate(batch)[0]
+
+        self.assertIsNone(data)
+        self.assertIn('hr', errors)
+
+
+class TelemetryApiTests(TestCase):
+    """Test ingesting binary telemetry payloads."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.horse = create_horse(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_accepts_telemetry(self):
+        """Test a binary payload is ingested as a batch."""
+        payload = telemetry.encode(self.horse.api_key, sample_readings)
+        res = self.client.post(
+            BATCH_URL,
+            payload,
+            content_type=telemetry.MEDIA_TYPE,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        dps = DataPoint.objects.filter(
+            horse=self.horse,
+        ).order_by('date_created')
+        self.assertEqual(dps.count(), 2)
+        self.assertEqual(dps[0].temp, Decimal('37.45'))
+        self.assertIsNone(dps[1].gps_lat)
+
+    def test_malformed_telemetry(self):
+        """Test a malformed binary payload is rejected."""
+        res = self.client.post(
+            BATCH_URL,
+            b'EQ',
+            content_type=telemetry.MEDIA_TYPE,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
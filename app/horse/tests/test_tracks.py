@@ -0,0 +1,167 @@
+"""
+Tests for simplified GPS tracks.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from horse import tracks
+from horse.tests.test_data_api import create_user, create_horse, create_dp
+
+
+def track_url(horse_id):
+    return reverse('horse:horse-track', args=[horse_id])
+
+
+def reference_simplify(x, y, tolerance):
+    """Recursive Douglas-Peucker to check the level by level one against."""
+    def split(first, last):
+        if last - first < 2:
+            return []
+        distances = tracks._segment_distances(
+            x[first + 1:last], y[first + 1:last],
+            x[first], y[first], x[last], y[last],
+        )
+        index = int(np.argmax(distances))
+        if distances[index] <= tolerance:
+            return []
+        middle = first + 1 + index
+        return split(first, middle) + [middle] + split(middle, last)
+
+    return np.array([0] + split(0, len(x) - 1) + [len(x) - 1])
+
+
+class SimplifyTests(SimpleTestCase):
+    """Test track simplification and encoding."""
+
+    def test_matches_reference(self):
+        """Test simplification keeps the fixes of recursive Douglas-Peucker."""
+        rng = np.random.default_rng(5)
+        lats = 51 + np.cumsum(rng.normal(0, 0.0001, 3000))
+        longs = -114 + np.cumsum(rng.normal(0, 0.0001, 3000))
+        y = np.radians(lats) * tracks.geo.EARTH_RADIUS_M
+        x = np.radians(longs) * tracks.geo.EARTH_RADIUS_M
+        x *= np.cos(np.radians(lats.mean()))
+        for tolerance in [0, 1, 5, 50, 1000]:
+            np.testing.assert_array_equal(
+                tracks.simplify(lats, longs, tolerance),
+                reference_simplify(x, y, tolerance),
+            )
+
+    def test_short_tracks(self):
+        for count in range(3):
+            self.assertEqual(
+                tracks.simplify(np.zeros(count), np.zeros(count), 5).tolist(),
+                list(range(count)),
+            )
+
+    def test_encode_polyline(self):
+        """Test the example from the encoded polyline format documentation."""
+        self.assertEqual(
+            tracks.encode_polyline(
+                [38.5, 40.7, 43.252], [-120.2, -120.95, -126.453],
+            ),
+            '_p~iF~ps|U_ulLnnqC_mqNvxq`@',
+        )
+        self.assertEqual(tracks.encode_polyline([], []), '')
+
+    def test_valid_fixes(self):
+        """Test jumps faster than a horse and fixes at 0, 0 are dropped."""
+        epochs = np.arange(7) * 60.0
+        lats = np.array([51.0, 51.5, 51.001, 0, 51.002, 51.003, 52.0])
+        longs = np.array([-114.0, -114.0, -114.0, 0, -114.0, -114.0, -114.0])
+
+        self.assertEqual(
+            tracks.valid_fixes(epochs, lats, longs).tolist(),
+            [True, False, True, False, True, True, False],
+        )
+
+
+class TrackApiTests(TestCase):
+    """Test the track endpoint."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.horse = create_horse(self.user)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def add(self, minute, lat=None, long=None):
+        return create_dp(self.user, self.horse, {
+            'date_created': self.now + timedelta(minutes=minute),
+            'gps_lat': lat,
+            'gps_long': long,
+        })
+
+    def test_straight_line_simplified(self):
+        """Test a walk keeps its ends and corner, without jitter or gaps."""
+        for minute in range(10):
+            self.add(minute, 51 + minute * 0.0001, -114)
+        self.add(10, 51.0009, -113.9999)
+        self.add(11, 51.0009, -113.9998)
+        self.add(12)
+        self.add(13, 51.2, -113.9997)
+        self.add(14, 51.0009, -113.9996)
+
+        res = self.client.get(track_url(self.horse.id), {'tolerance': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 14)
+        self.assertEqual(res.data['valid'], 13)
+        self.assertEqual(
+            res.data['path'],
+            [[51.0, -114.0], [51.0009, -114.0], [51.0009, -113.9996]],
+        )
+        self.assertEqual(
+            res.data['date_created'][1], self.now + timedelta(minutes=9),
+        )
+
+    def test_polyline_and_time_range(self):
+        """Test a time range of the track as an encoded polyline."""
+        # A week apart, so the long jumps are not jitter
+        week = 7 * 24 * 60
+        self.add(0, 38.5, -120.2)
+        self.add(week, 40.7, -120.95)
+        self.add(2 * week, 43.252, -126.453)
+        self.add(3 * week, 44, -127)
+
+        res = self.client.get(track_url(self.horse.id), {
+            'encoding': 'polyline',
+            'tolerance': 0,
+            'date_created__lt': (
+                self.now + timedelta(minutes=3 * week)
+            ).isoformat(),
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['polyline'], '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertNotIn('path', res.data)
+
+    def test_empty_track(self):
+        res = self.client.get(track_url(self.horse.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['path'], [])
+        self.assertEqual(res.data['count'], 0)
+
+    def test_invalid_requests(self):
+        """Test bad parameters and other users' horses are rejected."""
+        for params in (
+            {'tolerance': -1},
+            {'tolerance': 'far'},
+            {'encoding': 'wkt'},
+        ):
+            res = self.client.get(track_url(self.horse.id), params)
+            self.assertEqual(
+                res.status_code, status.HTTP_400_BAD_REQUEST, params,
+            )
+
+        other = create_horse(create_user(email='other@example.com'), 'Other')
+        res = self.client.get(track_url(other.id))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
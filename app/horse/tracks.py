@@ -0,0 +1,200 @@
+"""
+Simplified GPS tracks for the horse APIs.
+
+A track is read from a horse's positioned readings in time order straight
+into arrays. Fixes that imply an impossible speed on both sides
+(isolated jumps, usually multipath jitter) and fixes at 0, 0 (a common
+receiver fault) are dropped. The rest are simplified with Douglas-Peucker
+in local meters. All open segments are split together, one level of the
+recursion per pass over arrays, so a pass costs a few NumPy operations
+however many segments there are.
+"""
+import io
+from datetime import datetime, timezone
+
+import numpy as np
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.functions import Cast, Extract
+
+from horse import geo
+
+
+DEFAULT_TOLERANCE = 5
+MAX_TOLERANCE = 10000
+# Meters per second no horse reaches; faster jumps are jitter
+MAX_SPEED = 25
+POLYLINE_PRECISION = 1e5
+# A binary COPY row of three non-null float8 columns: a field count, then
+# each field's byte length and value, big endian
+COPY_ROW = np.dtype([
+    ('fields', '>i2'),
+    ('epoch_size', '>i4'), ('epoch', '>f8'),
+    ('lat_size', '>i4'), ('lat', '>f8'),
+    ('long_size', '>i4'), ('long', '>f8'),
+])
+
+
+def copy_records(query, dtype):
+    """
+    Return the rows of a query as a NumPy record array of dtype.
+
+    Rows are streamed with a binary COPY of the query and decoded as
+    fixed width records, so no Python object is made per row. Every
+    column must be non-null and of a fixed width type.
+    """
+    buffer = io.BytesIO()
+    with connection.cursor() as cursor:
+        sql, params = query.sql_with_params()
+        copy = cursor.mogrify(
+            f'COPY ({sql}) TO STDOUT (FORMAT binary)', params,
+        )
+        cursor.copy_expert(copy.decode(), buffer)
+
+    data = buffer.getbuffer()
+    # Signature, flags and header extension length, then the extension
+    start = 19 + int.from_bytes(data[15:19], 'big')
+    # A two byte -1 ends the data
+    return np.frombuffer(data[start:len(data) - 2], dtype=dtype)
+
+
+def read_fixes(queryset):
+    """Return (epochs, lats, longs) arrays of a queryset's positioned fixes."""
+    positioned = queryset.filter(geocell__isnull=False)
+    query = positioned.order_by('date_created').annotate(
+        track_epoch=Cast(
+            Extract('date_created', 'epoch', tzinfo=timezone.utc),
+            FloatField(),
+        ),
+        track_lat=Cast('gps_lat', FloatField()),
+        track_long=Cast('gps_long', FloatField()),
+    ).values_list('track_epoch', 'track_lat', 'track_long').query
+    rows = copy_records(query, COPY_ROW)
+
+    return (
+        rows['epoch'].astype(float),
+        rows['lat'].astype(float),
+        rows['long'].astype(float),
+    )
+
+
+def valid_fixes(epochs, lats, longs, max_speed=MAX_SPEED):
+    """
+    Return a boolean array of the fixes to keep.
+
+    A fix is dropped when it is at 0, 0, or when reaching it from the
+    previous fix and leaving it for the next both take more than
+    max_speed. The first or last fix is dropped when its one neighbour is
+    too fast to reach from it but not from the fix beyond.
+    """
+    keep = ~((lats == 0) & (longs == 0))
+    if keep.sum() < 2:
+        return keep
+    index = np.flatnonzero(keep)
+    seconds = np.maximum(np.diff(epochs[index]), 1)
+    distances = geo.haversine(
+        lats[index][:-1], longs[index][:-1], lats[index][1:], longs[index][1:],
+    )
+    fast = distances / seconds > max_speed
+    alone = len(fast) < 2
+    arriving = np.concatenate([[not alone and not fast[1]], fast])
+    leaving = np.concatenate([fast, [not alone and not fast[-2]]])
+    keep[index[arriving & leaving]] = False
+
+    return keep
+
+
+def _segment_distances(x, y, x1, y1, x2, y2):
+    """Return the distances of points to line segments, elementwise."""
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length > 0, ((x - x1) * dx + (y - y1) * dy) / length, 0)
+    t = np.clip(t, 0, 1)
+
+    return np.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+def simplify(lats, longs, tolerance):
+    """
+    Return the indexes of the fixes Douglas-Peucker keeps at tolerance meters.
+
+    Positions are projected to meters around their mean latitude, which
+    is accurate over the extent of a track.
+    """
+    count = len(lats)
+    if count < 3:
+        return np.arange(count)
+    y = np.radians(lats) * geo.EARTH_RADIUS_M
+    x = np.radians(longs) * geo.EARTH_RADIUS_M
+    x *= np.cos(np.radians(lats.mean()))
+
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    # Interior points of the segments that are still being split
+    candidates = np.arange(1, count - 1)
+    while candidates.size:
+        kept = np.flatnonzero(keep)
+        right = np.searchsorted(kept, candidates)
+        start, end = kept[right - 1], kept[right]
+        distances = _segment_distances(
+            x[candidates], y[candidates], x[start], y[start], x[end], y[end],
+        )
+        # Candidates are in order, so each segment's points are a run
+        first = np.flatnonzero(np.concatenate([[True], end[1:] != end[:-1]]))
+        segment = np.repeat(
+            np.arange(len(first)), np.diff(np.append(first, len(end))),
+        )
+        farthest = np.maximum.reduceat(distances, first)
+        split = farthest > tolerance
+        at_max = np.flatnonzero(distances == farthest[segment])
+        _, first_max = np.unique(segment[at_max], return_index=True)
+        keep[candidates[at_max[first_max]][split]] = True
+        candidates = candidates[split[segment] & ~keep[candidates]]
+
+    return np.flatnonzero(keep)
+
+
+def encode_polyline(lats, longs):
+    """Return positions in the Google encoded polyline format."""
+    values = np.column_stack([lats, longs]) * POLYLINE_PRECISION
+    values = np.round(values).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=0).ravel()
+    # Zigzag: the sign moves to the lowest bit
+    deltas = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    # Five bit chunks, lowest first; all but the last have 0x20 set
+    chunks = (deltas[:, np.newaxis] >> (5 * np.arange(7))) & 0x1f
+    lengths = 1 + np.count_nonzero(
+        deltas[:, np.newaxis] >> (5 * np.arange(1, 7)), axis=1,
+    )
+    used = np.arange(7) < lengths[:, np.newaxis]
+    more = np.arange(7) < (lengths - 1)[:, np.newaxis]
+    codes = (chunks | np.where(more, 0x20, 0)) + 63
+
+    return codes[used].astype(np.uint8).tobytes().decode('ascii')
+
+
+def track(queryset, tolerance, polyline=False):
+    """Return the simplified track of the readings of a data point queryset."""
+    epochs, lats, longs = read_fixes(queryset)
+    valid = valid_fixes(epochs, lats, longs)
+    epochs, lats, longs = epochs[valid], lats[valid], longs[valid]
+    index = simplify(lats, longs, tolerance)
+    epochs, lats, longs = epochs[index], lats[index], longs[index]
+
+    result = {
+        'count': len(valid),
+        'valid': int(valid.sum()),
+        'points': len(index),
+        'tolerance': tolerance,
+        'date_created': [
+            datetime.fromtimestamp(epoch, tz=timezone.utc)
+            for epoch in epochs.tolist()
+        ],
+    }
+    if polyline:
+        result['polyline'] = encode_polyline(lats, longs)
+    else:
+        result['path'] = np.column_stack([lats, longs]).tolist()
+
+    return result
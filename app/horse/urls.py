@@ -14,6 +14,10 @@ from horse import views
 router = DefaultRouter()
 router.register('horses', views.HorseViewSet)
 router.register('datapoints', views.DataPointViewSet)
+router.register('geofences', views.GeofenceViewSet)
+router.register('geofence-events', views.GeofenceEventViewSet)
+router.register('alert-rules', views.AlertRuleViewSet)
+router.register('alerts', views.AlertViewSet)
 
 app_name = 'horse'
 
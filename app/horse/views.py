@@ -1,6 +1,15 @@
 """
 Views for the horse APIs.
 """
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import (
     viewsets,
@@ -10,7 +19,14 @@ from rest_framework import (
 )
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import (
+    AuthenticationFailed,
+    NotFound,
+    ValidationError,
+    UnsupportedMediaType,
+)
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.settings import api_settings
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import (
     DjangoFilterBackend,
@@ -19,33 +35,99 @@ from django_filters.rest_framework import (
 from core.models import (
     Horse,
     DataPoint,
+    DataPointTombstone,
+    Geofence,
+    GeofenceEvent,
+    AlertRule,
+    Alert,
+)
+from core.query_budget import QueryBudgetMixin
+
+from horse import (
+    serializers,
+    aggregation,
+    exports,
+    ingest,
+    movement,
+    series,
+    snapshots,
+    spool,
+    sync,
+    telemetry,
+    tracks,
+)
+from horse.conditional import conditional_list
+from horse.custom_authentication import (
+    DeviceAPIKeyAuthentication,
+    device_key_cache,
+)
+from horse.custom_permission import IsDeviceIngestOrAuthenticated
+from horse.filters import DataPointFilter, GeofenceEventFilter, AlertFilter
+from horse.pagination import DataPointCursorPagination
+from horse.parsers import TelemetryParser
+from horse.renderers import (
+    ColumnarJSONRenderer,
+    CSVExportRenderer,
+    NDJSONExportRenderer,
 )
 
-from horse import serializers
-from horse.filters import DataPointFilter
 
-def get_horse_from_api_key(api_key):
-    try:
-        horse = Horse.objects.get(api_key=api_key)
-        return horse
-    except Horse.DoesNotExist:
-        raise serializers.ValidationError('Invalid API key.')
+def get_query_fields(request, choices, default):
+    """Return the data point fields named by the fields query parameter."""
+    fields = request.query_params.get('fields', default).split(',')
+    unknown = [field for field in fields if field not in choices]
+    if unknown:
+        raise ValidationError({
+            'fields': [
+                f'Must be a comma separated list of {", ".join(choices)}.'
+            ],
+        })
+
+    return list(dict.fromkeys(fields))
 
-class HorseViewSet(viewsets.ModelViewSet):
+
+class HorseViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     """View for manage horse APIs."""
     serializer_class = serializers.HorseSerializer
     queryset = Horse.objects.all()
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # Queries per request, including authentication
+    query_budgets = {
+        'list': 3,
+        'retrieve': 2,
+        'create': 3,
+        'update': 4,
+        'partial_update': 4,
+        'destroy': 15,
+        'upload_image': 4,
+        'fleet': 2,
+        # Two per series field
+        'chart_series': 2 + 2 * len(series.SERIES_FIELDS),
+        'track': 3,
+        'movement': 4,
+    }
 
     def get_queryset(self):
         """Retrieve horses for authenticated user."""
         return self.queryset.filter(user=self.request.user).order_by('-id')
+
+    @conditional_list
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_list_version(self, request):
+        """Return the version of the user's horse list."""
+        return get_user_model().objects.filter(pk=request.user.pk).values_list(
+            'horse_version', flat=True,
+        ).get()
     
     def get_serializer_class(self):
         """Return the serializer class for request."""
         if self.action == 'list':
             return serializers.HorseSerializer
+        elif self.action == 'fleet':
+            return serializers.FleetHorseSerializer
         elif self.action == 'upload_image':
             return serializers.HorseImageSerializer
         
@@ -55,6 +137,19 @@ class HorseViewSet(viewsets.ModelViewSet):
         """Create a new horse."""
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        """Delete a horse, its data points with a single statement."""
+        with transaction.atomic(), connection.cursor() as cursor:
+            # The ORM would load each one and refresh what summarizes it.
+            # Locking the horse first keeps ingest from adding more.
+            cursor.execute(
+                f'DELETE FROM {DataPoint._meta.db_table} WHERE horse_id = '
+                f'(SELECT id FROM {Horse._meta.db_table} WHERE id = %s '
+                f'FOR UPDATE)',
+                [instance.id],
+            )
+            instance.delete()
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
         horse = self.get_object()
@@ -66,7 +161,148 @@ class HorseViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class DataPointViewSet(mixins.CreateModelMixin,
+    @action(methods=['GET'], detail=False, url_path='fleet')
+    def fleet(self, request):
+        """List horses with their latest reading and its status."""
+        queryset = snapshots.annotate_status(self.get_queryset())
+        status_filter = request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status__in=status_filter.split(','))
+        serializer = self.get_serializer(queryset, many=True)
+
+        return Response(serializer.data)
+
+    @action(methods=['GET'], detail=True, url_path='series')
+    def chart_series(self, request, pk=None):
+        """Return LTTB downsampled series of the horse's readings."""
+        horse = self.get_object()
+        fields = self.get_series_fields()
+        points = self.get_series_points()
+        filterset = DataPointFilter(
+            request.query_params,
+            queryset=DataPoint.objects.filter(horse=horse),
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        return Response({
+            'points': points,
+            'series': {
+                field: series.downsample(filterset.qs, field, points)
+                for field in fields
+            },
+        })
+
+    def get_series_fields(self):
+        """Return the data point fields named by the fields query parameter."""
+        return get_query_fields(self.request, series.SERIES_FIELDS, 'temp,hr')
+
+    def get_series_points(self):
+        """Return the number of points a series is downsampled to."""
+        try:
+            points = int(self.request.query_params.get(
+                'points', series.DEFAULT_POINTS,
+            ))
+        except ValueError:
+            points = 0
+        if not 3 <= points <= series.MAX_POINTS:
+            raise ValidationError({
+                'points': [
+                    f'Must be an integer from 3 to {series.MAX_POINTS}.'
+                ],
+            })
+
+        return points
+
+    @action(methods=['GET'], detail=True, url_path='track')
+    def track(self, request, pk=None):
+        """Return the horse's GPS track, without jitter and simplified."""
+        horse = self.get_object()
+        tolerance = self.get_track_tolerance()
+        encoding = request.query_params.get('encoding', 'path')
+        if encoding not in ('path', 'polyline'):
+            raise ValidationError({'encoding': ['Must be path or polyline.']})
+        filterset = DataPointFilter(
+            request.query_params,
+            queryset=DataPoint.objects.filter(horse=horse),
+        )
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        track = tracks.track(
+            filterset.qs, tolerance, polyline=encoding == 'polyline',
+        )
+
+        return Response(track)
+
+    def get_track_tolerance(self):
+        """Return the simplification tolerance in meters."""
+        try:
+            tolerance = float(self.request.query_params.get(
+                'tolerance', tracks.DEFAULT_TOLERANCE,
+            ))
+        except ValueError:
+            tolerance = -1
+        if not 0 <= tolerance <= tracks.MAX_TOLERANCE:
+            raise ValidationError({
+                'tolerance': [
+                    'Must be a number of meters from 0 to '
+                    f'{tracks.MAX_TOLERANCE}.'
+                ],
+            })
+
+        return tolerance
+
+    @action(methods=['GET'], detail=True, url_path='movement')
+    def movement(self, request, pk=None):
+        """Return daily distance, movement and rest summaries of the horse."""
+        horse = self.get_object()
+        first_day, last_day = self.get_movement_days()
+        summaries = movement.daily(horse, first_day, last_day)
+        serializer = serializers.DailyMovementSerializer(summaries, many=True)
+
+        return Response({'days': serializer.data})
+
+    def get_movement_days(self):
+        """Return the first and last day of the start and end parameters."""
+        params = self.request.query_params
+        last_day = timezone.localdate()
+        first_day = last_day - timedelta(days=6)
+        days = {}
+        for name, default in (('start', first_day), ('end', last_day)):
+            try:
+                days[name] = (
+                    parse_date(params[name]) if name in params else default
+                )
+            except ValueError:
+                days[name] = None
+            if days[name] is None:
+                raise ValidationError(
+                    {name: ['Must be a date as YYYY-MM-DD.']},
+                )
+        if not 0 <= (days['end'] - days['start']).days < movement.MAX_DAYS:
+            raise ValidationError({
+                'end': [
+                    'Must be on or after start, and within '
+                    f'{movement.MAX_DAYS} days of it.'
+                ],
+            })
+
+        return days['start'], days['end']
+
+
+# Filters rollups can answer; any other filter needs raw rows
+ROLLUP_FILTERS = {
+    'horse__api_key',
+    'date_created__gt',
+    'date_created__gte',
+    'date_created__lt',
+    'date_created__lte',
+}
+
+
+class DataPointViewSet(QueryBudgetMixin,
+                       mixins.CreateModelMixin,
                        mixins.UpdateModelMixin,
                        mixins.ListModelMixin, 
                        mixins.DestroyModelMixin,
@@ -74,19 +310,573 @@ class DataPointViewSet(mixins.CreateModelMixin,
     """Manage data points in the database"""
     serializer_class = serializers.DataPointSerializer
     queryset = DataPoint.objects.all()
-    authentication_classes = [TokenAuthentication]
-    permission_classes = [IsAuthenticated]
+    authentication_classes = [DeviceAPIKeyAuthentication, TokenAuthentication]
+    permission_classes = [IsDeviceIngestOrAuthenticated]
+    device_actions = ['create', 'batch', 'upload']
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [TelemetryParser]
+    renderer_classes = (
+        api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer]
+    )
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     filterset_class = DataPointFilter
+    pagination_class = DataPointCursorPagination
+    # Queries per request, including authentication. Writes include one
+    # reading the state of their horses and one saving every side effect
+    # (see effects), plus one when compiled geofences are loaded. Uploads
+    # are not budgeted: they run a fixed set of statements per
+    # COPY_CHUNK_SIZE rows.
+    query_budgets = {
+        'list': 3,
+        'aggregate': 4,
+        'export': 1,
+        'create': 7,
+        'batch': 7,
+        'update': 5,
+        'partial_update': 5,
+        'destroy': 6,
+        'sync': 5,
+    }
         
     def get_queryset(self):
         """Filter queryset to authenticated user."""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        return self.queryset.filter(
+            user=self.request.user,
+        ).select_related('horse').order_by('-id')
+
+    @conditional_list
+    def list(self, request, *args, **kwargs):
+        """
+        List data points, as one array per field with ?format=columnar.
+
+        Rows are read with values() joined to the horse, so no model
+        instances are built; DataPointValuesSerializer gives them the
+        shape DataPointSerializer would.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        names = [name for name, _ in exports.EXPORT_FIELDS]
+        lookups = [lookup for _, lookup in exports.EXPORT_FIELDS]
+        page = self.paginate_queryset(queryset.values(*lookups))
+
+        if request.accepted_renderer.format != ColumnarJSONRenderer.format:
+            rows = queryset.values(*lookups) if page is None else page
+            data = serializers.DataPointValuesSerializer(rows, many=True).data
+        elif page is not None:
+            columns = ([row[lookup] for row in page] for lookup in lookups)
+            data = dict(zip(names, columns))
+        else:
+            rows = queryset.values_list(*lookups)
+            columns = [list(column) for column in zip(*rows)]
+            columns = columns or [[] for _ in names]
+            data = dict(zip(names, columns))
+
+        if page is not None:
+            return self.get_paginated_response(data)
+
+        return Response(data)
+
+    @action(methods=['GET'], detail=False, url_path='aggregate')
+    def aggregate(self, request):
+        """Summarize filtered data points per horse and time bucket."""
+        width = request.query_params.get('bucket', 'hour')
+        if width not in aggregation.BUCKETS:
+            raise ValidationError({
+                'bucket': [
+                    f'Must be one of {", ".join(aggregation.BUCKETS)}.'
+                ],
+            })
+        fields = get_query_fields(
+            request, aggregation.AGGREGATE_FIELDS, 'temp,hr',
+        )
+        queryset = self.filter_queryset(self.get_queryset())
+        filters = self.get_filter_data()
+        start, end = self.get_filter_bounds(filters)
+        if set(filters) <= ROLLUP_FILTERS:
+            horses = Horse.objects.filter(user=request.user)
+            if 'horse__api_key' in filters:
+                horses = horses.filter(api_key=filters['horse__api_key'])
+            rows = aggregation.aggregate_rollups(
+                queryset, horses, width, fields, start, end,
+            )
+        else:
+            rows = aggregation.aggregate(queryset, width, fields)
+
+        if request.query_params.get('fill') in ('1', 'true'):
+            try:
+                rows = aggregation.fill_gaps(rows, width, fields, start, end)
+            except ValueError as exc:
+                raise ValidationError({'fill': [str(exc)]})
+
+        return Response({'bucket': width, 'results': rows})
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='export',
+        renderer_classes=[CSVExportRenderer, NDJSONExportRenderer],
+    )
+    def export(self, request):
+        """Stream the filtered data points as CSV or NDJSON."""
+        queryset = self.filter_queryset(self.get_queryset()).order_by(
+            'date_created', 'id',
+        )
+        renderer = request.accepted_renderer
+        if renderer.format == NDJSONExportRenderer.format:
+            content = exports.iter_ndjson(queryset)
+        else:
+            content = exports.iter_csv(queryset)
+        response = StreamingHttpResponse(
+            content, content_type=renderer.media_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="datapoints.{renderer.format}"'
+        )
+
+        return response
+
+    @action(methods=['GET'], detail=False, url_path='sync')
+    def sync(self, request):
+        """
+        Return readings inserted and deleted since a sync token.
+
+        Clients start without ?since and pass the returned token on every
+        poll, repeating at once while has_more is set. ?horse__api_key
+        limits the sync to one horse.
+        """
+        try:
+            marks = sync.decode_token(request.query_params.get('since'))
+        except ValueError as exc:
+            raise ValidationError({'since': [str(exc)]})
+        limit = self.get_sync_limit()
+        horses = Horse.objects.filter(user=request.user)
+        api_key = request.query_params.get('horse__api_key')
+        if api_key:
+            horses = horses.filter(api_key=api_key)
+
+        datapoints, deleted, new_marks, has_more = sync.changes(
+            list(horses.values_list('id', flat=True)), marks, limit,
+        )
+        # A single horse sync keeps the marks of the others
+        token_marks = {**marks, **new_marks} if api_key else new_marks
+
+        return Response({
+            'datapoints': datapoints,
+            'deleted': deleted,
+            'has_more': has_more,
+            'since': sync.encode_token(token_marks),
+        })
+
+    def get_sync_limit(self):
+        try:
+            limit = int(
+                self.request.query_params.get('limit', sync.DEFAULT_LIMIT)
+            )
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= sync.MAX_LIMIT:
+            raise ValidationError(
+                {'limit': [f'Must be between 1 and {sync.MAX_LIMIT}.']},
+            )
+
+        return limit
+
+    def get_filter_data(self):
+        """Return the DataPointFilter values given in the query string."""
+        filterset = DataPointFilter(self.request.query_params)
+        filterset.is_valid()
+
+        return {
+            name: value
+            for name, value in filterset.form.cleaned_data.items()
+            if value not in (None, '')
+        }
+
+    def get_filter_bounds(self, filters):
+        """Return the inclusive (start, end) datetimes of date filters."""
+        tick = timedelta(microseconds=1)
+        starts = [filters.get('date_created__gte')]
+        if 'date_created__gt' in filters:
+            starts.append(filters['date_created__gt'] + tick)
+        ends = [filters.get('date_created__lte')]
+        if 'date_created__lt' in filters:
+            ends.append(filters['date_created__lt'] - tick)
+        starts = [start for start in starts if start is not None]
+        ends = [end for end in ends if end is not None]
+
+        return max(starts, default=None), min(ends, default=None)
+
+    def get_list_version(self, request):
+        """Return the version of the user's data points."""
+        # Horse changes count too, as the list includes horse names
+        return get_user_model().objects.filter(pk=request.user.pk).annotate(
+            data_version=Sum('horse__data_version'),
+        ).values_list('horse_version', 'data_version').get()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ingest.UnknownHorses):
+            # A horse deleted after its credentials were cached or resolved
+            for horse_id in exc.horse_ids:
+                device_key_cache.evict_horse(horse_id)
+            if isinstance(self.request.auth, Horse):
+                exc = AuthenticationFailed('Invalid API key.')
+            else:
+                exc = NotFound('Horse not found.')
+
+        return super().handle_exception(exc)
+
+    def get_ingest_horses(self, api_keys):
+        """Return a dict of api_key to horse of keys this request may write."""
+        device = self.request.auth
+        if isinstance(device, Horse):
+            # Devices resolve from their credentials without a query
+            if device.api_key in api_keys:
+                return {device.api_key: device}
+            return {}
+
+        return ingest.resolve_horses(api_keys, self.request.user)
     
+    def get_ingest_horse(self, serializer):
+        """Return the horse named by a validated data point serializer."""
+        api_key = serializer.validated_data['horse']['api_key']
+        horse = self.get_ingest_horses([api_key]).get(api_key)
+        if horse is None:
+            raise ValidationError({'api_key': ['Invalid API key.']})
+
+        return horse
+
+    def get_on_conflict(self):
+        """Return how ingest treats readings stored for a horse and time."""
+        on_conflict = self.request.query_params.get('on_conflict', 'ignore')
+        if on_conflict not in ingest.ON_CONFLICT_CHOICES:
+            raise ValidationError({
+                'on_conflict': [
+                    f'Must be one of {", ".join(ingest.ON_CONFLICT_CHOICES)}.'
+                ],
+            })
+
+        return on_conflict
+
     @csrf_exempt
     def perform_create(self, serializer):
         # Get the horse associated with the API key
-        horse = get_horse_from_api_key(self.request.data['api_key'])
+        horse = self.get_ingest_horse(serializer)
+        data = dict(serializer.validated_data)
+        data.pop('horse')
 
         # Populate the user field with the user of the horse
-        serializer.save(user=self.request.user, horse=horse)
+        dp = DataPoint(user_id=horse.user_id, horse=horse, **data)
+        outcome = ingest.save_datapoints([dp], self.get_on_conflict())[0]
+        if outcome == ingest.DUPLICATE:
+            # A retried reading: answer with the one already stored
+            dp = DataPoint.objects.select_related('horse').get(
+                horse=horse,
+                date_created=dp.date_created,
+            )
+        serializer.instance = dp
+
+        return outcome
+
+    def create(self, request, *args, **kwargs):
+        """Create a data point, or queue it on the spool in spool mode."""
+        if isinstance(request.data, telemetry.TelemetryBatch):
+            return self.ingest_telemetry(request.data)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if settings.DATAPOINT_INGEST_MODE == 'spool':
+            horse = self.get_ingest_horse(serializer)
+            data = dict(serializer.validated_data)
+            data.pop('horse')
+            spool.append([spool.make_record(horse, data)])
+            return Response(
+                {'detail': 'Queued.'}, status=status.HTTP_202_ACCEPTED,
+            )
+
+        outcome = self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+
+        if outcome == ingest.CREATED:
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_200_OK
+
+        return Response(
+            serializer.data, status=response_status, headers=headers,
+        )
+
+    def perform_update(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError({
+                'date_created': [
+                    'This horse already has a data point at this time.'
+                ],
+            })
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), connection.cursor() as cursor:
+            ingest.lock_horses(cursor, [instance.horse_id])
+            DataPointTombstone.objects.create(
+                horse_id=instance.horse_id, datapoint_id=instance.id,
+            )
+            instance.delete()
+
+    @action(methods=['POST'], detail=False, url_path='batch')
+    def batch(self, request):
+        """Validate and insert a list of data points in one transaction."""
+        items = request.data
+        if isinstance(items, telemetry.TelemetryBatch):
+            return self.ingest_telemetry(items)
+        if not isinstance(items, list):
+            return Response(
+                {'detail': 'Expected a list of data points.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > ingest.BATCH_MAX_SIZE:
+            return self.batch_too_large()
+
+        child = self.get_serializer()
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                data = child.run_validation(item)
+            except ValidationError as exc:
+                results[index] = {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': exc.detail,
+                }
+                continue
+            valid.append((index, data.pop('horse')['api_key'], data))
+
+        return self.ingest_batch(valid, results)
+
+    def ingest_telemetry(self, batch):
+        """Ingest a decoded binary telemetry payload."""
+        if len(batch) > ingest.BATCH_MAX_SIZE:
+            return self.batch_too_large()
+
+        results = [None] * len(batch)
+        valid = []
+        for index, (data, errors) in enumerate(telemetry.validate(batch)):
+            if errors:
+                results[index] = {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': errors,
+                }
+                continue
+            valid.append((index, batch.api_key, data))
+
+        return self.ingest_batch(valid, results)
+
+    def batch_too_large(self):
+        return Response(
+            {
+                'detail': f'A batch may hold at most '
+                f'{ingest.BATCH_MAX_SIZE} data points.',
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def ingest_batch(self, valid, results):
+        """
+        Write validated (index, api_key, data) items and report per item.
+
+        results holds one entry per submitted item, already filled in for
+        items that failed validation.
+        """
+        # Resolve every api_key in the batch with a single query
+        horses = self.get_ingest_horses({api_key for _, api_key, _ in valid})
+        pending = []
+        for index, api_key, data in valid:
+            horse = horses.get(api_key)
+            if horse is None:
+                results[index] = {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': {'api_key': ['Invalid API key.']},
+                }
+                continue
+            pending.append((index, horse, data))
+
+        created = 0
+        if pending and settings.DATAPOINT_INGEST_MODE == 'spool':
+            spool.append([
+                spool.make_record(horse, data) for _, horse, data in pending
+            ])
+            for index, _, _ in pending:
+                results[index] = {'status': status.HTTP_202_ACCEPTED}
+            created = len(pending)
+        elif pending:
+            datapoints = [
+                DataPoint(user_id=horse.user_id, horse=horse, **data)
+                for _, horse, data in pending
+            ]
+            outcomes = ingest.save_datapoints(
+                datapoints, self.get_on_conflict(),
+            )
+            created = outcomes.count(ingest.CREATED)
+            written = zip(pending, datapoints, outcomes)
+            for (index, _, _), dp, outcome in written:
+                if outcome == ingest.CREATED:
+                    results[index] = {
+                        'status': status.HTTP_201_CREATED, 'id': dp.id,
+                    }
+                elif outcome == ingest.UPDATED:
+                    results[index] = {
+                        'status': status.HTTP_200_OK, 'id': dp.id,
+                    }
+                else:
+                    results[index] = {
+                        'status': status.HTTP_200_OK, 'duplicate': True,
+                    }
+
+        if len(pending) < len(results):
+            response_status = (
+                status.HTTP_207_MULTI_STATUS if pending
+                else status.HTTP_400_BAD_REQUEST
+            )
+        elif settings.DATAPOINT_INGEST_MODE == 'spool':
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            response_status = status.HTTP_201_CREATED
+
+        return Response(
+            {'created': created, 'results': results},
+            status=response_status,
+        )
+
+    @action(methods=['POST'], detail=False, url_path='upload')
+    def upload(self, request):
+        """Stream a CSV or NDJSON body into the data point table with COPY."""
+        content_type = request.content_type.split(';')[0].strip().lower()
+        lines = request.stream or []
+        if content_type == 'text/csv':
+            records = ingest.iter_csv_records(lines)
+        elif content_type in ('application/x-ndjson', 'application/ndjson'):
+            records = ingest.iter_ndjson_records(lines)
+        else:
+            raise UnsupportedMediaType(content_type)
+
+        outcome = ingest.copy_datapoints(
+            records,
+            self.get_ingest_horses,
+            self.get_on_conflict(),
+        )
+        created, updated, duplicates, rejected, errors = outcome
+
+        if not rejected:
+            response_status = status.HTTP_201_CREATED
+        elif created or updated:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response(
+            {
+                'created': created,
+                'updated': updated,
+                'duplicates': duplicates,
+                'rejected': rejected,
+                'errors': errors,
+            },
+            status=response_status,
+        )
+
+
+class GeofenceViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+    """Manage the geofences of the user's horses."""
+    serializer_class = serializers.GeofenceSerializer
+    queryset = Geofence.objects.all()
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Queries per request, including authentication
+    query_budgets = {
+        'list': 2,
+        'retrieve': 2,
+        'create': 3,
+        'update': 4,
+        'partial_update': 4,
+        'destroy': 4,
+    }
+
+    def get_queryset(self):
+        """Filter queryset to fences of the authenticated user's horses."""
+        queryset = self.queryset.filter(
+            horse__user=self.request.user,
+        ).select_related('horse')
+        api_key = self.request.query_params.get('horse__api_key')
+        if api_key:
+            queryset = queryset.filter(horse__api_key=api_key)
+
+        return queryset.order_by('id')
+
+
+class GeofenceEventViewSet(QueryBudgetMixin,
+                           mixins.ListModelMixin,
+                           viewsets.GenericViewSet):
+    """List recorded geofence enter and exit events of the user's horses."""
+    serializer_class = serializers.GeofenceEventSerializer
+    queryset = GeofenceEvent.objects.all()
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = GeofenceEventFilter
+    pagination_class = DataPointCursorPagination
+    query_budgets = {
+        'list': 2,
+    }
+
+    def get_queryset(self):
+        """Filter queryset to events of the authenticated user's horses."""
+        return self.queryset.filter(
+            horse__user=self.request.user,
+        ).select_related('horse', 'fence').order_by('-date_created', '-id')
+
+
+class AlertRuleViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+    """Manage the user's alert rules."""
+    serializer_class = serializers.AlertRuleSerializer
+    queryset = AlertRule.objects.all()
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Queries per request, including authentication
+    query_budgets = {
+        'list': 2,
+        'retrieve': 2,
+        'create': 3,
+        'update': 6,
+        'partial_update': 6,
+        'destroy': 6,
+    }
+
+    def get_queryset(self):
+        """Filter queryset to the authenticated user's rules."""
+        return self.queryset.filter(
+            user=self.request.user,
+        ).select_related('horse').order_by('id')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class AlertViewSet(QueryBudgetMixin,
+                   mixins.ListModelMixin,
+                   viewsets.GenericViewSet):
+    """List the threshold alerts of the user's horses."""
+    serializer_class = serializers.AlertSerializer
+    queryset = Alert.objects.all()
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = AlertFilter
+    pagination_class = DataPointCursorPagination
+    query_budgets = {
+        'list': 2,
+    }
+
+    def get_queryset(self):
+        """Filter queryset to alerts of the authenticated user's horses."""
+        return self.queryset.filter(
+            horse__user=self.request.user,
+        ).select_related('horse', 'rule').order_by('-date_created', '-id')
@@ -5,28 +5,34 @@ from rest_framework import generics, authentication, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.query_budget import QueryBudgetMixin
+
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
 )
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(QueryBudgetMixin, generics.CreateAPIView):
     """Create a new user in the system."""
     serializer_class = UserSerializer
+    # Includes one for the default alert rules
+    query_budgets = {'post': 4}
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(QueryBudgetMixin, ObtainAuthToken):
     """Create a new auth token for user."""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    query_budgets = {'post': 3}
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(QueryBudgetMixin, generics.RetrieveUpdateAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    query_budgets = {'get': 1, 'put': 3, 'patch': 3}
 
     def get_object(self):
         """Retrieve and return the authenticated user."""
@@ -5,6 +5,13 @@ server {
         alias /vol/static;
     }
 
+    location /api/horse/stream/ {
+        proxy_pass              http://${STREAM_HOST}:${STREAM_PORT};
+        proxy_http_version      1.1;
+        proxy_buffering         off;
+        proxy_read_timeout      1h;
+    }
+
     location / {
         uwsgi_pass              ${APP_HOST}:${APP_PORT};
         include                 /etc/nginx/uwsgi_params;
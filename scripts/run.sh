@@ -5,6 +5,7 @@ set -e
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
+python manage.py rebuild_rollups --once
 
 uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi
 
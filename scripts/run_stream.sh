@@ -0,0 +1,7 @@
+#!/bin/sh
+
+set -e
+
+python manage.py wait_for_db
+
+uvicorn app.asgi:application --host 0.0.0.0 --port 9001